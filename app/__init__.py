@@ -1,7 +1,8 @@
 import os
 from flask import Flask
 from flask_login import LoginManager
-from app.models import db
+from app.models import db, ensure_columns, ensure_indexes, ensure_delete_triggers
+from app import cache, sqlite, jobs, snapshots, archive
 
 login_manager = LoginManager()
 
@@ -15,10 +16,42 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(basedir, "data", "keyboards.db")}')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'uploads')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 16)) * 1024 * 1024
+    
+    # SQLite-Profil: Pragmas je Verbindung, einzeln per Umgebungsvariable überschreibbar (z.B. SQLITE_BUSY_TIMEOUT)
+    app.config['SQLITE_PRAGMAS'] = {
+        name: os.environ.get(f'SQLITE_{name.upper()}', default)
+        for name, default in sqlite.DEFAULT_PRAGMAS.items()
+    }
+    app.config['SQLITE_RETRY_ATTEMPTS'] = int(os.environ.get('SQLITE_RETRY_ATTEMPTS', 5))
+    app.config['SQLITE_RETRY_DELAY'] = 0.05
+    
+    app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 100))
+    app.config['MAX_PAGE_SIZE'] = 1000
+    app.config['STREAM_LISTS'] = os.environ.get('STREAM_LISTS', '').lower() in ('1', 'true', 'yes')
+    app.config['CACHE_FOLDER'] = os.environ.get('CACHE_FOLDER', os.path.join(basedir, 'data', 'cache'))
+    
+    # Exporte im Hintergrund: Threads pro Worker, fertige Dateien werden nach EXPORT_JOB_TTL Sekunden gelöscht
+    app.config['EXPORT_FOLDER'] = os.environ.get('EXPORT_FOLDER', os.path.join(basedir, 'data', 'exports'))
+    app.config['EXPORT_WORKERS'] = int(os.environ.get('EXPORT_WORKERS', 2))
+    app.config['EXPORT_QUEUE_SIZE'] = int(os.environ.get('EXPORT_QUEUE_SIZE', 8))
+    app.config['EXPORT_JOB_TTL'] = int(os.environ.get('EXPORT_JOB_TTL', 3600))
+    
+    # Datenbank-Snapshots (flask snapshot-create, z.B. per Cron); die neuesten SNAPSHOT_KEEP bleiben erhalten
+    app.config['SNAPSHOT_FOLDER'] = os.environ.get('SNAPSHOT_FOLDER', os.path.join(basedir, 'data', 'snapshots'))
+    app.config['SNAPSHOT_KEEP'] = int(os.environ.get('SNAPSHOT_KEEP', 14))
+    app.config['SNAPSHOT_COMPRESS'] = os.environ.get('SNAPSHOT_COMPRESS', 'true').lower() in ('1', 'true', 'yes')
+    
+    # Archiv-Datei für abgeschlossene Schuljahre (wird nur bei Bedarf angehängt)
+    app.config['ARCHIVE_DATABASE'] = os.environ.get('ARCHIVE_DATABASE', os.path.join(basedir, 'data', 'archive.sqlite3'))
     
     # Extensions initialisieren
     db.init_app(app)
+    sqlite.init_app(app, db)
+    cache.init_app(app)
+    jobs.init_app(app)
+    snapshots.init_app(app)
+    archive.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Bitte melden Sie sich an.'
@@ -51,11 +84,18 @@ def create_app():
     app.register_blueprint(export_bp)
     app.register_blueprint(import_bp)
     
+    # CLI-Befehle
+    from app.cli import register_commands
+    register_commands(app)
+    
     # Datenbank erstellen
     with app.app_context():
         os.makedirs(os.path.join(basedir, 'data'), exist_ok=True)
         os.makedirs(os.path.join(basedir, 'uploads'), exist_ok=True)
         db.create_all()
+        ensure_columns()
+        ensure_indexes()
+        ensure_delete_triggers()
         
         # Default Admin erstellen
         if not User.query.filter_by(username='admin').first():
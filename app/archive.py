@@ -0,0 +1,161 @@
+"""Archiv für abgeschlossene Schuljahre
+
+Klassen, Schüler und Ausleihen eines abgeschlossenen Schuljahres wandern in eine
+eigene SQLite-Datei (ARCHIVE_DATABASE). Die laufende Datenbank bleibt klein,
+Abfragen auf zurückgegebene Ausleihen lesen nicht jedes Jahr mehr Zeilen. Das
+Schuljahr selbst bleibt mit archived_at in der laufenden Datenbank stehen.
+
+Die Archiv-Datei wird nur bei Bedarf per ATTACH an eine Verbindung gehängt:
+archive_school_year kopiert mit INSERT ... SELECT hinein und löscht danach aus
+der laufenden Datenbank. reading() lässt db.session innerhalb eines Blocks
+schreibgeschützt aus dem Archiv lesen (schema_translate_map), so laufen die
+vorhandenen Abfragen (Klassenliste, Statistik, Excel-Backup) unverändert.
+"""
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import text, update
+from sqlalchemy.orm import Session
+from app import cache
+from app.models import db, SchoolYear, SchoolClass, Student, Keyboard, Loan
+
+ARCHIVE_SCHEMA = 'archive'
+
+# Tabellen, deren Inhalt beim Archivieren die laufende Datenbank verlässt
+ARCHIVED_TABLES = ('school_years', 'school_classes', 'students', 'loans')
+
+
+class ArchiveError(Exception):
+    """Archivieren bzw. Lesen nicht möglich (Meldung ist für die Oberfläche gedacht)"""
+
+
+def init_app(app):
+    path = app.config.setdefault('ARCHIVE_DATABASE', os.path.join(app.instance_path, 'archive.sqlite3'))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+
+def archive_path():
+    return current_app.config['ARCHIVE_DATABASE']
+
+
+def _attach(conn):
+    conn.exec_driver_sql(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path(),))
+
+
+def _ensure_schema(conn):
+    """Tabellen im Archiv anlegen bzw. um neue Spalten ergänzen (wie models.ensure_columns)"""
+    # execution_options ändert die Verbindung selbst: Umleitung danach wieder aufheben
+    conn.execution_options(schema_translate_map={None: ARCHIVE_SCHEMA})
+    try:
+        db.metadata.create_all(conn)
+    finally:
+        conn.execution_options(schema_translate_map=None)
+    for table in db.metadata.sorted_tables:
+        existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA {ARCHIVE_SCHEMA}.table_info({table.name})")}
+        for column in table.columns:
+            if column.name not in existing:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {ARCHIVE_SCHEMA}.{table.name} "
+                    f"ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+                )
+
+
+def _year_rows():
+    """(Tabelle, Bedingung auf main) für alle Zeilen eines Schuljahres, Eltern vor Kindern
+    
+    Keyboards bleiben in Betrieb; ins Archiv kommt nur eine Kopie der ausgeliehenen.
+    """
+    classes = "SELECT id FROM main.school_classes WHERE school_year_id = :year_id"
+    students = f"SELECT id FROM main.students WHERE class_id IN ({classes})"
+    return [
+        (SchoolYear.__table__, "id = :year_id"),
+        (SchoolClass.__table__, "school_year_id = :year_id"),
+        (Student.__table__, f"class_id IN ({classes})"),
+        (Keyboard.__table__, f"id IN (SELECT keyboard_id FROM main.loans WHERE student_id IN ({students}))"),
+        (Loan.__table__, f"student_id IN ({students})"),
+    ]
+
+
+def archive_school_year(year_id):
+    """Schuljahr ins Archiv verschieben; liefert {Tabelle: Anzahl gelöschter Zeilen}
+    
+    Erst wird kopiert und festgeschrieben, dann gelöscht: bricht es dazwischen ab,
+    liegen die Zeilen doppelt vor und ein neuer Versuch überschreibt die Kopie
+    (INSERT OR REPLACE). Schreibt über eine eigene Verbindung und committet selbst.
+    """
+    year = SchoolYear.query.get(year_id)
+    if not year:
+        raise ArchiveError('Schuljahr nicht gefunden.')
+    if year.is_active:
+        raise ArchiveError('Das aktive Schuljahr kann nicht archiviert werden.')
+    if year.archived_at:
+        raise ArchiveError(f'Schuljahr {year.name} ist bereits archiviert.')
+    
+    open_loans = Loan.query.join(Student).join(SchoolClass).filter(
+        SchoolClass.school_year_id == year_id,
+        Loan.returned_at == None
+    ).count()
+    if open_loans:
+        raise ArchiveError(f'Schuljahr {year.name} hat noch {open_loans} nicht zurückgegebene Keyboards.')
+    
+    params = {'year_id': year_id}
+    counts = {}
+    with db.engine.connect() as conn:
+        try:
+            _attach(conn)
+            _ensure_schema(conn)
+            conn.commit()
+            
+            for table, where in _year_rows():
+                columns = ', '.join(table.columns.keys())
+                conn.execute(text(
+                    f"INSERT OR REPLACE INTO {ARCHIVE_SCHEMA}.{table.name} ({columns}) "
+                    f"SELECT {columns} FROM main.{table.name} WHERE {where}"
+                ), params)
+            conn.commit()
+            
+            # Kinder vor Eltern löschen; Keyboards und das Schuljahr selbst bleiben
+            for table, where in reversed(_year_rows()):
+                if table.name in ('keyboards', 'school_years'):
+                    continue
+                counts[table.name] = conn.execute(text(f"DELETE FROM main.{table.name} WHERE {where}"), params).rowcount
+            conn.execute(update(SchoolYear).where(SchoolYear.id == year_id).values(archived_at=datetime.utcnow()))
+            conn.commit()
+        finally:
+            # Verbindung mit angehängtem Archiv nicht in den Pool zurückgeben
+            conn.invalidate()
+    
+    # Geschrieben wurde an der Session vorbei: abhängige Caches selbst verwerfen
+    cache.bump_version(*ARCHIVED_TABLES)
+    return counts
+
+
+@contextmanager
+def reading():
+    """Innerhalb des Blocks liest db.session (und damit Model.query) nur aus dem Archiv
+    
+    Die laufende Session (z.B. mit current_user) bleibt unberührt und gilt nach dem
+    Block wieder. Ergebnisse im Block fertigstellen (Template rendern, Datei erzeugen):
+    die geladenen Objekte gehören zur Archiv-Session und sind danach getrennt.
+    """
+    if not os.path.exists(archive_path()):
+        raise ArchiveError('Es gibt noch kein Archiv.')
+    
+    conn = db.engine.connect()
+    conn.execution_options(schema_translate_map={None: ARCHIVE_SCHEMA})
+    live = db.session()
+    try:
+        _attach(conn)
+        conn.exec_driver_sql('PRAGMA query_only = 1')
+        archive_session = Session(bind=conn)
+        db.session.registry.set(archive_session)
+        try:
+            yield archive_session
+        finally:
+            db.session.registry.set(live)
+            archive_session.close()
+    finally:
+        # ATTACH und query_only nicht an die nächste Verwendung der Verbindung weitergeben
+        conn.invalidate()
+        conn.close()
@@ -0,0 +1,188 @@
+"""Dateibasierter Cache, den sich alle gunicorn-Worker teilen
+
+Jede Tabelle hat einen Versions-Stempel im Cache-Verzeichnis. Nach jedem
+Commit, der eine Tabelle verändert hat, wird deren Stempel erneuert. Ein
+Snapshot ist nur gültig, solange die Stempel seiner Tabellen unverändert sind.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+def init_app(app):
+    """Cache-Verzeichnis anlegen und Schreibzugriffe überwachen"""
+    folder = app.config.setdefault('CACHE_FOLDER', os.path.join(app.instance_path, 'cache'))
+    os.makedirs(os.path.join(folder, 'versions'), exist_ok=True)
+    os.makedirs(os.path.join(folder, 'files'), exist_ok=True)
+    
+    if not event.contains(Session, 'after_flush', _track_flush):
+        event.listen(Session, 'after_flush', _track_flush)
+        event.listen(Session, 'do_orm_execute', _track_execute)
+        event.listen(Session, 'after_commit', _bump_touched)
+        event.listen(Session, 'after_rollback', _clear_touched)
+
+
+def _cache_folder():
+    return current_app.config['CACHE_FOLDER']
+
+
+def write_atomic(path, content):
+    """Datei über eine temporäre Datei ersetzen (kein halber Inhalt für andere Worker)"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# --- Versions-Stempel ---
+
+def _version_path(table):
+    return os.path.join(_cache_folder(), 'versions', table)
+
+
+def table_version(table):
+    """Aktueller Stempel einer Tabelle ('0' wenn noch nie geschrieben)"""
+    try:
+        with open(_version_path(table), encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return '0'
+
+
+def data_version(tables):
+    """Stempel mehrerer Tabellen als Dict"""
+    return {table: table_version(table) for table in sorted(tables)}
+
+
+def bump_version(*tables):
+    """Stempel erneuern, damit abhängige Snapshots verworfen werden"""
+    stamp = f"{time.time_ns()}-{os.getpid()}"
+    for table in tables:
+        try:
+            write_atomic(_version_path(table), stamp)
+        except OSError:
+            current_app.logger.warning('Cache-Version für %s konnte nicht geschrieben werden', table)
+
+
+def _touched(session):
+    return session.info.setdefault('touched_tables', set())
+
+
+def _track_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            _touched(session).add(table)
+
+
+def _track_execute(orm_execute_state):
+    """Massen-UPDATE/DELETE/INSERT (query.update, session.execute(insert(...)))"""
+    if orm_execute_state.is_select:
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is not None:
+        _touched(orm_execute_state.session).add(table.name)
+
+
+def _bump_touched(session):
+    tables = session.info.pop('touched_tables', None)
+    if tables and has_app_context():
+        bump_version(*tables)
+
+
+def _clear_touched(session):
+    session.info.pop('touched_tables', None)
+
+
+# --- Snapshots ---
+
+def get_snapshot(name, tables, builder):
+    """Snapshot aus dem Cache lesen oder über builder() neu erzeugen
+    
+    Der Stempel wird vor dem Erzeugen gelesen: ändert ein anderer Worker
+    währenddessen die Daten, ist der gespeicherte Snapshot sofort veraltet.
+    """
+    path = os.path.join(_cache_folder(), f"{name}.json")
+    versions = data_version(tables)
+    
+    try:
+        with open(path, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('versions') == versions:
+            return cached['data']
+    except (OSError, ValueError):
+        pass
+    
+    data = builder()
+    try:
+        write_atomic(path, json.dumps({'versions': versions, 'data': data}))
+    except OSError:
+        current_app.logger.warning('Snapshot %s konnte nicht gespeichert werden', name)
+    return data
+
+
+def invalidate_snapshot(name):
+    """Snapshot explizit verwerfen"""
+    try:
+        os.remove(os.path.join(_cache_folder(), f"{name}.json"))
+    except OSError:
+        pass
+
+
+# --- Erzeugte Dateien (Exporte) ---
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def get_file(key, tables, builder, version=None):
+    """Datei zu key aus dem Cache oder über builder() (liefert Datei-Objekt) neu erzeugen
+    
+    key: JSON-fähige Beschreibung (Export-Typ und Parameter); version: weiterer Teil
+    des Stands, der nicht aus den Tabellen folgt (z.B. das Tagesdatum in der Datei).
+    Liefert (geöffnete Datei, ETag); der ETag ändert sich, sobald eine der Tabellen
+    geschrieben wurde. Die Datei ist schon offen, damit ein anderer Worker sie beim
+    Aufräumen nicht zwischen Cache-Treffer und Auslieferung löschen kann.
+    """
+    folder = os.path.join(_cache_folder(), 'files')
+    prefix = _digest(key)
+    etag = _digest([key, version, data_version(tables)])
+    path = os.path.join(folder, f"{prefix}-{etag}")
+    try:
+        return open(path, 'rb'), etag
+    except FileNotFoundError:
+        pass
+    
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+    result = os.fdopen(fd, 'w+b')
+    try:
+        with builder() as output:
+            shutil.copyfileobj(output, result)
+        result.flush()
+        result.seek(0)
+        os.replace(tmp_path, path)
+    except BaseException:
+        result.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    # Ältere Stände derselben Datei entfernen
+    for name in os.listdir(folder):
+        if name.startswith(f"{prefix}-") and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
+    return result, etag
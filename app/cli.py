@@ -0,0 +1,329 @@
+"""Flask-CLI-Befehle (flask --app app <befehl>)"""
+import click
+from flask import current_app
+from sqlalchemy import event
+from app.models import db
+
+
+def register_commands(app):
+    app.cli.add_command(benchmark_writes)
+    app.cli.add_command(snapshot_create)
+    app.cli.add_command(snapshot_delta)
+    app.cli.add_command(snapshot_list)
+    app.cli.add_command(snapshot_restore)
+    app.cli.add_command(benchmark_backup)
+    app.cli.add_command(benchmark_import)
+    app.cli.add_command(import_backup_file)
+    app.cli.add_command(archive_year)
+
+
+def _benchmark_profile(path, pragmas, clients, seconds, rows=200):
+    """Schreibdurchsatz mit mehreren gleichzeitigen Clients auf einer Wegwerf-Datenbank messen"""
+    import random
+    import threading
+    import time
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.pool import NullPool
+    from app.sqlite import apply_pragmas, run_with_retry
+    
+    engine = create_engine(f"sqlite:///{path}", poolclass=NullPool)
+    if pragmas:
+        event.listen(engine, 'connect', lambda conn, record: apply_pragmas(conn, pragmas))
+    
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO school_years (name, start_date, end_date, is_active) "
+                          "VALUES ('Bench', '2024-08-01', '2025-07-31', 1)"))
+        conn.execute(text("INSERT INTO school_classes (name, grade, school_year_id) VALUES ('5A', 5, 1)"))
+        for i in range(1, rows + 1):
+            conn.execute(text("INSERT INTO keyboards (inventory_number, status, condition) "
+                              "VALUES (:inv, 'ausgeliehen', 'in_ordnung')"), {'inv': f"B{i:04d}"})
+            conn.execute(text("INSERT INTO students (last_name, first_name, class_id) VALUES (:n, 'B', 1)"),
+                         {'n': f"S{i:04d}"})
+            conn.execute(text("INSERT INTO loans (keyboard_id, student_id, fee_paid, fee_amount) "
+                              "VALUES (:i, :i, 0, 10.0)"), {'i': i})
+    
+    counters = {'commits': 0, 'retries': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    
+    def count(key):
+        with lock:
+            counters[key] += 1
+    
+    def transaction():
+        # Wie toggle_paid: lesen, umschalten, Audit-Eintrag schreiben
+        loan_id = random.randint(1, rows)
+        with engine.begin() as conn:
+            paid = conn.execute(text("SELECT fee_paid FROM loans WHERE id = :id"), {'id': loan_id}).scalar()
+            conn.execute(text("UPDATE loans SET fee_paid = :p WHERE id = :id"), {'p': not paid, 'id': loan_id})
+            conn.execute(text("INSERT INTO audit_logs (action, entity_type, entity_id) "
+                              "VALUES ('bench', 'loan', :id)"), {'id': loan_id})
+    
+    def client():
+        while time.perf_counter() < deadline:
+            try:
+                run_with_retry(transaction, on_retry=lambda e: count('retries'))
+                count('commits')
+            except Exception:
+                count('errors')
+    
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    counters['per_second'] = counters['commits'] / elapsed
+    return counters
+
+
+@click.command('benchmark-writes')
+@click.option('--clients', default=4, show_default=True, help='Gleichzeitige Clients (Threads).')
+@click.option('--seconds', default=5.0, show_default=True, help='Laufzeit pro Messung.')
+def benchmark_writes(clients, seconds):
+    """Schreibdurchsatz: SQLite-Standard gegen konfiguriertes Profil (Wegwerf-Datenbank)"""
+    import os
+    import tempfile
+    
+    profiles = [('Standard', None), ('Profil', current_app.config['SQLITE_PRAGMAS'])]
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, pragmas in profiles:
+            result = _benchmark_profile(os.path.join(tmp, f"{label}.db"), pragmas, clients, seconds)
+            click.echo(f"{label:10} {result['per_second']:8.1f} Transaktionen/s  "
+                       f"({result['commits']} Commits, {result['retries']} Wiederholungen, "
+                       f"{result['errors']} Fehler)")
+
+
+@click.command('snapshot-create')
+@click.option('--compress/--no-compress', default=None, help='Mit gzip komprimieren (Standard: SNAPSHOT_COMPRESS).')
+def snapshot_create(compress):
+    """Snapshot der Datenbank anlegen (z.B. per Cron), ältere werden rotiert"""
+    from app.snapshots import create_snapshot, SnapshotError
+    
+    try:
+        name = create_snapshot(compress)
+    except SnapshotError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Snapshot erstellt: {name}")
+
+
+@click.command('snapshot-delta')
+def snapshot_delta():
+    """Nur die Änderungen seit dem letzten Backup sichern (z.B. stündlich per Cron)"""
+    import time
+    from app.snapshots import create_delta, SnapshotError
+    
+    started = time.perf_counter()
+    try:
+        name, count = create_delta()
+    except SnapshotError as e:
+        raise click.ClickException(str(e))
+    elapsed = (time.perf_counter() - started) * 1000
+    
+    if count is None:
+        click.echo(f"Keine Delta-Kette vorhanden, Snapshot erstellt: {name} ({elapsed:.1f} ms)")
+    elif not name:
+        click.echo(f"Keine Änderungen seit dem letzten Backup ({elapsed:.1f} ms)")
+    else:
+        click.echo(f"Delta erstellt: {name} ({count} Zeilen, {elapsed:.1f} ms)")
+
+
+@click.command('snapshot-list')
+def snapshot_list():
+    """Vorhandene Snapshots mit ihren Deltas auflisten (neueste zuerst)"""
+    from app.snapshots import list_snapshots
+    
+    for snapshot in list_snapshots():
+        click.echo(f"{snapshot['name']:45} {snapshot['size'] / 1024:10.1f} KiB  "
+                   f"{snapshot['created_at'].strftime('%d.%m.%Y %H:%M')}  "
+                   f"{len(snapshot['deltas'])} Deltas")
+
+
+@click.command('snapshot-restore')
+@click.argument('name', required=False)
+@click.option('--latest', is_flag=True, help='Neuesten Snapshot wiederherstellen.')
+@click.option('--with-deltas', is_flag=True, help='Auch alle Deltas des Snapshots anwenden.')
+@click.confirmation_option(prompt='Aktuelle Daten werden überschrieben. Fortfahren?')
+def snapshot_restore(name, latest, with_deltas):
+    """Datenbank aus einem Snapshot wiederherstellen (vorher wird der aktuelle Stand gesichert)"""
+    from app.snapshots import list_snapshots, restore_snapshot, SnapshotError
+    
+    if latest:
+        snapshots = list_snapshots()
+        if not snapshots:
+            raise click.ClickException('Kein Snapshot vorhanden.')
+        name = snapshots[0]['name']
+    if not name:
+        raise click.ClickException('Snapshot-Name oder --latest angeben.')
+    
+    try:
+        safety = restore_snapshot(name, with_deltas=with_deltas)
+    except SnapshotError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{name} wiederhergestellt (vorheriger Stand gesichert als {safety}).")
+
+
+@click.command('benchmark-backup')
+def benchmark_backup():
+    """Dauer und Größe: Snapshot (mit/ohne gzip) gegen Excel/JSON-ZIP-Backup"""
+    import os
+    import time
+    from app.export import export_full_backup_zip
+    from app.models import SchoolYear
+    from app.snapshots import create_snapshot, snapshot_path
+    
+    school_year = SchoolYear.query.filter_by(is_active=True).first()
+    results = []
+    
+    for label, compress in [('Snapshot', False), ('Snapshot gzip', True)]:
+        started = time.perf_counter()
+        name = create_snapshot(compress, record=False)
+        elapsed = time.perf_counter() - started
+        path = snapshot_path(name)
+        results.append((label, elapsed, os.path.getsize(path)))
+        os.remove(path)
+    
+    if school_year:
+        started = time.perf_counter()
+        size = sum(len(chunk) for chunk in export_full_backup_zip(school_year))
+        results.append(('ZIP (Excel+JSON)', time.perf_counter() - started, size))
+    
+    for label, elapsed, size in results:
+        click.echo(f"{label:18} {elapsed * 1000:10.1f} ms {size / 1024:10.1f} KiB")
+
+
+def _scratch_app(folder):
+    """Eigene App-Instanz auf einer Wegwerf-Datenbank (auch Cache und Ablagen in folder)"""
+    import os
+    from app import create_app
+    
+    overrides = {
+        'DATABASE_URL': f"sqlite:///{os.path.join(folder, 'scratch.db')}",
+        'CACHE_FOLDER': os.path.join(folder, 'cache'),
+        'EXPORT_FOLDER': os.path.join(folder, 'exports'),
+        'SNAPSHOT_FOLDER': os.path.join(folder, 'snapshots'),
+    }
+    saved = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        return create_app()
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def _sample_backup(students, class_size=25):
+    """JSON-Backup (Format 2.0) mit students Schülern, je einem Keyboard und einer Ausleihe"""
+    classes = []
+    for start in range(0, students, class_size):
+        classes.append({
+            'name': f"5-{start // class_size + 1:03d}",
+            'grade': 5,
+            'students': [{
+                'last_name': f"Schüler{i:05d}",
+                'first_name': 'Bench',
+                'participates_in_loan': True,
+                'fee_prepaid': i % 2 == 0
+            } for i in range(start, min(start + class_size, students))]
+        })
+    return {
+        'export_version': '2.0',
+        'school_year': {'name': 'Bench', 'start_date': '2024-08-01', 'end_date': '2025-07-31'},
+        'keyboards': [{'inventory_number': f"B{i:05d}", 'internal_number': i} for i in range(students)],
+        'classes': classes,
+        'loans': [{
+            'student_class': f"5-{i // class_size + 1:03d}",
+            'student_last_name': f"Schüler{i:05d}",
+            'student_first_name': 'Bench',
+            'keyboard_inventory_number': f"B{i:05d}",
+            'fee_paid': True,
+            'fee_amount': 10.0
+        } for i in range(students)]
+    }
+
+
+@click.command('benchmark-import')
+@click.option('--students', default=10000, show_default=True, help='Schüler (mit je Keyboard und Ausleihe).')
+def benchmark_import(students):
+    """Dauer und SQL-Anweisungen des JSON-Imports (Wegwerf-Datenbank): neu und erneut"""
+    import tempfile
+    import time
+    from app.routes.import_data import do_import
+    
+    data = _sample_backup(students)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _scratch_app(tmp)
+        with app.app_context():
+            statements = [0]
+            
+            def count(conn, cursor, statement, parameters, context, executemany):
+                statements[0] += 1
+            
+            event.listen(db.engine, 'before_cursor_execute', count)
+            # Zweiter Lauf: alles vorhanden, nur Abgleich
+            for label in ('Neu', 'Erneut'):
+                statements[0] = 0
+                started = time.perf_counter()
+                result = do_import(data)
+                elapsed = time.perf_counter() - started
+                click.echo(f"{label:8} {elapsed:8.2f} s {statements[0]:8} Anweisungen  ({result})")
+            db.session.remove()
+            db.engine.dispose()
+
+
+@click.command('import-backup')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_backup_file(path):
+    """JSON-, NDJSON- oder Excel-Backup stückweise importieren (ohne Größenlimit, mit Fortschritt)"""
+    from app.importer import import_backup, iter_json_records, iter_ndjson_records, iter_xlsx_records
+    from app.models import AuditLog
+    
+    def progress(count):
+        click.echo(f"\r{count} Datensätze verarbeitet", nl=False)
+    
+    with open(path, 'rb') as f:
+        if path.lower().endswith('.json'):
+            records = iter_json_records(f)
+        elif path.lower().endswith('.xlsx'):
+            records = iter_xlsx_records(f)
+        else:
+            records = iter_ndjson_records(f)
+        try:
+            result = import_backup(records, progress=progress)
+        except ValueError as e:
+            db.session.rollback()
+            raise click.ClickException(str(e))
+    click.echo()
+    
+    db.session.add(AuditLog(action='import_data', entity_type='system', details=result))
+    db.session.commit()
+    click.echo(f"Import abgeschlossen: {result}")
+
+
+@click.command('archive-year')
+@click.argument('name')
+def archive_year(name):
+    """Abgeschlossenes Schuljahr (z.B. 2023/24) in die Archiv-Datei verschieben"""
+    from app.archive import archive_school_year, archive_path, ArchiveError
+    from app.models import SchoolYear, AuditLog
+    
+    year = SchoolYear.query.filter_by(name=name).first()
+    if not year:
+        raise click.ClickException(f'Schuljahr {name} nicht gefunden.')
+    try:
+        counts = archive_school_year(year.id)
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
+    
+    summary = (f"{counts['school_classes']} Klassen, {counts['students']} Schüler, "
+               f"{counts['loans']} Ausleihen")
+    db.session.add(AuditLog(action='school_year_archive', entity_type='school_year', entity_id=year.id,
+                            details=f"Schuljahr {name} archiviert: {summary}"))
+    db.session.commit()
+    click.echo(f"Schuljahr {name} archiviert ({summary}) -> {archive_path()}")
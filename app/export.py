@@ -1,45 +1,83 @@
 """Excel-Export Funktionen für Keyboard-Ausleihe"""
-import io
 import json
 import zipfile
+from collections import namedtuple
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
+from sqlalchemy import select, func
+from app.queries import KeyboardRow, keyboard_rows_query
+from app.xlsx import XlsxWriter
 
+ZIP_CHUNK_SIZE = 64 * 1024
 
-def style_header(ws, row=1, columns=None):
-    """Header-Zeile formatieren"""
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="2563EB", end_color="2563EB", fill_type="solid")
-    
-    for col in range(1, (columns or ws.max_column) + 1):
-        cell = ws.cell(row=row, column=col)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal="center", vertical="center")
 
+BackupData = namedtuple('BackupData', 'keyboards classes students_by_class active_loans returned_loans')
 
-def auto_column_width(ws):
-    """Spaltenbreiten automatisch anpassen"""
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
 
-
-def export_json_backup(school_year):
-    """Komplettes Backup als JSON (für Reimport)"""
-    from app.models import SchoolClass, Student, Keyboard, Loan, User
+def load_backup_data(school_year):
+    """Alle Daten für Excel- und JSON-Backup in wenigen Abfragen laden (Zeilen statt Objekte)"""
+    from app.models import db, SchoolClass, Student, Keyboard, Loan
+    
+    # Keyboards mit aktuellem Ausleiher und Klasse
+    keyboards = [KeyboardRow._make(row) for row in keyboard_rows_query(
+        Keyboard.query.order_by(Keyboard.internal_number, Keyboard.inventory_number)
+    )]
+    
+    classes = db.session.execute(
+        select(SchoolClass.id, SchoolClass.name, SchoolClass.grade,
+               SchoolClass.class_teacher, SchoolClass.music_teacher)
+        .where(SchoolClass.school_year_id == school_year.id)
+        .order_by(SchoolClass.name)
+    ).all()
+    
+    # Schüler aller Klassen inkl. aktiver Ausleihe; bei doppelten aktiven Ausleihen aus
+    # Altdaten (vor uq_loans_active_student) nur die erste, damit kein Schüler doppelt erscheint
+    students_by_class = {cls.id: [] for cls in classes}
+    active_loan_id = (
+        select(func.min(Loan.id))
+        .where(Loan.student_id == Student.id, Loan.returned_at == None)
+        .correlate(Student)
+        .scalar_subquery()
+    )
+    students = db.session.execute(
+        select(Student.class_id, Student.last_name, Student.first_name, Student.notes,
+               Student.participates_in_loan, Student.fee_prepaid,
+               Keyboard.inventory_number, Loan.fee_paid)
+        .join(SchoolClass, SchoolClass.id == Student.class_id)
+        .outerjoin(Loan, Loan.id == active_loan_id)
+        .outerjoin(Keyboard, Keyboard.id == Loan.keyboard_id)
+        .where(SchoolClass.school_year_id == school_year.id)
+        .order_by(Student.class_id, Student.last_name, Student.first_name)
+    )
+    for student in students:
+        students_by_class[student.class_id].append(student)
+    
+    loan_columns = (SchoolClass.name.label('class_name'), Student.last_name, Student.first_name,
+                    Student.notes, Keyboard.inventory_number, Loan.loaned_at, Loan.returned_at,
+                    Loan.fee_paid, Loan.fee_amount, Loan.return_condition, Loan.return_notes)
+    
+    active_loans = db.session.execute(
+        select(*loan_columns).select_from(Loan)
+        .join(Student, Student.id == Loan.student_id)
+        .join(SchoolClass, SchoolClass.id == Student.class_id)
+        .join(Keyboard, Keyboard.id == Loan.keyboard_id)
+        .where(Loan.returned_at == None)
+        .order_by(SchoolClass.name, Student.last_name, Student.first_name)
+    ).all()
+    
+    returned_loans = db.session.execute(
+        select(*loan_columns).select_from(Loan)
+        .join(Student, Student.id == Loan.student_id)
+        .join(SchoolClass, SchoolClass.id == Student.class_id)
+        .join(Keyboard, Keyboard.id == Loan.keyboard_id)
+        .where(Loan.returned_at != None, SchoolClass.school_year_id == school_year.id)
+        .order_by(Loan.returned_at.desc())
+    ).all()
     
-    data = {
+    return BackupData(keyboards, classes, students_by_class, active_loans, returned_loans)
+
+
+def _json_backup(school_year, data):
+    backup = {
         "export_version": "2.0",
         "exported_at": datetime.now().isoformat(),
         "school_year": {
@@ -54,8 +92,8 @@ def export_json_backup(school_year):
     }
     
     # Keyboards
-    for kb in Keyboard.query.order_by(Keyboard.internal_number).all():
-        data["keyboards"].append({
+    for kb in data.keyboards:
+        backup["keyboards"].append({
             "inventory_number": kb.inventory_number,
             "internal_number": kb.internal_number,
             "condition": kb.condition,
@@ -64,92 +102,142 @@ def export_json_backup(school_year):
         })
     
     # Klassen und Schüler
-    for cls in school_year.classes.order_by(SchoolClass.name).all():
-        class_data = {
+    for cls in data.classes:
+        backup["classes"].append({
             "name": cls.name,
             "grade": cls.grade,
             "class_teacher": cls.class_teacher,
             "music_teacher": cls.music_teacher,
-            "students": []
-        }
-        
-        for student in cls.students.order_by(Student.last_name, Student.first_name).all():
-            class_data["students"].append({
+            "students": [{
                 "last_name": student.last_name,
                 "first_name": student.first_name,
                 "notes": student.notes,
                 "participates_in_loan": student.participates_in_loan,
                 "fee_prepaid": student.fee_prepaid
-            })
-        
-        data["classes"].append(class_data)
+            } for student in data.students_by_class[cls.id]]
+        })
     
     # Aktive Ausleihen
-    for loan in Loan.query.filter(Loan.returned_at == None).all():
-        data["loans"].append({
-            "student_class": loan.student.school_class.name,
-            "student_last_name": loan.student.last_name,
-            "student_first_name": loan.student.first_name,
-            "keyboard_inventory_number": loan.keyboard.inventory_number,
+    for loan in data.active_loans:
+        backup["loans"].append({
+            "student_class": loan.class_name,
+            "student_last_name": loan.last_name,
+            "student_first_name": loan.first_name,
+            "keyboard_inventory_number": loan.inventory_number,
             "loaned_at": loan.loaned_at.isoformat() if loan.loaned_at else None,
             "fee_paid": loan.fee_paid,
             "fee_amount": loan.fee_amount
         })
     
-    return json.dumps(data, ensure_ascii=False, indent=2)
+    return backup
 
 
-def export_full_backup_zip(school_year):
-    """Komplettes Backup als ZIP mit Excel + JSON"""
+def export_json_backup(school_year, data=None):
+    """Komplettes Backup als JSON (für Reimport)"""
+    backup = _json_backup(school_year, data or load_backup_data(school_year))
+    return json.dumps(backup, ensure_ascii=False, indent=2)
+
+
+def iter_json_backup(school_year, data=None):
+    """Wie export_json_backup, aber als Folge von Textstücken (gleicher Inhalt)"""
+    backup = _json_backup(school_year, data or load_backup_data(school_year))
+    return json.JSONEncoder(ensure_ascii=False, indent=2).iterencode(backup)
+
+
+class _ZipStream:
+    """Schreibziel für zipfile ohne seek/tell: Geschriebenes wird stückweise abgeholt"""
+    
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+def export_full_backup_zip(school_year, progress=None):
+    """Komplettes Backup als ZIP mit Excel + JSON, als Folge von Byte-Blöcken
+    
+    Daten und Excel-Datei werden vorab erzeugt (Fehler treten also vor dem
+    ersten Block auf), das ZIP entsteht beim Iterieren: Excel wird blockweise
+    kopiert, JSON stückweise kodiert - nie liegt das ganze Archiv im Speicher.
+    progress(prozent, meldung) wird zwischen den Schritten aufgerufen (Hintergrund-Jobs).
+    """
+    progress = progress or (lambda percent, message=None: None)
     date_str = datetime.now().strftime('%Y%m%d')
     year_str = school_year.name.replace('/', '-')
     
-    # Excel erstellen
-    excel_output = export_full_backup(school_year)
-    
-    # JSON erstellen
-    json_content = export_json_backup(school_year)
-    
-    # ZIP erstellen
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        # Excel hinzufügen
-        zip_file.writestr(
-            f"keyboard_backup_{year_str}_{date_str}.xlsx",
-            excel_output.getvalue()
-        )
-        # JSON hinzufügen
-        zip_file.writestr(
-            f"keyboard_backup_{year_str}_{date_str}.json",
-            json_content.encode('utf-8')
-        )
-    
-    zip_buffer.seek(0)
-    return zip_buffer
+    # Daten einmal laden, Excel und JSON daraus erzeugen
+    progress(10, 'Daten werden geladen')
+    data = load_backup_data(school_year)
+    progress(30, 'Excel-Datei wird erstellt')
+    excel_output = export_full_backup(school_year, data)
+    progress(70, 'ZIP-Archiv wird erstellt')
+    
+    def chunks():
+        stream = _ZipStream()
+        try:
+            with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                # Excel hinzufügen
+                with zip_file.open(f"keyboard_backup_{year_str}_{date_str}.xlsx", 'w') as entry:
+                    for block in iter(lambda: excel_output.read(ZIP_CHUNK_SIZE), b''):
+                        entry.write(block)
+                        if stream.size:
+                            yield stream.take()
+                
+                # JSON hinzufügen
+                with zip_file.open(f"keyboard_backup_{year_str}_{date_str}.json", 'w') as entry:
+                    parts = []
+                    length = 0
+                    for part in iter_json_backup(school_year, data):
+                        parts.append(part)
+                        length += len(part)
+                        if length >= ZIP_CHUNK_SIZE:
+                            entry.write(''.join(parts).encode('utf-8'))
+                            parts = []
+                            length = 0
+                            if stream.size:
+                                yield stream.take()
+                    entry.write(''.join(parts).encode('utf-8'))
+            yield stream.take()
+        finally:
+            excel_output.close()
+    
+    return chunks()
 
 
-def export_full_backup(school_year):
+def export_full_backup(school_year, data=None):
     """Komplettes Backup eines Schuljahres als Excel"""
-    from app.models import SchoolClass, Student, Keyboard, Loan
+    from app.models import Keyboard
     
-    wb = Workbook()
+    data = data or load_backup_data(school_year)
+    book = XlsxWriter()
     
     # === Sheet 1: Übersicht ===
-    ws_overview = wb.active
-    ws_overview.title = "Übersicht"
+    ws_overview = book.sheet("Übersicht")
     
-    ws_overview['A1'] = "Keyboard-Ausleihe Backup"
-    ws_overview['A1'].font = Font(bold=True, size=16)
-    ws_overview['A2'] = f"Schuljahr: {school_year.name}"
-    ws_overview['A3'] = f"Exportiert: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
+    ws_overview.title("Keyboard-Ausleihe Backup", 'title_large')
+    ws_overview.append([f"Schuljahr: {school_year.name}"])
+    ws_overview.append([f"Exportiert: {datetime.now().strftime('%d.%m.%Y %H:%M')}"])
+    ws_overview.blank()
     
     # Statistiken
-    ws_overview['A5'] = "Statistiken"
-    ws_overview['A5'].font = Font(bold=True)
+    ws_overview.append(["Statistiken"], 'bold')
     
-    total_keyboards = Keyboard.query.count()
-    active_loans = Loan.query.filter(Loan.returned_at == None).count()
-    paid_loans = Loan.query.filter(Loan.returned_at == None, Loan.fee_paid == True).count()
+    total_keyboards = len(data.keyboards)
+    active_loans = len(data.active_loans)
+    paid_loans = sum(1 for loan in data.active_loans if loan.fee_paid)
     
     stats = [
         ("Keyboards gesamt", total_keyboards),
@@ -160,139 +248,100 @@ def export_full_backup(school_year):
         ("Einnahmen (offen)", f"{(active_loans - paid_loans) * 10}€"),
     ]
     
-    for i, (label, value) in enumerate(stats, start=6):
-        ws_overview[f'A{i}'] = label
-        ws_overview[f'B{i}'] = value
+    for label, value in stats:
+        ws_overview.append([label, value])
     
     # === Sheet 2: Alle Ausleihen (aktiv) ===
-    ws_loans = wb.create_sheet("Aktive Ausleihen")
-    
-    headers = ["Klasse", "Nachname", "Vorname", "Keyboard", "Ausgeliehen am", "Gebühr bezahlt", "Anmerkungen"]
-    ws_loans.append(headers)
-    style_header(ws_loans)
+    ws_loans = book.sheet("Aktive Ausleihen")
+    ws_loans.header(["Klasse", "Nachname", "Vorname", "Keyboard", "Ausgeliehen am", "Gebühr bezahlt", "Anmerkungen"])
     
-    active_loans_data = Loan.query.filter(Loan.returned_at == None).join(Student).join(SchoolClass).order_by(
-        SchoolClass.name, Student.last_name, Student.first_name
-    ).all()
-    
-    for loan in active_loans_data:
+    for loan in data.active_loans:
         ws_loans.append([
-            loan.student.school_class.name,
-            loan.student.last_name,
-            loan.student.first_name,
-            loan.keyboard.inventory_number,
+            loan.class_name,
+            loan.last_name,
+            loan.first_name,
+            loan.inventory_number,
             loan.loaned_at.strftime('%d.%m.%Y'),
             "Ja" if loan.fee_paid else "Nein",
-            loan.student.notes or ""
+            loan.notes or ""
         ])
     
-    auto_column_width(ws_loans)
-    
     # === Sheet 3: Klassen mit Schülern ===
-    for cls in school_year.classes.order_by(SchoolClass.name).all():
-        ws_class = wb.create_sheet(f"Klasse {cls.name}")
+    for cls in data.classes:
+        ws_class = book.sheet(f"Klasse {cls.name}")
         
         # Klasseninfo
-        ws_class['A1'] = f"Klasse {cls.name}"
-        ws_class['A1'].font = Font(bold=True, size=14)
+        ws_class.title(f"Klasse {cls.name}")
         if cls.class_teacher:
-            ws_class['A2'] = f"Klassenlehrer: {cls.class_teacher}"
+            ws_class.append([f"Klassenlehrer: {cls.class_teacher}"])
         
         # Schülerliste
-        headers = ["Nr.", "Nachname", "Vorname", "Keyboard", "Gebühr", "Anmerkungen"]
-        ws_class.append([])  # Leerzeile
-        ws_class.append(headers)
-        style_header(ws_class, row=ws_class.max_row)
+        ws_class.blank()
+        ws_class.header(["Nr.", "Nachname", "Vorname", "Keyboard", "Gebühr", "Anmerkungen"])
         
-        students = cls.students.order_by(Student.last_name, Student.first_name).all()
-        for i, student in enumerate(students, start=1):
-            loan = student.current_loan
+        for i, student in enumerate(data.students_by_class[cls.id], start=1):
+            has_loan = student.inventory_number is not None
             ws_class.append([
                 i,
                 student.last_name,
                 student.first_name,
-                loan.keyboard.inventory_number if loan else "",
-                "Bezahlt" if (loan and loan.fee_paid) else ("Offen" if loan else ""),
+                student.inventory_number or "",
+                "Bezahlt" if (has_loan and student.fee_paid) else ("Offen" if has_loan else ""),
                 student.notes or ""
             ])
-        
-        auto_column_width(ws_class)
     
     # === Sheet 4: Keyboard-Inventar ===
-    ws_keyboards = wb.create_sheet("Keyboard-Inventar")
-    
-    headers = ["Nr.", "Inventarnummer", "Status", "Zustand", "Aktueller Ausleiher", "Klasse", "Notizen"]
-    ws_keyboards.append(headers)
-    style_header(ws_keyboards)
+    ws_keyboards = book.sheet("Keyboard-Inventar")
+    ws_keyboards.header(["Nr.", "Inventarnummer", "Status", "Zustand", "Aktueller Ausleiher", "Klasse", "Notizen"])
     
-    keyboards = Keyboard.query.order_by(Keyboard.internal_number, Keyboard.inventory_number).all()
-    for kb in keyboards:
-        loan = kb.current_loan
+    status_labels = dict(Keyboard.STATUS_CHOICES)
+    condition_labels = dict(Keyboard.CONDITION_CHOICES)
+    for kb in data.keyboards:
         ws_keyboards.append([
             kb.internal_number or "",
             kb.inventory_number,
-            dict(Keyboard.STATUS_CHOICES).get(kb.status, kb.status),
-            dict(Keyboard.CONDITION_CHOICES).get(kb.condition, kb.condition),
-            loan.student.full_name if loan else "",
-            loan.student.school_class.name if loan else "",
+            status_labels.get(kb.status, kb.status),
+            condition_labels.get(kb.condition, kb.condition),
+            kb.student_full_name or "",
+            kb.class_name or "",
             kb.notes or ""
         ])
     
-    auto_column_width(ws_keyboards)
-    
     # === Sheet 5: Rückgaben (Historie) ===
-    ws_returned = wb.create_sheet("Rückgaben")
+    ws_returned = book.sheet("Rückgaben")
+    ws_returned.header(["Klasse", "Nachname", "Vorname", "Keyboard", "Ausgeliehen", "Zurückgegeben", "Zustand", "Bemerkung"])
     
-    headers = ["Klasse", "Nachname", "Vorname", "Keyboard", "Ausgeliehen", "Zurückgegeben", "Zustand", "Bemerkung"]
-    ws_returned.append(headers)
-    style_header(ws_returned)
-    
-    returned_loans = Loan.query.filter(Loan.returned_at != None).join(Student).join(SchoolClass).filter(
-        SchoolClass.school_year_id == school_year.id
-    ).order_by(Loan.returned_at.desc()).all()
-    
-    for loan in returned_loans:
+    for loan in data.returned_loans:
         ws_returned.append([
-            loan.student.school_class.name,
-            loan.student.last_name,
-            loan.student.first_name,
-            loan.keyboard.inventory_number,
+            loan.class_name,
+            loan.last_name,
+            loan.first_name,
+            loan.inventory_number,
             loan.loaned_at.strftime('%d.%m.%Y'),
             loan.returned_at.strftime('%d.%m.%Y') if loan.returned_at else "",
-            dict(Keyboard.CONDITION_CHOICES).get(loan.return_condition, "") if loan.return_condition else "",
+            condition_labels.get(loan.return_condition, "") if loan.return_condition else "",
             loan.return_notes or ""
         ])
     
-    auto_column_width(ws_returned)
-    
-    # In BytesIO speichern
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    return output
+    return book.save()
 
 
 def export_class_list(school_class):
     """Einzelne Klassenliste als Excel"""
     from app.models import Student
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"Klasse {school_class.name}"
+    book = XlsxWriter()
+    ws = book.sheet(f"Klasse {school_class.name}")
     
     # Header
-    ws['A1'] = f"Klassenliste {school_class.name}"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Schuljahr: {school_class.school_year.name}"
+    ws.title(f"Klassenliste {school_class.name}")
+    ws.append([f"Schuljahr: {school_class.school_year.name}"])
     if school_class.class_teacher:
-        ws['A3'] = f"Klassenlehrer: {school_class.class_teacher}"
+        ws.append([f"Klassenlehrer: {school_class.class_teacher}"])
     
     # Tabelle
-    headers = ["Nr.", "Nachname", "Vorname", "Keyboard", "Gebühr bezahlt", "Anmerkungen"]
-    ws.append([])
-    ws.append(headers)
-    style_header(ws, row=ws.max_row)
+    ws.blank()
+    ws.header(["Nr.", "Nachname", "Vorname", "Keyboard", "Gebühr bezahlt", "Anmerkungen"])
     
     students = school_class.students.order_by(Student.last_name, Student.first_name).all()
     for i, student in enumerate(students, start=1):
@@ -306,36 +355,22 @@ def export_class_list(school_class):
             student.notes or ""
         ])
     
-    auto_column_width(ws)
-    
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    return output
+    return book.save()
 
 
 def export_payment_list(school_year):
     """Gebühren-Übersicht als Excel (für Buchhaltung)"""
     from app.models import SchoolClass, Student, Loan
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Gebühren"
-    
-    ws['A1'] = "Gebühren-Übersicht Keyboard-Ausleihe"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Schuljahr: {school_year.name}"
-    ws['A3'] = f"Stand: {datetime.now().strftime('%d.%m.%Y')}"
+    book = XlsxWriter()
+    ws = book.sheet("Gebühren")
     
-    headers = ["Klasse", "Nachname", "Vorname", "Betrag", "Status", "Keyboard"]
-    ws.append([])
-    ws.append(headers)
-    style_header(ws, row=ws.max_row)
+    ws.title("Gebühren-Übersicht Keyboard-Ausleihe")
+    ws.append([f"Schuljahr: {school_year.name}"])
+    ws.append([f"Stand: {datetime.now().strftime('%d.%m.%Y')}"])
     
-    # Rot für offen, grün für bezahlt
-    red_fill = PatternFill(start_color="FFCDD2", end_color="FFCDD2", fill_type="solid")
-    green_fill = PatternFill(start_color="C8E6C9", end_color="C8E6C9", fill_type="solid")
+    ws.blank()
+    ws.header(["Klasse", "Nachname", "Vorname", "Betrag", "Status", "Keyboard"])
     
     active_loans = Loan.query.filter(Loan.returned_at == None).join(Student).join(SchoolClass).filter(
         SchoolClass.school_year_id == school_year.id
@@ -345,21 +380,15 @@ def export_payment_list(school_year):
     total_open = 0
     
     for loan in active_loans:
-        row = [
+        # Zeile einfärben: grün für bezahlt, rot für offen
+        ws.append([
             loan.student.school_class.name,
             loan.student.last_name,
             loan.student.first_name,
             "10,00 €",
             "Bezahlt" if loan.fee_paid else "Offen",
             loan.keyboard.inventory_number
-        ]
-        ws.append(row)
-        
-        # Zeile einfärben
-        current_row = ws.max_row
-        fill = green_fill if loan.fee_paid else red_fill
-        for col in range(1, 7):
-            ws.cell(row=current_row, column=col).fill = fill
+        ], 'paid' if loan.fee_paid else 'open')
         
         if loan.fee_paid:
             total_paid += 10
@@ -367,19 +396,10 @@ def export_payment_list(school_year):
             total_open += 10
     
     # Summen
-    ws.append([])
-    ws.append(["", "", "Summe bezahlt:", f"{total_paid},00 €"])
-    ws.append(["", "", "Summe offen:", f"{total_open},00 €"])
-    ws.append(["", "", "Gesamt:", f"{total_paid + total_open},00 €"])
-    
-    for row in range(ws.max_row - 2, ws.max_row + 1):
-        ws.cell(row=row, column=3).font = Font(bold=True)
-        ws.cell(row=row, column=4).font = Font(bold=True)
-    
-    auto_column_width(ws)
-    
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+    ws.blank()
+    sum_style = [None, None, 'bold', 'bold']
+    ws.append(["", "", "Summe bezahlt:", f"{total_paid},00 €"], sum_style)
+    ws.append(["", "", "Summe offen:", f"{total_open},00 €"], sum_style)
+    ws.append(["", "", "Gesamt:", f"{total_paid + total_open},00 €"], sum_style)
     
-    return output
+    return book.save()
@@ -0,0 +1,579 @@
+"""Import in Mengen für JSON-Backups (und weitere Quellen)
+
+Vorhandene Keyboards, Klassen und Schüler werden einmal pro Import in
+Dictionaries geladen, statt jeden Datensatz einzeln nachzuschlagen. Neue
+Zeilen sammelt BulkImporter und fügt sie blockweise mit executemany ein;
+die neuen IDs kommen per RETURNING aus derselben Anweisung zurück. Ausleihen
+werden wie bisher ohne Vorab-Prüfung eingefügt (ON CONFLICT DO NOTHING) -
+hat Schüler oder Keyboard schon eine aktive Ausleihe, entfällt die Zeile.
+
+Die Quellen liefern einheitliche Datensätze (Art, Daten): iter_json_records
+liest eine JSON-Datei stückweise statt per json.load, iter_ndjson_records
+zeilenweise, iter_dict_records ein bereits geladenes Backup, iter_xlsx_records
+das Excel-Backup im read-only-Modus von openpyxl. import_backup verarbeitet sie
+in festen Blöcken mit Commit nach jedem Block. Schülerlisten (CSV oder Excel)
+liest iter_roster_rows.
+"""
+import codecs
+import csv
+import io
+import itertools
+import json
+import re
+from datetime import date
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+from app.models import db, SchoolYear, SchoolClass, Student, Keyboard, Loan
+from app.xlsx import XlsxReader
+
+# Zeilen pro INSERT-Block; danach wird geschrieben (Speicher bleibt begrenzt)
+IMPORT_BATCH_SIZE = 1000
+
+# Gelesene Bytes pro Schritt beim stückweisen JSON-Parsen
+READ_CHUNK_SIZE = 64 * 1024
+
+# Listen im Backup und die Art ihrer Einträge (students: altes Format 1.0)
+RECORD_LISTS = {'keyboards': 'keyboard', 'classes': 'class', 'loans': 'loan', 'students': 'student'}
+HEADER_KEYS = {'export_version', 'school_year'}
+
+# Blätter des Excel-Backups (export_full_backup)
+XLSX_OVERVIEW_SHEET = 'Übersicht'
+XLSX_KEYBOARD_SHEET = 'Keyboard-Inventar'
+XLSX_LOANS_SHEET = 'Aktive Ausleihen'
+XLSX_CLASS_PREFIX = 'Klasse '
+
+# Überschriften der Klassen-Spalte in Schülerlisten
+CLASS_COLUMNS = ('klasse', 'class')
+
+
+class BulkImporter:
+    """Sammelt Keyboards, Schüler und Ausleihen eines Schuljahres und schreibt sie blockweise
+    
+    Klassen werden sofort angelegt (wenige Zeilen, ihre ID wird für die Schüler gebraucht).
+    Schreibt nur in die laufende Transaktion - finish() leert die Puffer, Commit beim Aufrufer.
+    """
+    
+    def __init__(self, school_year, batch_size=IMPORT_BATCH_SIZE):
+        # Nur die ID merken: nach einem Commit wäre das Objekt abgelaufen
+        self.school_year_id = school_year.id
+        self.batch_size = batch_size
+        self.stats = {'keyboards': 0, 'classes': 0, 'students': 0, 'loans': 0}
+        
+        # Vorhandene Schlüssel mit je einer Abfrage (bei Namensgleichheit gilt die älteste Zeile)
+        self._keyboards = None
+        self.existing_classes = dict(db.session.execute(
+            select(SchoolClass.name, SchoolClass.id).where(SchoolClass.school_year_id == school_year.id)
+            .order_by(SchoolClass.id.desc())
+        ).all())
+        self.students = {}
+        for student_id, class_id, last_name, first_name in db.session.execute(
+            select(Student.id, Student.class_id, Student.last_name, Student.first_name)
+            .join(SchoolClass, Student.class_id == SchoolClass.id)
+            .where(SchoolClass.school_year_id == school_year.id)
+            .order_by(Student.id)
+        ):
+            self.students.setdefault((class_id, last_name, first_name), student_id)
+        
+        # Klassen aus der Datei: Name -> ID
+        self.classes = {}
+        
+        self._new_keyboards = []
+        self._new_students = []
+        self._new_loans = []
+    
+    @property
+    def keyboards(self):
+        """Inventarnummer -> ID; erst geladen, wenn Keyboards oder Ausleihen kommen"""
+        if self._keyboards is None:
+            self._keyboards = dict(db.session.execute(select(Keyboard.inventory_number, Keyboard.id)).all())
+        return self._keyboards
+    
+    def add_keyboard(self, kb_data):
+        """Keyboard anlegen, sofern die Inventarnummer noch nicht existiert"""
+        inv_nr = str(kb_data['inventory_number'])
+        if inv_nr in self.keyboards:
+            return
+        self.keyboards[inv_nr] = None
+        self._new_keyboards.append({
+            'inventory_number': inv_nr,
+            'internal_number': kb_data.get('internal_number'),
+            'condition': kb_data.get('condition', 'in_ordnung'),
+            'status': kb_data.get('status', 'im_lager'),
+            'notes': kb_data.get('notes')
+        })
+        self._flush_if_full(self._new_keyboards)
+    
+    def add_class(self, cls_data):
+        """Klasse im Schuljahr finden oder anlegen; liefert die ID"""
+        cls_name = cls_data['name']
+        class_id = self.existing_classes.get(cls_name)
+        if class_id is None:
+            if cls_data.get('grade') is None:
+                raise ValueError(f'Klasse {cls_name}: Jahrgangsstufe fehlt.')
+            class_id = db.session.execute(
+                insert(SchoolClass).values(
+                    name=cls_name,
+                    grade=cls_data['grade'],
+                    school_year_id=self.school_year_id,
+                    class_teacher=cls_data.get('class_teacher'),
+                    music_teacher=cls_data.get('music_teacher')
+                ).returning(SchoolClass.id)
+            ).scalar_one()
+            self.existing_classes[cls_name] = class_id
+            self.stats['classes'] += 1
+        self.classes[cls_name] = class_id
+        return class_id
+    
+    def add_student(self, cls_name, student_data):
+        """Schüler einer Klasse aus der Datei anlegen, sofern noch nicht vorhanden (auch innerhalb der Datei)
+        
+        Liefert True, wenn der Schüler neu angelegt wird.
+        """
+        class_id = self.classes.get(cls_name)
+        if class_id is None:
+            return False
+        key = (class_id, student_data['last_name'], student_data['first_name'])
+        if key in self.students:
+            return False
+        self.students[key] = None
+        self._new_students.append({
+            'last_name': student_data['last_name'],
+            'first_name': student_data['first_name'],
+            'class_id': class_id,
+            'notes': student_data.get('notes'),
+            'participates_in_loan': student_data.get('participates_in_loan', False),
+            'fee_prepaid': student_data.get('fee_prepaid', False)
+        })
+        self._flush_if_full(self._new_students)
+        return True
+    
+    def add_loan(self, cls_name, last_name, first_name, inventory_number, fee_paid=False, fee_amount=10.0):
+        """Ausleihe vormerken; unbekannte Klasse, Schüler oder Keyboard werden übersprungen"""
+        class_id = self.classes.get(cls_name)
+        if class_id is None:
+            return
+        key = (class_id, last_name, first_name)
+        if key not in self.students or inventory_number not in self.keyboards:
+            return
+        self._new_loans.append((key, inventory_number, fee_paid, fee_amount))
+        self._flush_if_full(self._new_loans)
+    
+    def _flush_if_full(self, pending):
+        if len(pending) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        """Gesammelte Zeilen schreiben: Keyboards und Schüler vor den Ausleihen, die auf sie verweisen"""
+        if self._new_keyboards:
+            for kb_id, inv_nr in db.session.execute(
+                insert(Keyboard).returning(Keyboard.id, Keyboard.inventory_number), self._new_keyboards
+            ):
+                self.keyboards[inv_nr] = kb_id
+            self.stats['keyboards'] += len(self._new_keyboards)
+            self._new_keyboards = []
+        
+        if self._new_students:
+            for student_id, class_id, last_name, first_name in db.session.execute(
+                insert(Student).returning(Student.id, Student.class_id, Student.last_name, Student.first_name),
+                self._new_students
+            ):
+                self.students[(class_id, last_name, first_name)] = student_id
+            self.stats['students'] += len(self._new_students)
+            self._new_students = []
+        
+        if self._new_loans:
+            rows = [{
+                'keyboard_id': self.keyboards[inventory_number],
+                'student_id': self.students[key],
+                'fee_paid': fee_paid,
+                'fee_amount': fee_amount
+            } for key, inventory_number, fee_paid, fee_amount in self._new_loans]
+            self._new_loans = []
+            
+            # Nur tatsächlich eingefügte Ausleihen kommen zurück
+            keyboard_ids = db.session.execute(
+                insert(Loan).on_conflict_do_nothing().returning(Loan.keyboard_id), rows
+            ).scalars().all()
+            if keyboard_ids:
+                db.session.execute(
+                    update(Keyboard).where(Keyboard.id.in_(keyboard_ids)).values(status='ausgeliehen'),
+                    execution_options={'synchronize_session': False}
+                )
+            self.stats['loans'] += len(keyboard_ids)
+    
+    def finish(self):
+        """Restliche Zeilen schreiben; liefert die Zusammenfassung für Meldung und Audit-Log"""
+        self.flush()
+        stats = self.stats
+        return f"{stats['keyboards']} Keyboards, {stats['classes']} Klassen, {stats['students']} Schüler, {stats['loans']} Ausleihen"
+
+
+def _school_year(export_version, value):
+    """Schuljahr aus den Kopfdaten finden oder anlegen (neues wird aktiv)"""
+    if export_version == '2.0':
+        # Neues Format
+        year_data = value or {}
+        year_name = year_data.get('name', '2024/2025')
+        year_start = date.fromisoformat(year_data['start_date']) if year_data.get('start_date') else date(2024, 8, 1)
+        year_end = date.fromisoformat(year_data['end_date']) if year_data.get('end_date') else date(2025, 7, 31)
+    else:
+        # Altes Format
+        year_name = value or '2024/2025'
+        year_start = date(2024, 8, 1)
+        year_end = date(2025, 7, 31)
+    
+    school_year = SchoolYear.query.filter_by(name=year_name).first()
+    if not school_year:
+        school_year = SchoolYear(
+            name=year_name,
+            start_date=year_start,
+            end_date=year_end,
+            is_active=True
+        )
+        # Andere Schuljahre deaktivieren
+        SchoolYear.query.update({SchoolYear.is_active: False})
+        db.session.add(school_year)
+        db.session.flush()
+    return school_year
+
+
+def import_backup(records, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Datensätze (Art, Daten) importieren; Commit nach je batch_size Datensätzen
+    
+    export_version und school_year müssen vor den Listen stehen, die Listen in der
+    Reihenfolge keyboards, classes, loans bzw. students (wie in allen Exporten).
+    Bricht der Import ab, bleiben die fertigen Blöcke erhalten - ein erneuter Import
+    legt nur noch Fehlendes an. progress(Anzahl) wird nach jedem Block aufgerufen.
+    """
+    header = {'export_version': '1.0', 'school_year': None}
+    importer = None
+    count = 0
+    
+    for kind, value in records:
+        if kind == 'header':
+            if importer:
+                raise ValueError('export_version und school_year müssen vor den Daten stehen.')
+            header[value[0]] = value[1]
+            continue
+        
+        if importer is None:
+            importer = BulkImporter(_school_year(header['export_version'], header['school_year']), batch_size)
+        v2 = header['export_version'] == '2.0'
+        
+        if kind == 'keyboard':
+            importer.add_keyboard(value)
+        elif kind == 'class':
+            importer.add_class(value)
+            # Schüler aus Klassen-Daten importieren (neues Format v2.0)
+            if v2:
+                for student_data in value.get('students', []):
+                    importer.add_student(value['name'], student_data)
+        elif kind == 'loan' and v2:
+            importer.add_loan(
+                value['student_class'],
+                value['student_last_name'],
+                value['student_first_name'],
+                value['keyboard_inventory_number'],
+                fee_paid=value.get('fee_paid', False),
+                fee_amount=value.get('fee_amount', 10.0)
+            )
+        elif kind == 'student' and not v2:
+            # Altes Format: Schüler separat, Ausleihe wenn Keyboard zugewiesen
+            importer.add_student(value['class_name'], {
+                'last_name': value['last_name'],
+                'first_name': value['first_name'],
+                'participates_in_loan': value.get('participates', False)
+            })
+            if value.get('keyboard_nr'):
+                importer.add_loan(value['class_name'], value['last_name'], value['first_name'], value['keyboard_nr'])
+        
+        count += 1
+        if count % batch_size == 0:
+            importer.flush()
+            db.session.commit()
+            if progress:
+                progress(count)
+    
+    if importer is None:
+        importer = BulkImporter(_school_year(header['export_version'], header['school_year']), batch_size)
+    result = importer.finish()
+    db.session.commit()
+    if progress:
+        progress(count)
+    return result
+
+
+def iter_dict_records(data):
+    """Datensätze aus einem geladenen Backup (Dict)"""
+    for key in HEADER_KEYS:
+        if key in data:
+            yield 'header', (key, data[key])
+    for key, kind in RECORD_LISTS.items():
+        for value in data.get(key, []):
+            yield kind, value
+
+
+def iter_ndjson_records(fileobj):
+    """Datensätze aus NDJSON: je Zeile ein Objekt mit "type"
+    
+    {"type": "header", "export_version": "2.0", "school_year": {...}}, danach Zeilen mit
+    type keyboard, class (mit students), loan - Felder wie im JSON-Backup.
+    """
+    kinds = set(RECORD_LISTS.values())
+    for number, line in enumerate(fileobj, start=1):
+        if not line.strip():
+            continue
+        value = json.loads(line)
+        kind = value.pop('type', None) if isinstance(value, dict) else None
+        if kind == 'header':
+            for key in HEADER_KEYS:
+                if key in value:
+                    yield 'header', (key, value[key])
+        elif kind in kinds:
+            yield kind, value
+        else:
+            raise ValueError(f'Zeile {number}: unbekannter Typ {kind!r}')
+
+
+class _JsonReader:
+    """Liest JSON stückweise: Puffer wird nachgeladen, gelesene Teile verworfen"""
+    
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+    
+    def _fill(self):
+        chunk = self.fileobj.read(READ_CHUNK_SIZE)
+        if isinstance(chunk, bytes):
+            chunk = self.text_decoder.decode(chunk, final=not chunk)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+    
+    def peek(self):
+        """Nächstes Zeichen ohne Leerraum ('' am Dateiende)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+    
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Ungültiges JSON: {chars!r} erwartet, {char or 'Dateiende'!r} gefunden")
+        self.pos += 1
+        return char
+    
+    def value(self):
+        """Nächsten vollständigen JSON-Wert lesen (lädt nach, bis er komplett im Puffer ist)"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    # Position im Puffer sagt nichts über die Stelle in der Datei
+                    raise ValueError(f'Ungültiges JSON: {e.msg}')
+                self._fill()
+                continue
+            # Eine Zahl am Pufferende kann abgeschnitten sein
+            if end == len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_records(fileobj):
+    """Datensätze aus einer JSON-Datei, ohne sie ganz zu laden
+    
+    Das oberste Objekt wird Schlüssel für Schlüssel gelesen; die bekannten Listen
+    (keyboards, classes, loans, students) Eintrag für Eintrag.
+    """
+    reader = _JsonReader(fileobj)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key in RECORD_LISTS and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield RECORD_LISTS[key], reader.value()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            value = reader.value()
+            if key in HEADER_KEYS:
+                yield 'header', (key, value)
+        if reader.expect(',}') == '}':
+            return
+
+
+def _table(rows, columns, preamble=None):
+    """(Zeilennummer, Dict) für die Zeilen unter der Kopfzeile
+    
+    columns: Schlüssel -> mögliche Überschriften (ohne Groß-/Kleinschreibung). Kopfzeile ist
+    die erste Zeile mit einer Überschrift für den ersten Schlüssel; Zeilen davor landen in preamble.
+    """
+    index = None
+    for number, texts in rows:
+        if index is None:
+            lowered = [text.strip().lower() for text in texts]
+            index = {key: next((lowered.index(name) for name in names if name in lowered), None)
+                     for key, names in columns.items()}
+            if index[next(iter(columns))] is None:
+                index = None
+                if preamble is not None:
+                    preamble.append(texts)
+            continue
+        yield number, {key: texts[i] if i is not None and i < len(texts) else ''
+                       for key, i in index.items()}
+
+
+def _year_data(name):
+    """Schuljahr aus dem Namen ("2025/2026" -> 1.8.2025 bis 31.7.2026)"""
+    match = re.match(r'(\d{4})\s*/\s*\d{2,4}$', name)
+    if not match:
+        return {'name': name}
+    start_year = int(match.group(1))
+    return {
+        'name': name,
+        'start_date': date(start_year, 8, 1).isoformat(),
+        'end_date': date(start_year + 1, 7, 31).isoformat()
+    }
+
+
+def _xlsx_school_year(reader):
+    for number, texts in reader.rows(XLSX_OVERVIEW_SHEET):
+        if texts[0].startswith('Schuljahr:'):
+            return _year_data(texts[0].split(':', 1)[1].strip())
+        if number > 10:
+            break
+    raise ValueError(f'Schuljahr nicht gefunden (Blatt "{XLSX_OVERVIEW_SHEET}").')
+
+
+def _xlsx_keyboards(reader):
+    status_values = {label: value for value, label in Keyboard.STATUS_CHOICES}
+    condition_values = {label: value for value, label in Keyboard.CONDITION_CHOICES}
+    columns = {'inventory_number': ('inventarnummer',), 'internal_number': ('nr.',),
+               'status': ('status',), 'condition': ('zustand',), 'notes': ('notizen',)}
+    for number, row in _table(reader.rows(XLSX_KEYBOARD_SHEET), columns):
+        if not row['inventory_number']:
+            continue
+        yield 'keyboard', {
+            'inventory_number': row['inventory_number'],
+            'internal_number': int(row['internal_number']) if row['internal_number'].isdigit() else None,
+            'status': status_values.get(row['status'], row['status'] or 'im_lager'),
+            'condition': condition_values.get(row['condition'], row['condition'] or 'in_ordnung'),
+            'notes': row['notes'] or None
+        }
+
+
+def _xlsx_class(reader, sheet, batch_size):
+    """Klasse mit Schülern; bei großen Klassen mehrfach mit je batch_size Schülern"""
+    preamble = []
+    columns = {'last_name': ('nachname',), 'first_name': ('vorname',),
+               'keyboard': ('keyboard',), 'notes': ('anmerkungen',)}
+    rows = _table(reader.rows(sheet), columns, preamble)
+    
+    # Erste Zeile lesen, damit der Kopfbereich vorliegt:
+    # "Klasse 5A" bzw. "Klassenliste 5A", optional "Klassenlehrer: ..."
+    first = next(rows, None)
+    name = sheet[len(XLSX_CLASS_PREFIX):].strip()
+    teacher = None
+    for texts in preamble:
+        if texts[0].startswith('Klassenlehrer:'):
+            teacher = texts[0].split(':', 1)[1].strip() or None
+        elif texts[0].startswith(('Klasse ', 'Klassenliste ')):
+            name = texts[0].split(' ', 1)[1].strip()
+    grade = re.match(r'\d+', name)
+    cls_data = {'name': name, 'grade': int(grade.group()) if grade else None, 'class_teacher': teacher}
+    
+    students = []
+    for number, row in itertools.chain([first] if first else [], rows):
+        if not row['last_name'] or not row['first_name']:
+            continue
+        students.append({
+            'last_name': row['last_name'],
+            'first_name': row['first_name'],
+            'notes': row['notes'] or None,
+            'participates_in_loan': bool(row['keyboard'])
+        })
+        if len(students) >= batch_size:
+            yield 'class', dict(cls_data, students=students)
+            students = []
+    yield 'class', dict(cls_data, students=students)
+
+
+def _xlsx_loans(reader):
+    columns = {'keyboard': ('keyboard',), 'class_name': ('klasse',), 'last_name': ('nachname',),
+               'first_name': ('vorname',), 'fee_paid': ('gebühr bezahlt',)}
+    for number, row in _table(reader.rows(XLSX_LOANS_SHEET), columns):
+        if not row['keyboard']:
+            continue
+        yield 'loan', {
+            'student_class': row['class_name'],
+            'student_last_name': row['last_name'],
+            'student_first_name': row['first_name'],
+            'keyboard_inventory_number': row['keyboard'],
+            'fee_paid': row['fee_paid'].lower() == 'ja'
+        }
+
+
+def iter_xlsx_records(fileobj, batch_size=IMPORT_BATCH_SIZE):
+    """Datensätze aus dem Excel-Backup (export_full_backup), Zeile für Zeile im read-only-Modus
+    
+    Die Blätter werden in der Reihenfolge gelesen, die import_backup braucht: Übersicht
+    (Schuljahr), Keyboard-Inventar, die Klassenblätter, zuletzt die aktiven Ausleihen.
+    Rückgaben sind nur Historie und werden nicht importiert. Was das Excel nicht
+    enthält, gilt wie beim Anlegen: Jahrgang aus dem Klassennamen, Teilnahme an der
+    Ausleihe nur bei zugewiesenem Keyboard, Gebühr 10 €.
+    """
+    with XlsxReader(fileobj) as reader:
+        sheets = reader.sheetnames
+        if XLSX_OVERVIEW_SHEET not in sheets or XLSX_KEYBOARD_SHEET not in sheets:
+            raise ValueError(f'Kein Excel-Backup: Blätter "{XLSX_OVERVIEW_SHEET}" und "{XLSX_KEYBOARD_SHEET}" fehlen.')
+        
+        yield 'header', ('export_version', '2.0')
+        yield 'header', ('school_year', _xlsx_school_year(reader))
+        yield from _xlsx_keyboards(reader)
+        for sheet in sheets:
+            if sheet.startswith(XLSX_CLASS_PREFIX):
+                yield from _xlsx_class(reader, sheet, batch_size)
+        if XLSX_LOANS_SHEET in sheets:
+            yield from _xlsx_loans(reader)
+
+
+def iter_roster_rows(fileobj, filename):
+    """Schülerlisten aus CSV (Semikolon, UTF-8) oder Excel: (Fundstelle, Nachname, Vorname, Klasse)
+    
+    Spalten Name bzw. Nachname, Vorname und optional Klasse. In Excel wird jedes Blatt
+    gelesen, Titelzeilen über der Kopfzeile werden übersprungen; ohne Klassen-Spalte gilt
+    bei Blättern "Klasse 5A" (Klassenliste aus dem Export) der Name des Blatts.
+    Klasse ist '' wenn nicht angegeben.
+    """
+    columns = {'first_name': ('vorname',), 'last_name': ('name', 'nachname'), 'class_name': CLASS_COLUMNS}
+    
+    if not filename.lower().endswith('.xlsx'):
+        rows = csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''), delimiter=';')
+        for number, row in _table(((number, row) for number, row in enumerate(rows, start=1)), columns):
+            yield f'Zeile {number}', row['last_name'].strip(), row['first_name'].strip(), row['class_name'].strip()
+        return
+    
+    with XlsxReader(fileobj) as reader:
+        for sheet in reader.sheetnames:
+            sheet_class = sheet[len(XLSX_CLASS_PREFIX):].strip() if sheet.startswith(XLSX_CLASS_PREFIX) else ''
+            for number, row in _table(reader.rows(sheet), columns):
+                yield f'{sheet}, Zeile {number}', row['last_name'], row['first_name'], row['class_name'] or sheet_class
@@ -0,0 +1,57 @@
+"""Keyboard-Lookup für die Ausleihstation (Barcode-Scanner)
+
+Jeder Worker hält das Inventar mit aktuellem Ausleiher als Dict im Speicher.
+Vor jedem Zugriff werden die Versions-Stempel aus app.cache verglichen: hat
+irgendein Worker Keyboards oder Ausleihen geändert, wird neu geladen (eine
+Abfrage), sonst kostet ein Scan keinen Datenbankzugriff.
+"""
+import threading
+from app.cache import data_version
+from app.models import Keyboard
+from app.queries import KeyboardRow, keyboard_rows_query
+
+LOOKUP_TABLES = {'keyboards', 'loans', 'students', 'school_classes'}
+
+_lock = threading.Lock()
+_state = {'versions': None, 'by_inventory': {}, 'by_folded': {}, 'by_internal': {}}
+
+
+def _load():
+    by_inventory = {}
+    by_folded = {}
+    by_internal = {}
+    for row in keyboard_rows_query(Keyboard.query):
+        row = KeyboardRow._make(row)
+        number = row.inventory_number.strip()
+        by_inventory[number] = row
+        # Inventarnummern sind nur mit Groß-/Kleinschreibung eindeutig: mehrdeutige Schreibweisen -> None
+        folded = number.upper()
+        by_folded[folded] = None if folded in by_folded else row
+        if row.internal_number is not None:
+            by_internal.setdefault(row.internal_number, row)
+    return by_inventory, by_folded, by_internal
+
+
+def lookup(code):
+    """Gescannten Code (Inventarnummer oder interne Nummer) auflösen -> KeyboardRow oder None"""
+    code = (code or '').strip()
+    if not code:
+        return None
+    
+    # Stempel vor dem Laden lesen: Änderungen währenddessen lösen beim nächsten Scan neu aus
+    versions = data_version(LOOKUP_TABLES)
+    with _lock:
+        if _state['versions'] != versions:
+            _state['by_inventory'], _state['by_folded'], _state['by_internal'] = _load()
+            _state['versions'] = versions
+        by_inventory = _state['by_inventory']
+        by_folded = _state['by_folded']
+        by_internal = _state['by_internal']
+    
+    # Exakte Inventarnummer zuerst, sonst ohne Groß-/Kleinschreibung (nur wenn eindeutig)
+    row = by_inventory.get(code)
+    if row is None:
+        row = by_folded.get(code.upper())
+    if row is None and code.isdigit():
+        row = by_internal.get(int(code))
+    return row
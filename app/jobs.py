@@ -0,0 +1,210 @@
+"""Exporte (und andere längere Vorgänge) als Hintergrund-Jobs
+
+Ein Export läuft in einem kleinen Thread-Pool des Workers, die Anfrage kehrt
+sofort mit einer Job-ID zurück. Status, Fortschritt und fertige Datei liegen
+im EXPORT_FOLDER, damit jeder gunicorn-Worker sie abfragen bzw. ausliefern
+kann. Abgelaufene Jobs werden beim nächsten Start eines Jobs aufgeräumt.
+Jobs ohne Datei (z.B. der Schuljahreswechsel) liefern nur eine Meldung.
+Solange ein Job wartet oder läuft, frischt sein Worker die Status-Datei
+regelmäßig auf; bleibt das aus (Worker neu gestartet), gilt er als abgebrochen.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.cache import write_atomic
+
+# Sekunden zwischen zwei Lebenszeichen bzw. ohne Lebenszeichen bis "abgebrochen"
+HEARTBEAT_INTERVAL = 30
+STALE_AFTER = 300
+
+_lock = threading.Lock()
+_executor = None
+_pending = 0
+_heartbeat = None
+_active = {}  # Job-ID -> Pfad der Status-Datei (wartende und laufende Jobs dieses Workers)
+
+
+class JobQueueFull(Exception):
+    """Zu viele Exporte gleichzeitig angefordert"""
+
+
+def init_app(app):
+    folder = app.config.setdefault('EXPORT_FOLDER', os.path.join(app.instance_path, 'exports'))
+    app.config.setdefault('EXPORT_WORKERS', 2)
+    app.config.setdefault('EXPORT_QUEUE_SIZE', 8)
+    app.config.setdefault('EXPORT_JOB_TTL', 3600)
+    os.makedirs(folder, exist_ok=True)
+
+
+def _folder():
+    return current_app.config['EXPORT_FOLDER']
+
+
+def _state_path(job_id):
+    return os.path.join(_folder(), f"{job_id}.json")
+
+
+def _result_path(job_id):
+    return os.path.join(_folder(), f"{job_id}.data")
+
+
+def get_job(job_id):
+    """Job-Status lesen (None wenn unbekannt oder abgelaufen)"""
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(_state_path(job_id), encoding='utf-8') as f:
+            job = json.load(f)
+            modified = os.fstat(f.fileno()).st_mtime
+    except (OSError, ValueError):
+        return None
+    
+    # Kein Lebenszeichen mehr: der Worker wurde beendet, der Job läuft nicht weiter
+    if job['status'] not in ('done', 'failed') and modified < time.time() - STALE_AFTER:
+        job.update(status='failed', message=f"{job['title']} abgebrochen (Server wurde neu gestartet)")
+    return job
+
+
+def pending_jobs(kind):
+    """Wartende und laufende Jobs dieser Art (aller Worker)"""
+    pending = []
+    for name in os.listdir(_folder()):
+        if not name.endswith('.json'):
+            continue
+        job = get_job(name[:-len('.json')])
+        if job and job['kind'] == kind and job['status'] in ('queued', 'running'):
+            pending.append(job)
+    return pending
+
+
+def result_path(job):
+    return _result_path(job['id'])
+
+
+def _save(job):
+    write_atomic(_state_path(job['id']), json.dumps(job))
+
+
+def cleanup_expired():
+    """Jobs (Status und Datei) älter als EXPORT_JOB_TTL entfernen"""
+    limit = time.time() - current_app.config['EXPORT_JOB_TTL']
+    for name in os.listdir(_folder()):
+        path = os.path.join(_folder(), name)
+        try:
+            if os.path.getmtime(path) < limit:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _beat():
+    """Status-Dateien wartender und laufender Jobs auffrischen (eigener Thread je Worker)"""
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        with _lock:
+            paths = list(_active.values())
+        for path in paths:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+
+class Job:
+    """Handle für den laufenden Export: Fortschritt melden"""
+    
+    def __init__(self, state):
+        self.state = state
+    
+    def progress(self, percent, message=None):
+        self.state['progress'] = percent
+        if message:
+            self.state['message'] = message
+        _save(self.state)
+
+
+def _run(app, state, builder):
+    global _pending
+    job = Job(state)
+    with app.app_context():
+        try:
+            state['status'] = 'running'
+            job.progress(0, f"{state['title']} läuft")
+            result = builder(job)
+            
+            message = 'Fertig'
+            if isinstance(result, str):
+                message = result
+            else:
+                output, download_name, mimetype = result
+                tmp_path = _result_path(state['id']) + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    if hasattr(output, 'read'):
+                        with output:
+                            shutil.copyfileobj(output, f)
+                    else:
+                        for chunk in output:
+                            f.write(chunk)
+                os.replace(tmp_path, _result_path(state['id']))
+                state.update(download_name=download_name, mimetype=mimetype)
+            
+            state.update(status='done', finished_at=time.time())
+            job.progress(100, message)
+        except Exception as e:
+            app.logger.exception('Job %s fehlgeschlagen', state['id'])
+            state.update(status='failed', message=f"Fehler beim {state['title']}: {e}", finished_at=time.time())
+            _save(state)
+        finally:
+            with _lock:
+                _pending -= 1
+                _active.pop(state['id'], None)
+
+
+def submit(kind, builder, user_id=None, title='Export'):
+    """builder(job) im Hintergrund ausführen; liefert den Job-Status (mit 'id')
+    
+    builder gibt (Datei-Objekt oder Byte-Blöcke, Dateiname, MIME-Typ) oder nur eine Meldung
+    zurück und läuft in einem eigenen App-Kontext - Datenbankobjekte dort neu laden, nicht
+    übergeben. title erscheint in den Meldungen ("Export läuft", "Fehler beim Export").
+    """
+    global _executor, _pending, _heartbeat
+    app = current_app._get_current_object()
+    with _lock:
+        if _pending >= app.config['EXPORT_QUEUE_SIZE']:
+            raise JobQueueFull('Zu viele Jobs in Arbeit, bitte später erneut versuchen.')
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['EXPORT_WORKERS'],
+                                           thread_name_prefix='export')
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_beat, name='export-heartbeat', daemon=True)
+            _heartbeat.start()
+        _pending += 1
+    
+    cleanup_expired()
+    state = {
+        'id': uuid.uuid4().hex,
+        'kind': kind,
+        'title': title,
+        'user_id': user_id,
+        'status': 'queued',
+        'progress': 0,
+        'message': 'Wartet',
+        'created_at': time.time()
+    }
+    _save(state)
+    submitted = dict(state)
+    with _lock:
+        _active[state['id']] = _state_path(state['id'])
+    try:
+        _executor.submit(_run, app, state, builder)
+    except RuntimeError:
+        with _lock:
+            _pending -= 1
+            _active.pop(state['id'], None)
+        raise
+    return submitted
@@ -0,0 +1,240 @@
+"""Schreiboperationen für Ausleihe und Rückgabe
+
+Ausleihen werden ohne vorherige Prüf-Abfragen angelegt: das Keyboard wird per
+bedingtem UPDATE reserviert, die Ausleihe direkt eingefügt. Doppelte aktive
+Ausleihen verhindern die eindeutigen Teil-Indizes uq_loans_active_keyboard und
+uq_loans_active_student - auch bei mehreren Workern gleichzeitig.
+"""
+from datetime import datetime
+from sqlalchemy import update, select, literal, bindparam, or_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Keyboard, Student, Loan
+
+CONDITIONS = {value for value, label in Keyboard.CONDITION_CHOICES}
+
+
+class LoanError(Exception):
+    """Ausleihe nicht möglich (Meldung ist für die Oberfläche gedacht)"""
+
+
+def create_loan(student_id, keyboard_id, fee_paid=None, created_by=None):
+    """Keyboard an Schüler ausleihen; liefert (loan_id, inventory_number)
+    
+    fee_paid=None übernimmt die Vorauszahlung (Student.fee_prepaid).
+    Commit übernimmt der Aufrufer, bei LoanError muss er zurückrollen.
+    """
+    now = datetime.utcnow()
+    
+    # Keyboard reservieren: greift nur, wenn es im Lager und in Ordnung ist
+    inventory_number = db.session.execute(
+        update(Keyboard).where(
+            Keyboard.id == keyboard_id,
+            Keyboard.status == 'im_lager',
+            Keyboard.condition == 'in_ordnung'
+        ).values(status='ausgeliehen').returning(Keyboard.inventory_number)
+    ).scalar()
+    if inventory_number is None:
+        raise LoanError('Keyboard nicht verfügbar')
+    
+    fee_column = Student.fee_prepaid if fee_paid is None else literal(bool(fee_paid))
+    try:
+        loan_id = db.session.execute(
+            insert(Loan).from_select(
+                ['keyboard_id', 'student_id', 'fee_paid', 'fee_amount', 'created_by', 'loaned_at', 'created_at'],
+                select(
+                    literal(keyboard_id), Student.id, fee_column, literal(10.0),
+                    literal(created_by), literal(now), literal(now)
+                ).where(Student.id == student_id)
+            ).returning(Loan.id)
+        ).scalar()
+    except IntegrityError as e:
+        if 'student_id' in str(e.orig):
+            raise LoanError('Schüler hat bereits ein Keyboard')
+        raise LoanError('Keyboard ist bereits ausgeliehen')
+    
+    if loan_id is None:
+        raise LoanError('Ungültige Auswahl')
+    return loan_id, inventory_number
+
+
+def plan_auto_assignment(class_id, start=None, end=None):
+    """Teilnehmende Schüler ohne Keyboard der Reihe nach verfügbaren Keyboards zuordnen
+    
+    Keyboards in internal_number-Reihenfolge, optional nur im Bereich start..end.
+    Liefert (Zuordnungen, Anzahl Schüler ohne Keyboard) - noch ohne Schreibzugriff.
+    """
+    active = select(Loan.id).where(Loan.student_id == Student.id, Loan.returned_at == None).exists()
+    students = db.session.execute(
+        select(Student.id, Student.last_name, Student.first_name, Student.fee_prepaid).where(
+            Student.class_id == class_id,
+            Student.participates_in_loan == True,
+            ~active
+        ).order_by(Student.last_name, Student.first_name, Student.id)
+    ).all()
+    if not students:
+        return [], 0
+    
+    keyboard_query = select(Keyboard.id, Keyboard.inventory_number, Keyboard.internal_number).where(
+        Keyboard.status == 'im_lager',
+        Keyboard.condition == 'in_ordnung'
+    )
+    if start is not None:
+        keyboard_query = keyboard_query.where(Keyboard.internal_number >= start)
+    if end is not None:
+        keyboard_query = keyboard_query.where(Keyboard.internal_number <= end)
+    # Keyboards ohne interne Nummer zuletzt (SQLite sortiert NULL sonst zuerst)
+    keyboards = db.session.execute(
+        keyboard_query.order_by(
+            Keyboard.internal_number.is_(None), Keyboard.internal_number, Keyboard.id
+        ).limit(len(students))
+    ).all()
+    
+    plan = [{
+        'student_id': student.id,
+        'student_name': f"{student.last_name}, {student.first_name}",
+        'fee_prepaid': bool(student.fee_prepaid),
+        'keyboard_id': keyboard.id,
+        'inventory_number': keyboard.inventory_number,
+        'internal_number': keyboard.internal_number
+    } for student, keyboard in zip(students, keyboards)]
+    return plan, len(students)
+
+
+def assign_keyboards(plan, created_by=None):
+    """Zuordnung aus plan_auto_assignment in einer Transaktion anlegen (Commit beim Aufrufer)"""
+    if not plan:
+        return 0
+    now = datetime.utcnow()
+    keyboard_ids = [row['keyboard_id'] for row in plan]
+    
+    reserved = db.session.execute(
+        update(Keyboard).where(
+            Keyboard.id.in_(keyboard_ids),
+            Keyboard.status == 'im_lager',
+            Keyboard.condition == 'in_ordnung'
+        ).values(status='ausgeliehen'),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if reserved != len(keyboard_ids):
+        raise LoanError('Keyboards wurden inzwischen anderweitig vergeben')
+    
+    try:
+        db.session.execute(insert(Loan), [{
+            'keyboard_id': row['keyboard_id'],
+            'student_id': row['student_id'],
+            'fee_paid': row['fee_prepaid'],
+            'fee_amount': 10.0,
+            'created_by': created_by,
+            'loaned_at': now,
+            'created_at': now
+        } for row in plan])
+    except IntegrityError:
+        raise LoanError('Mindestens ein Schüler hat inzwischen ein Keyboard')
+    return len(plan)
+
+
+def keyboard_state_after_return(condition):
+    """(Zustand, Status) des Keyboards nach Rückgabe - wie im Rückgabe-Formular"""
+    if condition == 'in_reparatur':
+        return 'in_reparatur', 'in_reparatur'
+    if condition == 'defekt':
+        return 'defekt', 'im_lager'
+    return 'in_ordnung', 'im_lager'
+
+
+def _parse_return_item(item):
+    """Eine Rückgabe-Angabe prüfen; liefert (loan_id, inventory_number, condition, notes)"""
+    if not isinstance(item, dict):
+        raise LoanError('Ungültige Angabe')
+    loan_id = item.get('loan_id')
+    number = item.get('inventory_number')
+    if loan_id:
+        if isinstance(loan_id, bool) or not isinstance(loan_id, (int, str)) or not str(loan_id).strip().isdigit():
+            raise LoanError(f'Ungültige Ausleih-ID: {loan_id}')
+        loan_id, number = int(loan_id), None
+    elif isinstance(number, (int, str)) and not isinstance(number, bool) and str(number).strip():
+        loan_id, number = None, str(number).strip()
+    else:
+        raise LoanError('Weder Ausleih-ID noch Inventarnummer angegeben')
+    condition = item.get('condition') or 'in_ordnung'
+    if condition not in CONDITIONS:
+        raise LoanError(f'Ungültiger Zustand: {condition}')
+    notes = item.get('notes')
+    if notes is not None and not isinstance(notes, str):
+        raise LoanError('Ungültige Notiz')
+    return loan_id, number, condition, (notes or '').strip() or None
+
+
+def return_loans(items):
+    """Mehrere aktive Ausleihen auf einmal zurücknehmen (Commit beim Aufrufer)
+    
+    items: Dicts mit loan_id oder inventory_number, dazu condition und notes.
+    Liefert (zurückgegebene Zeilen, nicht gefundene Angaben, ungültige Angaben).
+    Ungültige Angaben landen mit Fehlermeldung in der dritten Liste; die übrigen
+    Rückgaben werden trotzdem gebucht.
+    """
+    parsed = []
+    invalid = []
+    for item in items:
+        try:
+            parsed.append((item, *_parse_return_item(item)))
+        except LoanError as e:
+            invalid.append({'item': item, 'error': str(e)})
+    
+    loan_ids = {loan_id for item, loan_id, number, condition, notes in parsed if loan_id}
+    numbers = {number for item, loan_id, number, condition, notes in parsed if number}
+    if not loan_ids and not numbers:
+        return [], [], invalid
+    
+    # Alle Angaben in einer Abfrage auflösen
+    rows = db.session.execute(
+        select(Loan.id, Loan.keyboard_id, Keyboard.inventory_number, Student.last_name, Student.first_name)
+        .join(Keyboard, Loan.keyboard_id == Keyboard.id)
+        .join(Student, Loan.student_id == Student.id)
+        .where(Loan.returned_at == None, or_(Loan.id.in_(loan_ids), Keyboard.inventory_number.in_(numbers)))
+    ).all()
+    by_id = {row.id: row for row in rows}
+    by_number = {row.inventory_number: row for row in rows}
+    
+    returned = {}
+    not_found = []
+    for item, loan_id, number, condition, notes in parsed:
+        row = by_id.get(loan_id) if loan_id else by_number.get(number)
+        if row is None:
+            not_found.append(loan_id or number)
+            continue
+        returned[row.id] = (row, condition, notes)
+    
+    if not returned:
+        return [], not_found, invalid
+    now = datetime.utcnow()
+    
+    # Ausleihen: ein UPDATE-Statement, per executemany für alle Zeilen
+    updated = db.session.execute(
+        update(Loan.__table__).where(
+            Loan.__table__.c.id == bindparam('loan_id'),
+            Loan.__table__.c.returned_at == None
+        ).values(returned_at=now, return_condition=bindparam('condition'), return_notes=bindparam('notes')),
+        [{'loan_id': loan_id, 'condition': condition, 'notes': notes}
+         for loan_id, (row, condition, notes) in returned.items()]
+    ).rowcount
+    if updated != len(returned):
+        raise LoanError('Mindestens eine Ausleihe wurde inzwischen zurückgegeben')
+    
+    # Keyboards: ein UPDATE pro Zielzustand
+    groups = {}
+    for row, condition, notes in returned.values():
+        groups.setdefault(keyboard_state_after_return(condition), []).append(row.keyboard_id)
+    for (condition, status), keyboard_ids in groups.items():
+        db.session.execute(
+            update(Keyboard).where(Keyboard.id.in_(keyboard_ids)).values(condition=condition, status=status),
+            execution_options={'synchronize_session': False}
+        )
+    
+    return [{
+        'loan_id': row.id,
+        'inventory_number': row.inventory_number,
+        'student_name': f"{row.last_name}, {row.first_name}",
+        'condition': condition
+    } for row, condition, notes in returned.values()], not_found, invalid
@@ -2,12 +2,19 @@ from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.schema import CreateIndex
 
 db = SQLAlchemy()
 
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -18,6 +25,7 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -36,19 +44,32 @@ class User(UserMixin, db.Model):
 
 class SchoolYear(db.Model):
     __tablename__ = 'school_years'
+    __table_args__ = (
+        db.Index('ix_school_years_is_active', 'is_active'),
+        db.Index('ix_school_years_updated_at', 'updated_at'),
+        # Namen eindeutig - auch wenn zwei Schuljahreswechsel gleichzeitig laufen
+        db.Index('uq_school_years_name', 'name', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(20), nullable=False)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
     is_active = db.Column(db.Boolean, default=False)
+    # Gesetzt, wenn Klassen, Schüler und Ausleihen in der Archiv-Datei liegen (app.archive)
+    archived_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     classes = db.relationship('SchoolClass', backref='school_year', lazy='dynamic')
 
 
 class SchoolClass(db.Model):
     __tablename__ = 'school_classes'
+    __table_args__ = (
+        db.Index('ix_school_classes_year_grade', 'school_year_id', 'grade', 'name'),
+        db.Index('ix_school_classes_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(10), nullable=False)
@@ -58,38 +79,41 @@ class SchoolClass(db.Model):
     music_teacher = db.Column(db.String(100), nullable=True)
     loan_date = db.Column(db.Date, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     students = db.relationship('Student', backref='school_class', lazy='dynamic')
     
+    @property
+    def stats(self):
+        """Zähler der Klasse; in Listen vorab über app.stats.attach_class_stats geladen"""
+        if getattr(self, '_stats', None) is None:
+            from app.stats import attach_class_stats
+            attach_class_stats([self])
+        return self._stats
+    
     @property
     def student_count(self):
-        return self.students.count()
+        return self.stats.student_count
     
     @property
     def loan_count(self):
-        return Loan.query.join(Student).filter(
-            Student.class_id == self.id,
-            Loan.returned_at == None
-        ).count()
+        return self.stats.loan_count
     
     @property
     def paid_count(self):
-        return Loan.query.join(Student).filter(
-            Student.class_id == self.id,
-            Loan.returned_at == None,
-            Loan.fee_paid == True
-        ).count()
+        return self.stats.paid_count
     
     @property
     def returned_count(self):
-        return Loan.query.join(Student).filter(
-            Student.class_id == self.id,
-            Loan.returned_at != None
-        ).count()
+        return self.stats.returned_count
 
 
 class Student(db.Model):
     __tablename__ = 'students'
+    __table_args__ = (
+        db.Index('ix_students_class_name', 'class_id', 'last_name', 'first_name'),
+        db.Index('ix_students_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     last_name = db.Column(db.String(100), nullable=False)
@@ -99,6 +123,7 @@ class Student(db.Model):
     fee_prepaid = db.Column(db.Boolean, default=False)  # Gebühr bezahlt VOR Keyboard-Vergabe
     notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     loans = db.relationship('Loan', backref='student', lazy='dynamic')
     
@@ -123,6 +148,11 @@ class Student(db.Model):
 
 class Keyboard(db.Model):
     __tablename__ = 'keyboards'
+    __table_args__ = (
+        db.Index('ix_keyboards_status_condition', 'status', 'condition'),
+        db.Index('ix_keyboards_internal_number', 'internal_number', 'id'),
+        db.Index('ix_keyboards_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     inventory_number = db.Column(db.String(20), unique=True, nullable=False)
@@ -159,6 +189,18 @@ class Keyboard(db.Model):
 
 class Loan(db.Model):
     __tablename__ = 'loans'
+    __table_args__ = (
+        db.Index('ix_loans_student_id', 'student_id', 'loaned_at'),
+        db.Index('ix_loans_keyboard_id', 'keyboard_id', 'loaned_at'),
+        db.Index('ix_loans_loaned_at', 'loaned_at', 'id'),
+        db.Index('ix_loans_returned_at', 'returned_at'),
+        # Nur aktive Ausleihen (returned_at IS NULL) - klein und passend für die häufigsten Filter
+        db.Index('ix_loans_active_loaned_at', 'loaned_at', 'id', sqlite_where=db.text('returned_at IS NULL')),
+        # Pro Keyboard und pro Schüler höchstens eine aktive Ausleihe - auch bei gleichzeitigen Anfragen
+        db.Index('uq_loans_active_keyboard', 'keyboard_id', unique=True, sqlite_where=db.text('returned_at IS NULL')),
+        db.Index('uq_loans_active_student', 'student_id', unique=True, sqlite_where=db.text('returned_at IS NULL')),
+        db.Index('ix_loans_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     keyboard_id = db.Column(db.Integer, db.ForeignKey('keyboards.id'), nullable=False)
@@ -171,6 +213,7 @@ class Loan(db.Model):
     fee_amount = db.Column(db.Float, default=10.0)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     created_by_user = db.relationship('User', foreign_keys=[created_by])
     
@@ -181,6 +224,9 @@ class Loan(db.Model):
 
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
+    __table_args__ = (
+        db.Index('ix_audit_logs_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
@@ -192,3 +238,63 @@ class AuditLog(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref='audit_logs')
+
+
+class DeletedRow(db.Model):
+    """Gelöschte Zeilen für Delta-Backups (per Trigger befüllt, siehe ensure_delete_triggers)"""
+    __tablename__ = 'deleted_rows'
+    __table_args__ = (
+        db.Index('ix_deleted_rows_deleted_at', 'deleted_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+
+
+def ensure_columns():
+    """Neue Spalten in bestehenden Tabellen ergänzen; updated_at startet mit created_at"""
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            # Nur nullable Spalten ohne Server-Default - mehr kann ALTER TABLE in SQLite nicht
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}"
+            try:
+                with db.engine.begin() as conn:
+                    conn.exec_driver_sql(ddl)
+                    if column.name == 'updated_at' and 'created_at' in existing:
+                        conn.exec_driver_sql(f"UPDATE {table.name} SET updated_at = created_at")
+            except OperationalError as e:
+                # Ein anderer gunicorn-Worker war schneller
+                if 'duplicate column' not in str(e):
+                    raise
+
+
+def ensure_delete_triggers():
+    """Löschungen in Tabellen mit updated_at nach deleted_rows protokollieren (für Delta-Backups)"""
+    for table in db.metadata.sorted_tables:
+        if 'updated_at' not in table.c:
+            continue
+        with db.engine.begin() as conn:
+            # Zeitstempel in UTC wie datetime.utcnow, als Text vergleichbar mit den DateTime-Spalten
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table.name}_deleted AFTER DELETE ON {table.name} BEGIN "
+                f"INSERT INTO deleted_rows (table_name, row_id, deleted_at) "
+                f"VALUES ('{table.name}', OLD.id, strftime('%Y-%m-%d %H:%M:%f', 'now')); END"
+            )
+
+
+def ensure_indexes():
+    """Fehlende Indizes in bestehenden Datenbanken anlegen (create_all legt sie nur für neue Tabellen an)"""
+    for table in db.metadata.sorted_tables:
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            try:
+                with db.engine.begin() as conn:
+                    # IF NOT EXISTS: mehrere gunicorn-Worker starten gleichzeitig
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+            except IntegrityError:
+                # Eindeutiger Index scheitert an Altdaten (z.B. doppelte aktive Ausleihen)
+                current_app.logger.warning('Index %s nicht angelegt: widersprüchliche Daten in %s', index.name, table.name)
@@ -0,0 +1,147 @@
+"""Keyset-Paginierung und gestreamtes Rendern für lange Listen
+
+Statt OFFSET merkt sich der Cursor die Sortierwerte der letzten Zeile. Die
+nächste Seite beginnt per WHERE direkt dahinter und nutzt so den Index der
+Sortierspalten, egal wie weit geblättert wurde.
+"""
+import base64
+import json
+from datetime import date, datetime
+from flask import current_app, request, url_for, stream_template, stream_with_context, render_template
+from sqlalchemy import and_, or_, false
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    """Sortierwert aus dem Cursor; nur Skalare und markierte Datumswerte (sonst ValueError)"""
+    if isinstance(value, dict):
+        if value.keys() == {'dt'}:
+            return datetime.fromisoformat(value['dt'])
+        if value.keys() == {'d'}:
+            return date.fromisoformat(value['d'])
+        raise ValueError('unbekannter Cursor-Wert')
+    if value is not None and not isinstance(value, (str, int, float)):
+        raise ValueError('unbekannter Cursor-Wert')
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Cursor aus der URL lesen; ungültige Cursor starten bei der ersten Seite"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list):
+            return None
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        return None
+    return values if len(values) == length else None
+
+
+def _after(column, value, descending):
+    """Zeilen hinter value in Sortierrichtung (SQLite: NULL zuerst bei ASC, zuletzt bei DESC)"""
+    if descending:
+        return false() if value is None else or_(column < value, column == None)
+    return column != None if value is None else column > value
+
+
+def _equal(column, value):
+    return column == None if value is None else column == value
+
+
+def keyset_filter(keys, values):
+    """WHERE-Bedingung für (k1, k2, ...) > (v1, v2, ...) in der Sortierung von keys"""
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        prefix = [_equal(keys[j][0], values[j]) for j in range(i)]
+        clauses.append(and_(*prefix, _after(column, values[i], descending)))
+    return or_(*clauses)
+
+
+def page_size():
+    """Seitengröße aus ?per_page, begrenzt auf MAX_PAGE_SIZE"""
+    default = current_app.config['PAGE_SIZE']
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page, current_app.config['MAX_PAGE_SIZE']))
+
+
+def stream_requested():
+    """Gestreamtes Rendern per Konfiguration oder ?stream=1"""
+    return current_app.config['STREAM_LISTS'] or request.args.get('stream') == '1'
+
+
+class KeysetPage:
+    """Eine Seite einer sortierten Abfrage; Zeilen werden erst beim Iterieren geladen
+    
+    keys: Liste von (Spalte, absteigend) - die letzte Spalte muss eindeutig sein.
+    key_of: liefert die Sortierwerte einer (umgewandelten) Zeile für den nächsten Cursor.
+    """
+    
+    def __init__(self, query, keys, key_of, cursor=None, per_page=100, transform=None, stream=False):
+        self.per_page = per_page
+        self.cursor = cursor
+        self.key_of = key_of
+        self.transform = transform
+        self.stream = stream
+        self.count = 0
+        self.next_cursor = None
+        
+        values = decode_cursor(cursor, len(keys))
+        if values is not None:
+            query = query.filter(keyset_filter(keys, values))
+        self.query = query.order_by(
+            *[column.desc() if descending else column.asc() for column, descending in keys]
+        ).limit(per_page + 1)
+    
+    def _rows(self):
+        if self.stream:
+            return self.query.yield_per(min(self.per_page, 200))
+        return self.query.all()
+    
+    def __iter__(self):
+        self.count = 0
+        self.next_cursor = None
+        last = None
+        for row in self._rows():
+            if self.count == self.per_page:
+                # Zusätzliche Zeile vorhanden -> es gibt eine nächste Seite
+                self.next_cursor = encode_cursor(self.key_of(last))
+                break
+            last = self.transform(row) if self.transform else row
+            self.count += 1
+            yield last
+    
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+    
+    def next_url(self):
+        args = request.args.to_dict()
+        args['after'] = self.next_cursor
+        return url_for(request.endpoint, **request.view_args, **args)
+    
+    def first_url(self):
+        args = request.args.to_dict()
+        args.pop('after', None)
+        return url_for(request.endpoint, **request.view_args, **args)
+
+
+def render_list(template, **context):
+    """Liste normal oder gestreamt rendern (erste Bytes vor der letzten Zeile)"""
+    if stream_requested():
+        return current_app.response_class(stream_with_context(stream_template(template, **context)))
+    return render_template(template, **context)
@@ -0,0 +1,90 @@
+"""Vorab geladene Datensätze für Listenansichten (vermeidet N+1-Abfragen)"""
+from collections import namedtuple
+from sqlalchemy import and_
+from app.models import db, SchoolClass, Student, Loan, Keyboard
+
+
+class RosterEntry(namedtuple('RosterEntry', 'student loan keyboard last_loan last_keyboard returned_count')):
+    """Eine Zeile der Klassenliste: Schüler mit aktiver und letzter Ausleihe"""
+    __slots__ = ()
+    
+    @property
+    def has_keyboard(self):
+        return self.loan is not None
+    
+    @property
+    def participates(self):
+        return self.student.participates_in_loan or self.loan is not None
+    
+    @property
+    def fee_paid(self):
+        """Bezahlt = Loan.fee_paid, ohne Keyboard Student.fee_prepaid"""
+        if self.loan:
+            return self.loan.fee_paid
+        return self.student.participates_in_loan and self.student.fee_prepaid
+    
+    @property
+    def fee_open(self):
+        if self.loan:
+            return not self.loan.fee_paid
+        return self.student.participates_in_loan and not self.student.fee_prepaid
+
+
+def load_class_roster(class_id):
+    """Schüler einer Klasse mit aktiver/letzter Ausleihe und Keyboard in einer Abfrage laden"""
+    rows = db.session.query(Student, Loan, Keyboard).outerjoin(
+        Loan, Loan.student_id == Student.id
+    ).outerjoin(
+        Keyboard, Keyboard.id == Loan.keyboard_id
+    ).filter(
+        Student.class_id == class_id
+    ).order_by(
+        Student.last_name, Student.first_name, Student.id, Loan.loaned_at.desc()
+    ).all()
+    
+    roster = []
+    current = None
+    for student, loan, keyboard in rows:
+        if current is None or current['student'] is not student:
+            current = {'student': student, 'loan': None, 'keyboard': None,
+                       'last_loan': None, 'last_keyboard': None, 'returned_count': 0}
+            roster.append(current)
+        if loan is None:
+            continue
+        # Erste Zeile je Schüler = neueste Ausleihe (Sortierung nach loaned_at)
+        if current['last_loan'] is None:
+            current['last_loan'] = loan
+            current['last_keyboard'] = keyboard
+        if loan.returned_at is not None:
+            current['returned_count'] += 1
+        elif current['loan'] is None:
+            current['loan'] = loan
+            current['keyboard'] = keyboard
+    
+    return [RosterEntry(**entry) for entry in roster]
+
+
+class KeyboardRow(namedtuple('KeyboardRow', 'id inventory_number internal_number status condition notes '
+                                            'loan_id student_id last_name first_name class_id class_name')):
+    """Eine Zeile des Inventars: Keyboard mit aktuellem Ausleiher"""
+    __slots__ = ()
+    
+    @property
+    def student_full_name(self):
+        return f"{self.last_name}, {self.first_name}" if self.student_id else None
+
+
+def keyboard_rows_query(query):
+    """Keyboard-Abfrage (inkl. Filter) um aktive Ausleihe, Schüler und Klasse erweitern (Zeilen -> KeyboardRow)"""
+    return query.outerjoin(
+        Loan, and_(Loan.keyboard_id == Keyboard.id, Loan.returned_at == None)
+    ).outerjoin(
+        Student, Student.id == Loan.student_id
+    ).outerjoin(
+        SchoolClass, SchoolClass.id == Student.class_id
+    ).with_entities(
+        Keyboard.id, Keyboard.inventory_number, Keyboard.internal_number,
+        Keyboard.status, Keyboard.condition, Keyboard.notes,
+        Loan.id, Student.id, Student.last_name, Student.first_name,
+        SchoolClass.id, SchoolClass.name
+    )
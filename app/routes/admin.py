@@ -1,8 +1,13 @@
-from datetime import date
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from datetime import date, datetime
+from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, abort, current_app
 from flask_login import login_required, current_user
-from app import db
+from app import db, snapshots, jobs, archive
 from app.models import User, SchoolYear, SchoolClass, AuditLog
+from app.queries import load_class_roster
+from app.stats import attach_class_stats
+from app.export import export_full_backup
+from app.routes.export import XLSX_MIMETYPE
+from app.transition import TransitionPlan, run_transition
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -99,6 +104,10 @@ def edit_school_year(id):
         year.end_date = date.fromisoformat(request.form.get('end_date'))
         is_active = request.form.get('is_active') == 'on'
         
+        if is_active and year.archived_at:
+            flash(f'Schuljahr {year.name} ist archiviert und kann nicht aktiviert werden.', 'error')
+            return render_template('admin/school_year_form.html', year=year)
+        
         if is_active and not year.is_active:
             SchoolYear.query.update({SchoolYear.is_active: False})
         year.is_active = is_active
@@ -114,8 +123,11 @@ def edit_school_year(id):
 @login_required
 @admin_required
 def activate_school_year(id):
-    SchoolYear.query.update({SchoolYear.is_active: False})
     year = SchoolYear.query.get_or_404(id)
+    if year.archived_at:
+        flash(f'Schuljahr {year.name} ist archiviert und kann nicht aktiviert werden.', 'error')
+        return redirect(url_for('admin.school_years'))
+    SchoolYear.query.update({SchoolYear.is_active: False})
     year.is_active = True
     db.session.commit()
     
@@ -133,6 +145,10 @@ def delete_school_year(id):
         flash('Das aktive Schuljahr kann nicht gelöscht werden.', 'error')
         return redirect(url_for('admin.school_years'))
     
+    if year.archived_at:
+        flash(f'Schuljahr {year.name} ist archiviert - die Daten liegen in der Archiv-Datei.', 'error')
+        return redirect(url_for('admin.school_years'))
+    
     # Prüfen ob noch Klassen mit Schülern existieren
     has_students = False
     for cls in year.classes:
@@ -156,6 +172,93 @@ def delete_school_year(id):
     return redirect(url_for('admin.school_years'))
 
 
+# --- Archiv ---
+
+@admin_bp.route('/school-years/<int:id>/archive', methods=['POST'])
+@login_required
+@admin_required
+def archive_school_year(id):
+    """Klassen, Schüler und Ausleihen eines abgeschlossenen Schuljahres ins Archiv verschieben"""
+    year = SchoolYear.query.get_or_404(id)
+    try:
+        counts = archive.archive_school_year(id)
+    except archive.ArchiveError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.school_years'))
+    
+    summary = (f"{counts['school_classes']} Klassen, {counts['students']} Schüler, "
+               f"{counts['loans']} Ausleihen")
+    db.session.add(AuditLog(
+        user_id=current_user.id,
+        action='school_year_archive',
+        entity_type='school_year',
+        entity_id=id,
+        details=f"Schuljahr {year.name} archiviert: {summary}",
+        ip_address=request.remote_addr
+    ))
+    db.session.commit()
+    
+    flash(f'Schuljahr {year.name} wurde archiviert ({summary}).', 'success')
+    return redirect(url_for('admin.school_years'))
+
+
+def _archived_year(id):
+    """Archiviertes Schuljahr aus der laufenden Datenbank (404 wenn nicht archiviert)"""
+    year = SchoolYear.query.get_or_404(id)
+    if not year.archived_at:
+        abort(404)
+    return year
+
+
+@admin_bp.route('/archive/<int:id>')
+@login_required
+@admin_required
+def archive_year(id):
+    """Klassen eines archivierten Schuljahres (nur lesen)"""
+    year = _archived_year(id)
+    try:
+        with archive.reading():
+            classes = SchoolClass.query.filter_by(school_year_id=id).order_by(SchoolClass.name).all()
+            attach_class_stats(classes)
+            return render_template('admin/archive_year.html', year=year, classes=classes)
+    except archive.ArchiveError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.school_years'))
+
+
+@admin_bp.route('/archive/<int:id>/classes/<int:class_id>')
+@login_required
+@admin_required
+def archive_class(id, class_id):
+    """Schülerliste einer archivierten Klasse mit letzter Ausleihe (nur lesen)"""
+    year = _archived_year(id)
+    try:
+        with archive.reading():
+            school_class = SchoolClass.query.filter_by(id=class_id, school_year_id=id).first_or_404()
+            roster = load_class_roster(class_id)
+            return render_template('admin/archive_class.html', year=year, school_class=school_class, roster=roster)
+    except archive.ArchiveError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.school_years'))
+
+
+@admin_bp.route('/archive/<int:id>/export')
+@login_required
+@admin_required
+def archive_export(id):
+    """Excel-Backup eines archivierten Schuljahres (wie das Backup des aktiven Jahres)"""
+    year = _archived_year(id)
+    try:
+        with archive.reading():
+            output = export_full_backup(SchoolYear.query.get_or_404(id))
+    except archive.ArchiveError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.school_years'))
+    
+    filename = f"keyboard_archiv_{year.name.replace('/', '-')}_{datetime.now().strftime('%Y%m%d')}.xlsx"
+    return send_file(output, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename)
+
+
 # --- Benutzer ---
 
 @admin_bp.route('/users')
@@ -255,134 +358,149 @@ def audit_log():
     return render_template('admin/audit_log.html', logs=logs)
 
 
+# --- Datenbank-Snapshots ---
+
+@admin_bp.route('/snapshots')
+@login_required
+@admin_required
+def snapshot_list():
+    return render_template('admin/snapshots.html',
+        snapshots=snapshots.list_snapshots(),
+        keep=current_app.config['SNAPSHOT_KEEP']
+    )
+
+
+@admin_bp.route('/snapshots/create', methods=['POST'])
+@login_required
+@admin_required
+def snapshot_create():
+    try:
+        name = snapshots.create_snapshot()
+    except snapshots.SnapshotError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.snapshot_list'))
+    
+    log = AuditLog(
+        user_id=current_user.id,
+        action='snapshot_create',
+        entity_type='database',
+        details=f"Snapshot {name}",
+        ip_address=request.remote_addr
+    )
+    db.session.add(log)
+    db.session.commit()
+    
+    flash(f'Snapshot {name} wurde erstellt.', 'success')
+    return redirect(url_for('admin.snapshot_list'))
+
+
+@admin_bp.route('/snapshots/<name>/download')
+@login_required
+@admin_required
+def snapshot_download(name):
+    path = snapshots.snapshot_path(name)
+    if not path:
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=name)
+
+
+@admin_bp.route('/snapshots/<name>/restore', methods=['POST'])
+@login_required
+@admin_required
+def snapshot_restore(name):
+    user_id = current_user.id
+    with_deltas = bool(request.form.get('with_deltas'))
+    try:
+        safety = snapshots.restore_snapshot(name, with_deltas=with_deltas)
+    except snapshots.SnapshotError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.snapshot_list'))
+    
+    # Der Eintrag landet in der wiederhergestellten Datenbank
+    log = AuditLog(
+        user_id=user_id,
+        action='snapshot_restore',
+        entity_type='database',
+        details=f"Snapshot {name}{' inkl. Deltas' if with_deltas else ''} wiederhergestellt, vorheriger Stand: {safety}",
+        ip_address=request.remote_addr
+    )
+    db.session.add(log)
+    db.session.commit()
+    
+    flash(f'Snapshot {name} wurde wiederhergestellt. Der vorherige Stand ist als {safety} gesichert.', 'success')
+    return redirect(url_for('admin.snapshot_list'))
+
+
 # --- Schuljahreswechsel ---
 
 @admin_bp.route('/school-year-transition', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def school_year_transition():
-    """Schuljahreswechsel: 5er werden zu 6ern, neue 5er-Klassen"""
+    """Schuljahreswechsel: 5er werden zu 6ern, neue 5er-Klassen (läuft als Hintergrund-Job)"""
     current_year = SchoolYear.query.filter_by(is_active=True).first()
     
     if not current_year:
         flash('Kein aktives Schuljahr vorhanden.', 'error')
         return redirect(url_for('admin.school_years'))
     
-    # Statistiken für Vorschau
-    classes_5 = SchoolClass.query.filter_by(school_year_id=current_year.id, grade=5).all()
-    classes_6 = SchoolClass.query.filter_by(school_year_id=current_year.id, grade=6).all()
-    
-    # Aktive Ausleihen in 5er-Klassen
-    from app.models import Loan, Student
-    active_loans_5 = Loan.query.join(Student).join(SchoolClass).filter(
-        SchoolClass.school_year_id == current_year.id,
-        SchoolClass.grade == 5,
-        Loan.returned_at == None
-    ).count()
-    
-    # Noch nicht zurückgegebene Keyboards in 6er-Klassen
-    active_loans_6 = Loan.query.join(Student).join(SchoolClass).filter(
-        SchoolClass.school_year_id == current_year.id,
-        SchoolClass.grade == 6,
-        Loan.returned_at == None
-    ).count()
+    # Vorschau: Klassen mit Zählern aus einer Aggregat-Abfrage (dieselbe wie beim Wechsel)
+    plan = TransitionPlan(current_year)
+    preview = dict(
+        current_year=current_year,
+        classes_5=plan.classes_5,
+        classes_6=plan.classes_6,
+        active_loans_5=plan.active_loans_5,
+        active_loans_6=plan.active_loans_6
+    )
     
     if request.method == 'POST':
         new_year_name = request.form.get('new_year_name', '').strip()
-        start_date = request.form.get('start_date')
-        end_date = request.form.get('end_date')
         
+        try:
+            start_date = date.fromisoformat(request.form.get('start_date', ''))
+            end_date = date.fromisoformat(request.form.get('end_date', ''))
+        except ValueError:
+            start_date = end_date = None
         if not new_year_name or not start_date or not end_date:
             flash('Alle Felder sind erforderlich.', 'error')
-            return render_template('admin/school_year_transition.html',
-                current_year=current_year,
-                classes_5=classes_5,
-                classes_6=classes_6,
-                active_loans_5=active_loans_5,
-                active_loans_6=active_loans_6
-            )
+            return render_template('admin/school_year_transition.html', **preview, form_data=request.form)
+        
+        if SchoolYear.query.filter_by(name=new_year_name).first():
+            flash(f'Schuljahr {new_year_name} gibt es bereits.', 'error')
+            return render_template('admin/school_year_transition.html', **preview, form_data=request.form)
         
         # Warnung wenn noch 6er-Ausleihen offen
-        if active_loans_6 > 0 and not request.form.get('confirm_6_open'):
-            flash(f'Achtung: Es gibt noch {active_loans_6} nicht zurückgegebene Keyboards in Jahrgang 6! Bitte bestätigen oder zuerst Rückgaben abschließen.', 'warning')
-            return render_template('admin/school_year_transition.html',
-                current_year=current_year,
-                classes_5=classes_5,
-                classes_6=classes_6,
-                active_loans_5=active_loans_5,
-                active_loans_6=active_loans_6,
+        if plan.active_loans_6 > 0 and not request.form.get('confirm_6_open'):
+            flash(f'Achtung: Es gibt noch {plan.active_loans_6} nicht zurückgegebene Keyboards in Jahrgang 6! Bitte bestätigen oder zuerst Rückgaben abschließen.', 'warning')
+            return render_template('admin/school_year_transition.html', **preview,
                 show_confirm=True,
                 form_data=request.form
             )
         
-        # Neues Schuljahr anlegen
-        new_year = SchoolYear(
-            name=new_year_name,
-            start_date=date.fromisoformat(start_date),
-            end_date=date.fromisoformat(end_date),
-            is_active=False
-        )
-        db.session.add(new_year)
-        db.session.flush()  # ID generieren
-        
-        students_moved = 0
-        loans_moved = 0
-        
-        # Für jede 5er-Klasse: 6er-Klasse im neuen Jahr anlegen
-        for cls5 in classes_5:
-            letter = cls5.name[-1]  # A, B, C, D
-            
-            # Neue 6er-Klasse
-            new_cls6 = SchoolClass(
-                name=f"6{letter}",
-                grade=6,
-                school_year_id=new_year.id,
-                class_teacher=cls5.class_teacher,
-                music_teacher=cls5.music_teacher
-            )
-            db.session.add(new_cls6)
-            db.session.flush()
-            
-            # Schüler verschieben
-            for student in cls5.students:
-                student.class_id = new_cls6.id
-                students_moved += 1
-                
-                # Aktive Ausleihe? Zählen
-                if student.current_loan:
-                    loans_moved += 1
-        
-        # Neue leere 5er-Klassen anlegen
-        for letter in ['A', 'B', 'C', 'D']:
-            new_cls5 = SchoolClass(
-                name=f"5{letter}",
-                grade=5,
-                school_year_id=new_year.id
-            )
-            db.session.add(new_cls5)
+        # Nur ein Wechsel zur Zeit (der Job prüft unter der Schreibsperre noch einmal)
+        running = jobs.pending_jobs('school_year_transition')
+        if running:
+            flash('Ein Schuljahreswechsel läuft bereits.', 'warning')
+            return redirect(url_for('admin.school_year_transition_job', job_id=running[0]['id']))
         
-        # Altes Schuljahr deaktivieren, neues aktivieren
-        current_year.is_active = False
-        new_year.is_active = True
+        year_id = current_year.id
+        user_id = current_user.id
+        ip_address = request.remote_addr
         
-        # Audit-Log
-        log = AuditLog(
-            user_id=current_user.id,
-            action='school_year_transition',
-            entity_type='school_year',
-            entity_id=new_year.id,
-            details=f"Schuljahreswechsel: {current_year.name} → {new_year.name}. "
-                    f"{students_moved} Schüler in 6er-Klassen übernommen, "
-                    f"{loans_moved} aktive Ausleihen übertragen.",
-            ip_address=request.remote_addr
-        )
-        db.session.add(log)
+        def build(job):
+            summary = run_transition(year_id, new_year_name, start_date, end_date,
+                                     user_id=user_id, ip_address=ip_address, progress=job.progress)
+            db.session.commit()
+            return summary
         
-        db.session.commit()
+        try:
+            job = jobs.submit('school_year_transition', build, user_id=user_id, title='Schuljahreswechsel')
+        except jobs.JobQueueFull as e:
+            flash(str(e), 'error')
+            return render_template('admin/school_year_transition.html', **preview, form_data=request.form)
         
-        flash(f'Schuljahreswechsel erfolgreich! {students_moved} Schüler wurden in die neuen 6er-Klassen übernommen, '
-              f'{loans_moved} aktive Ausleihen wurden übertragen. Neue 5er-Klassen sind bereit für den Import.', 'success')
-        return redirect(url_for('admin.school_years'))
+        return redirect(url_for('admin.school_year_transition_job', job_id=job['id']))
     
     # Vorschlag für nächstes Schuljahr
     import re
@@ -393,11 +511,15 @@ def school_year_transition():
     else:
         suggested_name = ""
     
-    return render_template('admin/school_year_transition.html',
-        current_year=current_year,
-        classes_5=classes_5,
-        classes_6=classes_6,
-        active_loans_5=active_loans_5,
-        active_loans_6=active_loans_6,
-        suggested_name=suggested_name
-    )
+    return render_template('admin/school_year_transition.html', **preview, suggested_name=suggested_name)
+
+
+@admin_bp.route('/school-year-transition/jobs/<job_id>')
+@login_required
+@admin_required
+def school_year_transition_job(job_id):
+    """Fortschritt und Ergebnis eines laufenden Schuljahreswechsels"""
+    job = jobs.get_job(job_id)
+    if not job or job['kind'] != 'school_year_transition':
+        abort(404)
+    return render_template('admin/school_year_transition_job.html', job=job)
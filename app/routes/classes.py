@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import db
-from app.models import SchoolClass, SchoolYear, Student, Loan, Keyboard
+from app.models import SchoolClass, SchoolYear, Keyboard
+from app.queries import load_class_roster
+from app.stats import attach_class_stats
 
 classes_bp = Blueprint('classes', __name__, url_prefix='/classes')
 
@@ -23,6 +25,9 @@ def index():
         classes_6 = SchoolClass.query.filter_by(
             school_year_id=active_year.id, grade=6
         ).order_by(SchoolClass.name).all()
+        
+        # Alle Zähler in einer Abfrage statt vier pro Klasse
+        attach_class_stats(classes_5 + classes_6)
     
     return render_template('classes/index.html',
         active_year=active_year,
@@ -37,34 +42,24 @@ def detail(id):
     """Klassendetails mit Schülerliste, Bezahlstatus und Anmerkungen"""
     school_class = SchoolClass.query.get_or_404(id)
     
-    students = Student.query.filter_by(class_id=id).order_by(
-        Student.last_name, Student.first_name
-    ).all()
+    # Schüler inkl. Ausleihe/Keyboard vorab laden (konstante Anzahl Abfragen)
+    roster = load_class_roster(id)
     
     # Statistiken
-    total_students = len(students)
-    with_keyboard = sum(1 for s in students if s.current_loan)
+    total_students = len(roster)
+    with_keyboard = sum(1 for entry in roster if entry.has_keyboard)
     without_keyboard = total_students - with_keyboard
     
     # Für 5er: Teilnehmer zählen (inkl. die ohne Keyboard)
-    participants = sum(1 for s in students if s.participates_in_loan or s.current_loan)
+    participants = sum(1 for entry in roster if entry.participates)
     
     # Gebühren: Bezahlt = Loan.fee_paid ODER Student.fee_prepaid
-    fees_paid = sum(1 for s in students if 
-        (s.current_loan and s.current_loan.fee_paid) or 
-        (not s.current_loan and s.participates_in_loan and s.fee_prepaid)
-    )
+    fees_paid = sum(1 for entry in roster if entry.fee_paid)
     # Offen = Teilnehmer ohne bezahlt
-    fees_unpaid = sum(1 for s in students if
-        (s.current_loan and not s.current_loan.fee_paid) or
-        (not s.current_loan and s.participates_in_loan and not s.fee_prepaid)
-    )
+    fees_unpaid = sum(1 for entry in roster if entry.fee_open)
     
     # Für Rückgabe: Anzahl bereits zurückgegeben
-    returned = Loan.query.join(Student).filter(
-        Student.class_id == id,
-        Loan.returned_at != None
-    ).count()
+    returned = sum(entry.returned_count for entry in roster)
     
     # Verfügbare Keyboards für Ausleihe
     available_keyboards = Keyboard.query.filter_by(
@@ -73,7 +68,7 @@ def detail(id):
     
     return render_template('classes/detail.html',
         school_class=school_class,
-        students=students,
+        roster=roster,
         total_students=total_students,
         with_keyboard=with_keyboard,
         without_keyboard=without_keyboard,
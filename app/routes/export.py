@@ -1,12 +1,58 @@
 """Export-Routen für Excel-Downloads"""
+import os
 from datetime import datetime
-from flask import Blueprint, send_file, flash, redirect, url_for
+from flask import Blueprint, Response, send_file, flash, redirect, url_for, request, jsonify, abort, stream_with_context
 from flask_login import login_required, current_user
 from app.models import SchoolYear, SchoolClass
-from app.export import export_full_backup, export_full_backup_zip, export_class_list, export_payment_list
+from app.export import export_full_backup_zip, export_class_list, export_payment_list
+from app import jobs, cache
 
 export_bp = Blueprint('export', __name__, url_prefix='/export')
 
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Tabellen, deren Inhalt in Klassen- und Gebührenliste steht
+EXPORT_TABLES = {'school_years', 'school_classes', 'students', 'loans', 'keyboards'}
+
+
+def _backup_file(school_year, progress=None):
+    """Backup-ZIP als Block-Iterator: (Blöcke, Dateiname, MIME-Typ)"""
+    chunks = export_full_backup_zip(school_year, progress=progress)
+    filename = f"keyboard_backup_{school_year.name.replace('/', '-')}_{datetime.now().strftime('%Y%m%d')}.zip"
+    return chunks, filename, 'application/zip'
+
+
+def _class_list_file(school_class):
+    """Klassenliste aus dem Datei-Cache: (geöffnete Datei, ETag, Dateiname)"""
+    file, etag = cache.get_file(
+        {'export': 'class', 'id': school_class.id}, EXPORT_TABLES,
+        lambda: export_class_list(school_class)
+    )
+    return file, etag, f"klasse_{school_class.name}_{datetime.now().strftime('%Y%m%d')}.xlsx"
+
+
+def _payments_file(school_year):
+    """Gebührenliste aus dem Datei-Cache: (geöffnete Datei, ETag, Dateiname)"""
+    today = datetime.now().strftime('%Y%m%d')
+    # Die Liste enthält das Tagesdatum ("Stand"): es gehört zum Stand, nicht zum Schlüssel,
+    # damit die Datei vom Vortag beim nächsten Erzeugen ersetzt wird
+    file, etag = cache.get_file(
+        {'export': 'payments', 'id': school_year.id}, EXPORT_TABLES,
+        lambda: export_payment_list(school_year), version=today
+    )
+    return file, etag, f"gebuehren_{school_year.name.replace('/', '-')}_{today}.xlsx"
+
+
+def _send_cached(file, etag, filename):
+    """Excel-Datei aus dem Cache mit ETag/Last-Modified senden (304 wenn unverändert)"""
+    stat = os.fstat(file.fileno())
+    response = send_file(file, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename,
+                         etag=etag, last_modified=stat.st_mtime)
+    if response.status_code == 200:
+        response.content_length = stat.st_size
+    response.cache_control.private = True
+    return response
+
 
 @export_bp.route('/backup')
 @login_required
@@ -19,15 +65,11 @@ def backup():
         return redirect(url_for('main.dashboard'))
     
     try:
-        output = export_full_backup_zip(active_year)
-        filename = f"keyboard_backup_{active_year.name.replace('/', '-')}_{datetime.now().strftime('%Y%m%d')}.zip"
-        
-        return send_file(
-            output,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=filename
-        )
+        chunks, filename, mimetype = _backup_file(active_year)
+        # ZIP wird während der Übertragung erzeugt
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        })
     except Exception as e:
         flash(f'Fehler beim Export: {str(e)}', 'error')
         return redirect(url_for('main.dashboard'))
@@ -40,15 +82,7 @@ def class_list(id):
     school_class = SchoolClass.query.get_or_404(id)
     
     try:
-        output = export_class_list(school_class)
-        filename = f"klasse_{school_class.name}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return _send_cached(*_class_list_file(school_class))
     except Exception as e:
         flash(f'Fehler beim Export: {str(e)}', 'error')
         return redirect(url_for('classes.detail', id=id))
@@ -65,15 +99,97 @@ def payments():
         return redirect(url_for('main.dashboard'))
     
     try:
-        output = export_payment_list(active_year)
-        filename = f"gebuehren_{active_year.name.replace('/', '-')}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return _send_cached(*_payments_file(active_year))
     except Exception as e:
         flash(f'Fehler beim Export: {str(e)}', 'error')
         return redirect(url_for('main.dashboard'))
+
+
+# --- Hintergrund-Jobs (die Routen oben bleiben als direkter Download) ---
+
+def _job_builder(kind, data):
+    """Builder für jobs.submit; prüft die Parameter schon in der Anfrage"""
+    if kind in ('backup', 'payments'):
+        active_year = SchoolYear.query.filter_by(is_active=True).first()
+        if not active_year:
+            return None, 'Kein aktives Schuljahr vorhanden.'
+        year_id = active_year.id
+        
+        if kind == 'backup':
+            def build(job):
+                return _backup_file(SchoolYear.query.get(year_id), progress=job.progress)
+        else:
+            def build(job):
+                file, etag, filename = _payments_file(SchoolYear.query.get(year_id))
+                return file, filename, XLSX_MIMETYPE
+        return build, None
+    
+    if kind == 'class':
+        try:
+            class_id = int(data.get('class_id'))
+        except (TypeError, ValueError):
+            return None, 'Ungültige Klasse'
+        if not SchoolClass.query.get(class_id):
+            return None, 'Klasse nicht gefunden'
+        
+        def build(job):
+            file, etag, filename = _class_list_file(SchoolClass.query.get(class_id))
+            return file, filename, XLSX_MIMETYPE
+        return build, None
+    
+    return None, 'Unbekannter Export'
+
+
+def _own_job(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        abort(404)
+    if job['user_id'] != current_user.id and not current_user.is_admin():
+        abort(403)
+    return job
+
+
+def _job_status(job):
+    status = {key: job.get(key) for key in ('id', 'kind', 'status', 'progress', 'message')}
+    if job['status'] == 'done' and job.get('download_name'):
+        status['download_url'] = url_for('export.job_download', job_id=job['id'])
+    return status
+
+
+@export_bp.route('/jobs', methods=['POST'])
+@login_required
+def start_job():
+    """Export im Hintergrund starten: {"type": "backup" | "payments" | "class", "class_id": ...}"""
+    data = request.get_json(silent=True) or request.form
+    kind = data.get('type')
+    build, error = _job_builder(kind, data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    try:
+        job = jobs.submit(kind, build, user_id=current_user.id)
+    except jobs.JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    
+    return jsonify({
+        **_job_status(job),
+        'status_url': url_for('export.job_status', job_id=job['id'])
+    }), 202
+
+
+@export_bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Status und Fortschritt eines Export-Jobs"""
+    return jsonify(_job_status(_own_job(job_id)))
+
+
+@export_bp.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    """Fertige Datei eines Export-Jobs herunterladen"""
+    job = _own_job(job_id)
+    if job['status'] != 'done' or not job.get('download_name'):
+        abort(409)
+    return send_file(jobs.result_path(job), mimetype=job['mimetype'],
+                     as_attachment=True, download_name=job['download_name'])
@@ -1,11 +1,78 @@
+import re
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from app import db
 from app.models import Keyboard, Loan, AuditLog
-from sqlalchemy import or_
+from app.queries import KeyboardRow, keyboard_rows_query
+from app.pagination import KeysetPage, page_size, stream_requested, render_list
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.sqlite import insert
 
 keyboards_bp = Blueprint('keyboards', __name__, url_prefix='/keyboards')
 
+# Höchstens so viele Keyboards pro Bulk-Anlage (ein INSERT mit executemany)
+BULK_CREATE_LIMIT = 1000
+
+# Bereich "KB001-KB080", "KB001 - 080", "EP1 bis EP20" bzw. eine einzelne Nummer "GP17"
+RANGE_PATTERN = re.compile(r'((?:.*\D)?)(\d+)(\s*(?:-|–|bis)\s*)((?:.*\D)?)(\d+)', re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r'((?:.*\D)?)(\d+)')
+
+
+class RangeError(ValueError):
+    """Bereichsangabe nicht lesbar; Meldung ist für die Anzeige gedacht"""
+
+
+def _add_range(numbers, prefix, start, end, width):
+    """Nummern prefix+start .. prefix+end (mit width Stellen) in numbers eintragen"""
+    if end < start:
+        raise RangeError(f'"{prefix}{start:0{width}d}": Ende liegt vor dem Anfang.')
+    if len(numbers) + end - start >= BULK_CREATE_LIMIT:
+        raise RangeError(f'Höchstens {BULK_CREATE_LIMIT} Keyboards auf einmal.')
+    for i in range(start, end + 1):
+        inventory_number = f"{prefix}{i:0{width}d}"
+        if len(inventory_number) > 20:
+            raise RangeError(f'"{inventory_number}" ist länger als 20 Zeichen.')
+        numbers.setdefault(inventory_number, i)
+
+
+def number_range(prefix, start, count):
+    """Einfaches Formular: count Nummern ab start -> Liste (Inventarnummer, interne Nummer)"""
+    numbers = {}
+    _add_range(numbers, prefix, start, start + count - 1, 3)
+    return list(numbers.items())
+
+
+def parse_ranges(text):
+    """Bereiche (je Zeile oder durch Komma/Semikolon getrennt) -> Liste (Inventarnummer, interne Nummer)
+    
+    Das Präfix darf beim Ende fehlen, die Stellenzahl des Anfangs bleibt erhalten
+    (KB001-080 ergibt KB001 bis KB080). Doppelte Nummern zählen einmal. Enthält das
+    Präfix selbst einen Bindestrich, ist ein "-" ohne Leerzeichen Teil der Nummer
+    (KB-2024-001 ist ein Keyboard); Bereiche dann mit " - " oder "bis" angeben.
+    """
+    numbers = {}
+    for part in re.split(r'[\n,;]', text):
+        part = part.strip()
+        if not part:
+            continue
+        match = RANGE_PATTERN.fullmatch(part)
+        if match and match.group(3) == '-' and '-' in match.group(1):
+            match = None
+        if match:
+            prefix, start, separator, end_prefix, end = match.groups()
+        else:
+            match = NUMBER_PATTERN.fullmatch(part)
+            if not match:
+                raise RangeError(f'"{part}" ist keine Nummer und kein Bereich.')
+            prefix, start = match.groups()
+            end_prefix, end = '', start
+        if end_prefix.strip() and end_prefix.strip() != prefix.strip():
+            raise RangeError(f'"{part}": Anfang und Ende haben verschiedene Präfixe.')
+        if int(end) < int(start):
+            raise RangeError(f'"{part}": Ende liegt vor dem Anfang.')
+        _add_range(numbers, prefix, int(start), int(end), len(start))
+    return list(numbers.items())
+
 
 @keyboards_bp.route('/')
 @login_required
@@ -32,21 +99,28 @@ def index():
             Keyboard.notes.ilike(search_term)
         ))
     
-    # Sortierung
+    # Sortierung (id als eindeutiger Tie-Breaker für die Keyset-Paginierung)
     sort_columns = {
         'internal_number': Keyboard.internal_number,
         'inventory_number': Keyboard.inventory_number,
         'status': Keyboard.status,
         'condition': Keyboard.condition
     }
-    sort_col = sort_columns.get(sort, Keyboard.internal_number)
-    if order == 'desc':
-        sort_col = sort_col.desc()
-    query = query.order_by(sort_col)
+    if sort not in sort_columns:
+        sort = 'internal_number'
+    descending = order == 'desc'
     
-    keyboards = query.all()
+    # Aktuelle Ausleiher per LEFT JOIN statt kb.current_loan pro Zeile
+    keyboards = KeysetPage(keyboard_rows_query(query),
+        keys=[(sort_columns[sort], descending), (Keyboard.id, descending)],
+        key_of=lambda row: (getattr(row, sort), row.id),
+        cursor=request.args.get('after'),
+        per_page=page_size(),
+        transform=KeyboardRow._make,
+        stream=stream_requested()
+    )
     
-    return render_template('keyboards/index.html',
+    return render_list('keyboards/index.html',
         keyboards=keyboards,
         status_filter=status_filter,
         condition_filter=condition_filter,
@@ -165,28 +239,72 @@ def bulk_create():
         return redirect(url_for('keyboards.index'))
     
     if request.method == 'POST':
-        prefix = request.form.get('prefix', 'KB').strip()
-        start = int(request.form.get('start', 1))
-        count = int(request.form.get('count', 10))
+        ranges = request.form.get('ranges', '').strip()
+        if not ranges:
+            # Einfaches Formular: Präfix, Startnummer, Anzahl
+            try:
+                prefix = request.form.get('prefix', 'KB').strip()
+                start = int(request.form.get('start', 1))
+                count = int(request.form.get('count', 10))
+                if start < 1 or count < 1:
+                    raise ValueError
+            except ValueError:
+                flash('Startnummer und Anzahl müssen positive Zahlen sein.', 'error')
+                return render_template('keyboards/bulk_create.html', limit=BULK_CREATE_LIMIT)
+            try:
+                numbers = number_range(prefix, start, count)
+            except RangeError as e:
+                flash(str(e), 'error')
+                return render_template('keyboards/bulk_create.html', limit=BULK_CREATE_LIMIT)
+            label = f"{prefix}{start:03d} bis {prefix}{start + count - 1:03d}"
+        else:
+            try:
+                numbers = parse_ranges(ranges)
+            except RangeError as e:
+                flash(str(e), 'error')
+                return render_template('keyboards/bulk_create.html', ranges=ranges, limit=BULK_CREATE_LIMIT)
+            label = ', '.join(line.strip() for line in ranges.splitlines() if line.strip())
+        if not numbers:
+            flash('Keine Nummern angegeben.', 'error')
+            return render_template('keyboards/bulk_create.html', ranges=ranges, limit=BULK_CREATE_LIMIT)
+        
+        # Vorhandene Nummern mit einer Abfrage, die fehlenden mit einem executemany
+        existing = set(db.session.execute(
+            select(Keyboard.inventory_number).where(Keyboard.inventory_number.in_([inv for inv, i in numbers]))
+        ).scalars())
+        rows = [{
+            'inventory_number': inv,
+            'internal_number': i,
+            'condition': 'in_ordnung',
+            'status': 'im_lager'
+        } for inv, i in numbers if inv not in existing]
         
-        created = 0
-        for i in range(start, start + count):
-            inv = f"{prefix}{i:03d}"
-            if not Keyboard.query.filter_by(inventory_number=inv).first():
-                kb = Keyboard(
-                    inventory_number=inv,
-                    internal_number=i,
-                    condition='in_ordnung',
-                    status='im_lager'
-                )
-                db.session.add(kb)
-                created += 1
+        created = []
+        if rows:
+            # Parallel angelegte Nummern überspringt ON CONFLICT statt abzubrechen
+            created = db.session.execute(
+                insert(Keyboard).on_conflict_do_nothing().returning(Keyboard.inventory_number), rows
+            ).scalars().all()
+        skipped = len(numbers) - len(created)
         
+        if created:
+            # Ein Audit-Eintrag für den ganzen Block statt einem pro Keyboard
+            db.session.add(AuditLog(
+                user_id=current_user.id,
+                action='bulk_create',
+                entity_type='keyboard',
+                details=f"{len(created)} Keyboards angelegt ({label}), {skipped} schon vorhanden",
+                ip_address=request.remote_addr
+            ))
         db.session.commit()
-        flash(f'{created} Keyboards wurden angelegt.', 'success')
+        
+        msg = f'{len(created)} Keyboards wurden angelegt.'
+        if skipped:
+            msg += f' {skipped} waren schon vorhanden.'
+        flash(msg, 'success' if created else 'warning')
         return redirect(url_for('keyboards.index'))
     
-    return render_template('keyboards/bulk_create.html')
+    return render_template('keyboards/bulk_create.html', limit=BULK_CREATE_LIMIT)
 
 
 @keyboards_bp.route('/api/available')
@@ -2,7 +2,13 @@ from datetime import datetime
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from app import db
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.exc import IntegrityError
 from app.models import Loan, Keyboard, Student, SchoolClass, SchoolYear, AuditLog
+from app.lending import create_loan, plan_auto_assignment, assign_keyboards, return_loans, LoanError
+from app.sqlite import retry_on_busy
+from app import inventory
+from app.pagination import KeysetPage, page_size, stream_requested, render_list
 
 loans_bp = Blueprint('loans', __name__, url_prefix='/loans')
 
@@ -13,7 +19,11 @@ def index():
     status_filter = request.args.get('status', 'active')
     class_filter = request.args.get('class_id', '')
     
-    query = Loan.query.join(Student).join(SchoolClass)
+    # Schüler, Klasse und Keyboard gleich mitladen (kein Nachladen pro Zeile)
+    query = Loan.query.join(Student).join(SchoolClass).join(Keyboard).options(
+        contains_eager(Loan.student).contains_eager(Student.school_class),
+        contains_eager(Loan.keyboard)
+    )
     
     if status_filter == 'active':
         query = query.filter(Loan.returned_at == None)
@@ -23,12 +33,19 @@ def index():
     if class_filter:
         query = query.filter(Student.class_id == int(class_filter))
     
-    loans = query.order_by(Loan.loaned_at.desc()).all()
+    # Keyset-Paginierung: neueste zuerst, id als eindeutiger Tie-Breaker
+    loans = KeysetPage(query,
+        keys=[(Loan.loaned_at, True), (Loan.id, True)],
+        key_of=lambda loan: (loan.loaned_at, loan.id),
+        cursor=request.args.get('after'),
+        per_page=page_size(),
+        stream=stream_requested()
+    )
     
     active_year = SchoolYear.query.filter_by(is_active=True).first()
     classes = active_year.classes.order_by(SchoolClass.name).all() if active_year else []
     
-    return render_template('loans/index.html',
+    return render_list('loans/index.html',
         loans=loans,
         classes=classes,
         status_filter=status_filter,
@@ -47,55 +64,148 @@ def new():
     classes = active_year.classes.filter_by(grade=5).order_by(SchoolClass.name).all() if active_year else []
     
     if request.method == 'POST':
-        student_id = request.form.get('student_id')
-        keyboard_id = request.form.get('keyboard_id')
+        student_id = request.form.get('student_id', type=int)
+        keyboard_id = request.form.get('keyboard_id', type=int)
         fee_paid = request.form.get('fee_paid') == 'on'
         
         if not student_id or not keyboard_id:
             flash('Schüler und Keyboard müssen ausgewählt werden.', 'error')
             return render_template('loans/form.html', classes=classes)
         
-        student = Student.query.get(student_id)
-        keyboard = Keyboard.query.get(keyboard_id)
-        
-        if not student or not keyboard:
-            flash('Ungültige Auswahl.', 'error')
+        # Ohne Vorab-Prüfung anlegen; Konflikte melden die eindeutigen Indizes
+        try:
+            loan_id, inventory_number = create_loan(
+                student_id, keyboard_id,
+                fee_paid=fee_paid,
+                created_by=current_user.id
+            )
+        except LoanError as e:
+            db.session.rollback()
+            flash(f'{e}.', 'error')
             return render_template('loans/form.html', classes=classes)
         
-        if student.current_loan:
-            flash('Schüler hat bereits ein Keyboard.', 'error')
-            return render_template('loans/form.html', classes=classes)
-        
-        if not keyboard.is_available:
-            flash('Keyboard ist nicht verfügbar.', 'error')
-            return render_template('loans/form.html', classes=classes)
-        
-        loan = Loan(
-            student_id=student.id,
-            keyboard_id=keyboard.id,
-            fee_paid=fee_paid,
-            created_by=current_user.id
-        )
-        keyboard.status = 'ausgeliehen'
-        
-        db.session.add(loan)
-        
+        student = Student.query.get(student_id)
         log = AuditLog(
             user_id=current_user.id,
             action='loan_create',
             entity_type='loan',
-            details=f"Keyboard {keyboard.inventory_number} an {student.full_name}",
+            entity_id=loan_id,
+            details=f"Keyboard {inventory_number} an {student.full_name}",
             ip_address=request.remote_addr
         )
         db.session.add(log)
         db.session.commit()
         
-        flash(f'Keyboard {keyboard.inventory_number} an {student.full_name} ausgeliehen.', 'success')
+        flash(f'Keyboard {inventory_number} an {student.full_name} ausgeliehen.', 'success')
         return redirect(url_for('classes.detail', id=student.class_id))
     
     return render_template('loans/form.html', classes=classes)
 
 
+@loans_bp.route('/station')
+@login_required
+def station():
+    """Ausleihstation: Keyboards per Barcode-Scanner ausgeben und zurücknehmen"""
+    if not current_user.can_edit():
+        flash('Keine Berechtigung.', 'error')
+        return redirect(url_for('loans.index'))
+    
+    active_year = SchoolYear.query.filter_by(is_active=True).first()
+    classes = []
+    if active_year:
+        classes = SchoolClass.query.filter_by(school_year_id=active_year.id).order_by(
+            SchoolClass.grade, SchoolClass.name
+        ).all()
+    
+    return render_template('loans/station.html', classes=classes,
+        condition_choices=Keyboard.CONDITION_CHOICES)
+
+
+@loans_bp.route('/station/scan', methods=['POST'])
+@login_required
+@retry_on_busy
+def station_scan():
+    """Ein Scan = eine Ausleihe (mode=loan, mit student_id) oder eine Rückgabe (mode=return)"""
+    if not current_user.can_edit():
+        return jsonify({'error': 'Keine Berechtigung'}), 403
+    
+    data = request.get_json() or {}
+    keyboard = inventory.lookup(str(data.get('code') or ''))
+    if keyboard is None:
+        return jsonify({'error': f"Unbekanntes Keyboard: {data.get('code')}"}), 404
+    
+    if data.get('mode') == 'return':
+        if not keyboard.loan_id:
+            return jsonify({'error': f'Keyboard {keyboard.inventory_number} ist nicht ausgeliehen'}), 400
+        try:
+            returned, not_found, invalid = return_loans([{
+                'loan_id': keyboard.loan_id,
+                'condition': data.get('condition') or 'in_ordnung',
+                'notes': data.get('notes')
+            }])
+        except LoanError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        if invalid:
+            return jsonify({'error': invalid[0]['error']}), 400
+        if not returned:
+            return jsonify({'error': f'Keyboard {keyboard.inventory_number} ist nicht ausgeliehen'}), 400
+        
+        log = AuditLog(
+            user_id=current_user.id,
+            action='loan_return',
+            entity_type='loan',
+            entity_id=keyboard.loan_id,
+            details=f"Keyboard {keyboard.inventory_number} von {keyboard.student_full_name} zurück",
+            ip_address=request.remote_addr
+        )
+        db.session.add(log)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'action': 'return',
+            'keyboard': keyboard.inventory_number,
+            'student': keyboard.student_full_name,
+            'class_name': keyboard.class_name
+        })
+    
+    if keyboard.loan_id:
+        return jsonify({'error': f'Keyboard {keyboard.inventory_number} ist bereits an '
+                                 f'{keyboard.student_full_name} ({keyboard.class_name}) ausgeliehen'}), 400
+    try:
+        student_id = int(data.get('student_id'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Bitte zuerst einen Schüler wählen'}), 400
+    
+    try:
+        loan_id, inventory_number = create_loan(student_id, keyboard.id, created_by=current_user.id)
+    except LoanError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    student = db.session.get(Student, student_id)
+    log = AuditLog(
+        user_id=current_user.id,
+        action='loan_create',
+        entity_type='loan',
+        entity_id=loan_id,
+        details=f"Keyboard {inventory_number} an {student.full_name}",
+        ip_address=request.remote_addr
+    )
+    db.session.add(log)
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'action': 'loan',
+        'loan_id': loan_id,
+        'keyboard': inventory_number,
+        'student_id': student_id,
+        'student': student.full_name
+    })
+
+
 @loans_bp.route('/<int:id>/return', methods=['GET', 'POST'])
 @login_required
 def return_keyboard(id):
@@ -145,6 +255,7 @@ def return_keyboard(id):
 
 @loans_bp.route('/<int:id>/toggle-paid', methods=['POST'])
 @login_required
+@retry_on_busy
 def toggle_paid(id):
     """AJAX: Bezahlstatus umschalten"""
     if not current_user.can_edit():
@@ -159,48 +270,105 @@ def toggle_paid(id):
 
 @loans_bp.route('/quick-loan', methods=['POST'])
 @login_required
+@retry_on_busy
 def quick_loan():
     """Schnelle Ausleihe aus Klassenansicht"""
     if not current_user.can_edit():
         return jsonify({'error': 'Keine Berechtigung'}), 403
     
     data = request.get_json()
-    student_id = data.get('student_id')
-    keyboard_id = data.get('keyboard_id')
+    try:
+        student_id = int(data.get('student_id'))
+        keyboard_id = int(data.get('keyboard_id'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Ungültige Auswahl'}), 400
     
-    student = Student.query.get(student_id)
-    keyboard = Keyboard.query.get(keyboard_id)
+    # Ein Durchlauf ohne Vorab-Prüfung: Keyboard reservieren, Ausleihe einfügen
+    # (fee_prepaid Status vom Schüler wird übernommen)
+    try:
+        loan_id, inventory_number = create_loan(
+            student_id, keyboard_id,
+            created_by=current_user.id
+        )
+    except LoanError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'loan_id': loan_id,
+        'keyboard': inventory_number
+    })
+
+
+@loans_bp.route('/auto-assign', methods=['POST'])
+@login_required
+@retry_on_busy
+def auto_assign():
+    """Alle Teilnehmer einer 5er-Klasse ohne Keyboard auf einmal ausstatten
+    
+    Ohne confirm nur Vorschau. Mit confirm muss die Zuordnung aus der Vorschau
+    mitgeschickt werden; hat sie sich inzwischen geändert, kommt eine neue Vorschau (409).
+    """
+    if not current_user.can_edit():
+        return jsonify({'error': 'Keine Berechtigung'}), 403
     
-    if not student or not keyboard:
+    data = request.get_json() or {}
+    try:
+        class_id = int(data.get('class_id'))
+        start = int(data['from']) if data.get('from') not in (None, '') else None
+        end = int(data['to']) if data.get('to') not in (None, '') else None
+        expected = [(int(p['student_id']), int(p['keyboard_id'])) for p in data.get('assignments') or []]
+    except (TypeError, ValueError, KeyError):
         return jsonify({'error': 'Ungültige Auswahl'}), 400
     
-    if student.current_loan:
-        return jsonify({'error': 'Schüler hat bereits ein Keyboard'}), 400
+    school_class = SchoolClass.query.get(class_id)
+    if not school_class or school_class.grade != 5:
+        return jsonify({'error': 'Nur für 5. Klassen möglich'}), 400
     
-    if not keyboard.is_available:
-        return jsonify({'error': 'Keyboard nicht verfügbar'}), 400
+    plan, without_loan = plan_auto_assignment(class_id, start, end)
+    preview = {
+        'assignments': plan,
+        'students_without_keyboard': without_loan,
+        'missing': without_loan - len(plan)
+    }
     
-    # fee_prepaid Status vom Schüler übernehmen
-    loan = Loan(
-        student_id=student.id,
-        keyboard_id=keyboard.id,
-        fee_paid=student.fee_prepaid,  # Vorausbezahlung übernehmen
-        created_by=current_user.id
-    )
-    keyboard.status = 'ausgeliehen'
+    if not data.get('confirm'):
+        return jsonify({'success': True, 'preview': True, **preview})
+    
+    if expected != [(p['student_id'], p['keyboard_id']) for p in plan]:
+        return jsonify({'error': 'Die Vorschau ist veraltet, bitte erneut prüfen', 'preview': True, **preview}), 409
+    if not plan:
+        return jsonify({'error': 'Keine Zuordnung möglich'}), 400
+    
+    try:
+        count = assign_keyboards(plan, created_by=current_user.id)
+    except LoanError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
     
-    db.session.add(loan)
+    # Ein Audit-Eintrag für die ganze Klasse statt einem pro Ausleihe
+    log = AuditLog(
+        user_id=current_user.id,
+        action='loan_batch_create',
+        entity_type='school_class',
+        entity_id=class_id,
+        details=f"{count} Keyboards an Klasse {school_class.name}: " + ', '.join(
+            f"{p['inventory_number']} an {p['student_name']}" for p in plan
+        ),
+        ip_address=request.remote_addr
+    )
+    db.session.add(log)
     db.session.commit()
     
-    return jsonify({
-        'success': True,
-        'loan_id': loan.id,
-        'keyboard': keyboard.inventory_number
-    })
+    return jsonify({'success': True, 'count': count})
 
 
 @loans_bp.route('/quick-return', methods=['POST'])
 @login_required
+@retry_on_busy
 def quick_return():
     """Schnelle Rückgabe aus Klassenansicht"""
     if not current_user.can_edit():
@@ -229,6 +397,13 @@ def quick_return():
     return jsonify({'success': True})
 
 
+def _undo_conflict(error):
+    """Meldung, wenn ein Unique-Index für aktive Ausleihen das Stornieren verhindert"""
+    if 'student_id' in str(error.orig):
+        return 'Schüler hat inzwischen ein anderes Keyboard'
+    return 'Keyboard ist bereits an jemand anderen verliehen'
+
+
 @loans_bp.route('/<int:id>/undo-return', methods=['POST'])
 @login_required
 def undo_return(id):
@@ -249,6 +424,11 @@ def undo_return(id):
         flash(f'Keyboard {keyboard.inventory_number} ist bereits an jemand anderen verliehen.', 'error')
         return redirect(url_for('loans.index'))
     
+    # Schüler hat inzwischen ein anderes Keyboard (höchstens eine aktive Ausleihe pro Schüler)
+    if loan.student.current_loan:
+        flash(f'{loan.student.full_name} hat inzwischen ein anderes Keyboard.', 'error')
+        return redirect(url_for('loans.index'))
+    
     # Rückgabe stornieren
     old_return_date = loan.returned_at
     loan.returned_at = None
@@ -268,14 +448,62 @@ def undo_return(id):
         ip_address=request.remote_addr
     )
     db.session.add(log)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        # Gleichzeitig neu verliehen: die Unique-Indizes für aktive Ausleihen greifen
+        db.session.rollback()
+        flash(f'{_undo_conflict(e)}.', 'error')
+        return redirect(url_for('loans.index'))
     
     flash(f'Rückgabe storniert! Keyboard {keyboard.inventory_number} ist wieder an {loan.student.full_name} ausgeliehen.', 'success')
     return redirect(url_for('classes.detail', id=loan.student.class_id))
 
 
+@loans_bp.route('/api/bulk-return', methods=['POST'])
+@login_required
+@retry_on_busy
+def api_bulk_return():
+    """Rückgabetag: viele Keyboards in einer Transaktion zurücknehmen
+    
+    JSON: {"items": [{"loan_id": 1 | "inventory_number": "KB001", "condition": "...", "notes": "..."}]}
+    """
+    if not current_user.can_edit():
+        return jsonify({'error': 'Keine Berechtigung'}), 403
+    
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Keine Rückgaben angegeben'}), 400
+    
+    try:
+        returned, not_found, invalid = return_loans(items)
+    except LoanError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    if returned:
+        # Ein Audit-Eintrag für den ganzen Stapel
+        log = AuditLog(
+            user_id=current_user.id,
+            action='loan_bulk_return',
+            entity_type='loan',
+            details=f"{len(returned)} Keyboards zurück: " + ', '.join(
+                f"{r['inventory_number']} von {r['student_name']}"
+                + ('' if r['condition'] == 'in_ordnung' else f" ({r['condition']})")
+                for r in returned
+            ),
+            ip_address=request.remote_addr
+        )
+        db.session.add(log)
+    db.session.commit()
+    
+    return jsonify({'success': True, 'returned': returned, 'not_found': not_found, 'invalid': invalid})
+
+
 @loans_bp.route('/api/undo-return', methods=['POST'])
 @login_required
+@retry_on_busy
 def api_undo_return():
     """AJAX: Rückgabe stornieren"""
     if not current_user.can_edit():
@@ -293,7 +521,9 @@ def api_undo_return():
     
     keyboard = loan.keyboard
     if keyboard.current_loan and keyboard.current_loan.id != loan.id:
-        return jsonify({'error': f'Keyboard ist bereits an jemand anderen verliehen'}), 400
+        return jsonify({'error': f'Keyboard ist bereits an jemand anderen verliehen'}), 409
+    if loan.student.current_loan:
+        return jsonify({'error': f'{loan.student.full_name} hat inzwischen ein anderes Keyboard'}), 409
     
     loan.returned_at = None
     loan.return_condition = None
@@ -302,7 +532,11 @@ def api_undo_return():
     keyboard.status = 'ausgeliehen'
     keyboard.condition = 'in_ordnung'
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        return jsonify({'error': _undo_conflict(e)}), 409
     
     return jsonify({
         'success': True,
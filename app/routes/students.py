@@ -1,9 +1,12 @@
-import csv
-import io
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response
 from flask_login import login_required, current_user
 from app import db
-from app.models import Student, SchoolClass, SchoolYear, Loan
+from sqlalchemy import and_
+from sqlalchemy.orm import contains_eager
+from app.models import Student, SchoolClass, SchoolYear, Loan, Keyboard
+from app.sqlite import retry_on_busy
+from app.pagination import KeysetPage, page_size, stream_requested, render_list
+from app.importer import BulkImporter, iter_roster_rows
 
 students_bp = Blueprint('students', __name__, url_prefix='/students')
 
@@ -16,15 +19,29 @@ def index():
     active_year = SchoolYear.query.filter_by(is_active=True).first()
     classes = active_year.classes.order_by(SchoolClass.name).all() if active_year else []
     
-    query = Student.query.join(SchoolClass)
+    # Klasse und aktuelles Keyboard per JOIN mitladen (kein Nachladen pro Zeile)
+    query = db.session.query(Student, Keyboard.inventory_number).join(
+        SchoolClass, SchoolClass.id == Student.class_id
+    ).outerjoin(
+        Loan, and_(Loan.student_id == Student.id, Loan.returned_at == None)
+    ).outerjoin(
+        Keyboard, Keyboard.id == Loan.keyboard_id
+    ).options(contains_eager(Student.school_class))
+    
     if class_filter:
         query = query.filter(Student.class_id == int(class_filter))
     elif active_year:
         query = query.filter(SchoolClass.school_year_id == active_year.id)
     
-    students = query.order_by(SchoolClass.name, Student.last_name, Student.first_name).all()
+    students = KeysetPage(query,
+        keys=[(SchoolClass.name, False), (Student.last_name, False), (Student.first_name, False), (Student.id, False)],
+        key_of=lambda row: (row[0].school_class.name, row[0].last_name, row[0].first_name, row[0].id),
+        cursor=request.args.get('after'),
+        per_page=page_size(),
+        stream=stream_requested()
+    )
     
-    return render_template('students/index.html',
+    return render_list('students/index.html',
         students=students,
         classes=classes,
         class_filter=class_filter
@@ -114,6 +131,7 @@ def delete(id):
 
 @students_bp.route('/<int:id>/update-notes', methods=['POST'])
 @login_required
+@retry_on_busy
 def update_notes(id):
     """AJAX: Anmerkungen aktualisieren"""
     if not current_user.can_edit():
@@ -130,6 +148,7 @@ def update_notes(id):
 @students_bp.route('/import', methods=['GET', 'POST'])
 @login_required
 def import_csv():
+    """Schüler aus CSV oder Excel importieren: in eine gewählte Klasse oder per Spalte "Klasse" in mehrere"""
     if not current_user.can_edit():
         flash('Keine Berechtigung.', 'error')
         return redirect(url_for('students.index'))
@@ -141,56 +160,54 @@ def import_csv():
         class_id = request.form.get('class_id')
         file = request.files.get('file')
         
-        if not class_id or not file:
-            flash('Klasse und CSV-Datei sind erforderlich.', 'error')
+        if not file or not active_year:
+            flash('Datei und aktives Schuljahr sind erforderlich.', 'error')
+            return render_template('students/import.html', classes=classes)
+        
+        if not file.filename.lower().endswith(('.csv', '.xlsx')):
+            flash('Bitte eine CSV- oder Excel-Datei (.xlsx) hochladen.', 'error')
             return render_template('students/import.html', classes=classes)
         
         try:
-            content = file.read().decode('utf-8-sig')
-            reader = csv.DictReader(io.StringIO(content), delimiter=';')
+            default_class = next((cls for cls in classes if str(cls.id) == class_id), None)
             
-            imported = 0
+            # Klassen des aktiven Schuljahres nach Name (ohne Groß-/Kleinschreibung)
+            classes_by_name = {cls.name.strip().upper(): cls for cls in classes}
+            
+            # Vorhandene Schüler des Schuljahres mit einer Abfrage; Duplikate auch innerhalb der Datei
+            importer = BulkImporter(active_year)
+            imported_classes = set()
             skipped = 0
             errors = []
             
-            for i, row in enumerate(reader, start=2):
-                try:
-                    # Flexible Spaltennamen
-                    last_name = row.get('Name') or row.get('Nachname') or row.get('name') or ''
-                    first_name = row.get('Vorname') or row.get('vorname') or ''
-                    
-                    last_name = last_name.strip()
-                    first_name = first_name.strip()
-                    
-                    if not last_name or not first_name:
-                        skipped += 1
-                        continue
-                    
-                    # Prüfen ob bereits vorhanden
-                    exists = Student.query.filter_by(
-                        last_name=last_name,
-                        first_name=first_name,
-                        class_id=int(class_id)
-                    ).first()
-                    
-                    if exists:
-                        skipped += 1
+            for where, last_name, first_name, class_name in iter_roster_rows(file.stream, file.filename):
+                if not last_name or not first_name:
+                    skipped += 1
+                    continue
+                
+                cls = default_class
+                if class_name:
+                    cls = classes_by_name.get(class_name.upper())
+                    if not cls:
+                        errors.append(f"{where}: Klasse {class_name} gibt es im aktiven Schuljahr nicht")
                         continue
-                    
-                    student = Student(
-                        last_name=last_name,
-                        first_name=first_name,
-                        class_id=int(class_id)
-                    )
-                    db.session.add(student)
-                    imported += 1
-                    
-                except Exception as e:
-                    errors.append(f"Zeile {i}: {str(e)}")
+                elif not cls:
+                    errors.append(f"{where}: keine Klasse angegeben (Klasse wählen oder Spalte \"Klasse\")")
+                    continue
+                
+                importer.add_class({'name': cls.name, 'grade': cls.grade})
+                if importer.add_student(cls.name, {'last_name': last_name, 'first_name': first_name}):
+                    imported_classes.add(cls.id)
+                else:
+                    skipped += 1
             
+            importer.finish()
             db.session.commit()
+            imported = importer.stats['students']
             
             msg = f'{imported} Schüler importiert.'
+            if len(imported_classes) > 1:
+                msg += f' ({len(imported_classes)} Klassen)'
             if skipped > 0:
                 msg += f' {skipped} übersprungen.'
             if errors:
@@ -202,9 +219,12 @@ def import_csv():
                 for error in errors[:5]:
                     flash(error, 'error')
             
-            return redirect(url_for('students.index', class_id=class_id))
+            if default_class and imported_classes <= {default_class.id}:
+                return redirect(url_for('students.index', class_id=default_class.id))
+            return redirect(url_for('students.index'))
             
         except Exception as e:
+            db.session.rollback()
             flash(f'Fehler beim Import: {str(e)}', 'error')
     
     return render_template('students/import.html', classes=classes)
@@ -213,11 +233,16 @@ def import_csv():
 @students_bp.route('/import/template')
 @login_required
 def download_template():
-    csv_content = "Name;Vorname\nMustermann;Max\nMusterfrau;Maria\n"
+    if request.args.get('with_class'):
+        csv_content = "Klasse;Name;Vorname\n5A;Mustermann;Max\n5B;Musterfrau;Maria\n"
+        filename = 'schueler_vorlage_klassen.csv'
+    else:
+        csv_content = "Name;Vorname\nMustermann;Max\nMusterfrau;Maria\n"
+        filename = 'schueler_vorlage.csv'
     return Response(
         csv_content,
         mimetype='text/csv',
-        headers={'Content-Disposition': 'attachment; filename=schueler_vorlage.csv'}
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 
@@ -243,6 +268,7 @@ def api_without_loan():
 
 @students_bp.route('/<int:id>/toggle-participation', methods=['POST'])
 @login_required
+@retry_on_busy
 def toggle_participation(id):
     """AJAX: Teilnahme an Ausleihe umschalten"""
     if not current_user.can_edit():
@@ -264,6 +290,7 @@ def toggle_participation(id):
 
 @students_bp.route('/<int:id>/toggle-fee-paid', methods=['POST'])
 @login_required
+@retry_on_busy
 def toggle_fee_paid(id):
     """AJAX: Gebühr-Bezahlstatus umschalten (für Schüler ohne Keyboard)"""
     if not current_user.can_edit():
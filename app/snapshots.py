@@ -0,0 +1,365 @@
+"""Datenbank-Snapshots über die Online-Backup-API von SQLite
+
+Der Snapshot kopiert die laufende Datenbank seitenweise in eine neue Datei.
+Zwischen den Schritten wird die Sperre freigegeben, Schreiber müssen also
+nicht warten. Anders als das Excel/JSON-Backup enthält ein Snapshot alles
+(Rückgaben, Audit-Log, Benutzer) und lässt sich 1:1 wiederherstellen.
+
+Zwischen zwei Snapshots schreibt create_delta nur die seitdem geänderten
+Zeilen als NDJSON-Segment (gzip), Aufwand und Größe richten sich also nach
+der Aktivität statt nach der Datenbankgröße. Geänderte Zeilen findet es über
+updated_at (audit_logs über created_at, dort wird nur angehängt), gelöschte
+über die per Trigger gefüllte Tabelle deleted_rows. Die Segmente gehören zum
+jeweils neuesten Snapshot ("Kette") und werden bei der Wiederherstellung in
+Reihenfolge auf ihn angewendet.
+"""
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete
+from app.cache import bump_version, write_atomic
+from app.models import db, DeletedRow
+
+SNAPSHOT_PATTERN = re.compile(r'^snapshot-(\d{8}-\d{6})(?:-(\d+))?\.sqlite3(?:\.gz)?$')
+
+# Seiten pro Kopierschritt (bei 4 KiB-Seiten ca. 1 MB), danach kurze Pause für andere Verbindungen
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.005
+
+DELTA_FORMAT = 1
+DELTA_STATE_FILE = 'delta-chain.json'
+DELTA_BATCH_SIZE = 500
+
+# Zeilen, deren Zeitstempel so kurz vor dem letzten Backup liegt, kommen erneut ins
+# nächste Delta: ihre Transaktion war beim Lesen evtl. noch nicht abgeschlossen
+DELTA_OVERLAP = timedelta(minutes=1)
+
+# Format, in dem SQLAlchemy DateTime-Spalten in SQLite speichert (als Text vergleichbar)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+class SnapshotError(Exception):
+    """Snapshot nicht möglich (Meldung ist für die Oberfläche gedacht)"""
+
+
+def init_app(app):
+    folder = app.config.setdefault('SNAPSHOT_FOLDER', os.path.join(app.instance_path, 'snapshots'))
+    app.config.setdefault('SNAPSHOT_KEEP', 14)
+    app.config.setdefault('SNAPSHOT_COMPRESS', True)
+    os.makedirs(folder, exist_ok=True)
+
+
+def _folder():
+    return current_app.config['SNAPSHOT_FOLDER']
+
+
+def _database_path():
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        raise SnapshotError('Snapshots sind nur für SQLite-Datenbankdateien möglich.')
+    return url.database
+
+
+def snapshot_path(name):
+    """Pfad eines vorhandenen Snapshots (None bei ungültigem Namen)"""
+    if not SNAPSHOT_PATTERN.match(name or ''):
+        return None
+    path = os.path.join(_folder(), name)
+    return path if os.path.exists(path) else None
+
+
+def delta_names(snapshot_name):
+    """Delta-Segmente eines Snapshots in Anwendungsreihenfolge"""
+    stem = snapshot_name.split('.sqlite3')[0]
+    pattern = re.compile(rf'^{re.escape(stem)}\.delta-\d{{4}}\.ndjson\.gz$')
+    return sorted(name for name in os.listdir(_folder()) if pattern.match(name))
+
+
+def list_snapshots():
+    """Snapshots, neueste zuerst: Dicts mit name, size, created_at, deltas"""
+    snapshots = []
+    for name in os.listdir(_folder()):
+        match = SNAPSHOT_PATTERN.match(name)
+        if match:
+            stat = os.stat(os.path.join(_folder(), name))
+            snapshots.append({
+                'name': name,
+                'size': stat.st_size,
+                'created_at': datetime.fromtimestamp(stat.st_mtime),
+                'deltas': delta_names(name),
+                # Zeitstempel, dann Zähler bei mehreren Snapshots in derselben Sekunde
+                '_order': (match.group(1), int(match.group(2) or 1))
+            })
+    snapshots.sort(key=lambda s: s.pop('_order'), reverse=True)
+    return snapshots
+
+
+def _copy_database(source_path, target_path):
+    """Online-Backup: source seitenweise nach target kopieren"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=PAGES_PER_STEP, sleep=STEP_SLEEP)
+    finally:
+        target.close()
+        source.close()
+
+
+def rotate(keep=None):
+    """Nur die neuesten keep Snapshots behalten; liefert die Namen der gelöschten"""
+    keep = current_app.config['SNAPSHOT_KEEP'] if keep is None else keep
+    removed = []
+    for snapshot in list_snapshots()[keep:]:
+        for name in [snapshot['name']] + snapshot['deltas']:
+            os.remove(os.path.join(_folder(), name))
+        removed.append(snapshot['name'])
+    return removed
+
+
+def create_snapshot(compress=None, record=True):
+    """Snapshot der laufenden Datenbank anlegen; liefert den Dateinamen
+    
+    record=True: ältere Snapshots rotieren und eine neue Delta-Kette beginnen.
+    record=False schreibt nur die Datei (z.B. für Messungen).
+    """
+    compress = current_app.config['SNAPSHOT_COMPRESS'] if compress is None else compress
+    source_path = _database_path()
+    watermark = datetime.utcnow()
+    
+    name = f"snapshot-{datetime.now().strftime('%Y%m%d-%H%M%S')}.sqlite3"
+    counter = 1
+    while os.path.exists(os.path.join(_folder(), name)) or os.path.exists(os.path.join(_folder(), name + '.gz')):
+        counter += 1
+        name = f"snapshot-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{counter}.sqlite3"
+    
+    fd, tmp_path = tempfile.mkstemp(dir=_folder(), prefix='.tmp-')
+    os.close(fd)
+    try:
+        _copy_database(source_path, tmp_path)
+        if compress:
+            name += '.gz'
+            gz_path = tmp_path + '.gz'
+            with open(tmp_path, 'rb') as src, gzip.open(gz_path, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.remove(tmp_path)
+            tmp_path = gz_path
+        os.replace(tmp_path, os.path.join(_folder(), name))
+    except Exception:
+        for path in (tmp_path, tmp_path + '.gz'):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    
+    if record:
+        _start_chain(name, watermark)
+        rotate()
+    return name
+
+
+# --- Delta-Backups ---
+
+def _state_path():
+    return os.path.join(_folder(), DELTA_STATE_FILE)
+
+
+def _read_chain():
+    try:
+        with open(_state_path(), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _start_chain(snapshot_name, watermark):
+    """Neue Delta-Kette ab diesem Snapshot; ältere Lösch-Einträge werden nicht mehr gebraucht"""
+    write_atomic(_state_path(), json.dumps({
+        'base': snapshot_name,
+        'watermark': watermark.strftime(TIMESTAMP_FORMAT)
+    }))
+    with db.engine.begin() as conn:
+        conn.execute(delete(DeletedRow).where(DeletedRow.deleted_at < watermark - DELTA_OVERLAP))
+
+
+def _reset_chain():
+    if os.path.exists(_state_path()):
+        os.remove(_state_path())
+
+
+def _delta_tables():
+    """(Tabelle, Zeitstempel-Spalte) aller Tabellen, die ins Delta gehören"""
+    tables = []
+    for table in db.metadata.sorted_tables:
+        if 'updated_at' in table.c:
+            tables.append((table.name, 'updated_at'))
+        elif 'created_at' in table.c:
+            tables.append((table.name, 'created_at'))
+    return tables
+
+
+def _write_delta(conn, out, since):
+    """Geänderte und gelöschte Zeilen seit since als NDJSON schreiben; liefert die Anzahl"""
+    count = 0
+    for table, column in _delta_tables():
+        # Rohwerte aus SQLite, damit das Zurückspielen die Zeilen unverändert einfügt
+        cursor = conn.execute(f"SELECT * FROM {table} WHERE {column} >= ?", (since,))
+        columns = [d[0] for d in cursor.description]
+        while True:
+            batch = cursor.fetchmany(DELTA_BATCH_SIZE)
+            if not batch:
+                break
+            for values in batch:
+                out.write(json.dumps({'table': table, 'op': 'upsert', 'row': dict(zip(columns, values))}) + '\n')
+            count += len(batch)
+        
+        if column == 'updated_at':
+            cursor = conn.execute(
+                f"SELECT DISTINCT row_id FROM deleted_rows WHERE table_name = ? AND deleted_at >= ? "
+                f"AND row_id NOT IN (SELECT id FROM {table})", (table, since)
+            )
+            for (row_id,) in cursor:
+                out.write(json.dumps({'table': table, 'op': 'delete', 'id': row_id}) + '\n')
+                count += 1
+    return count
+
+
+def create_delta():
+    """Delta seit dem letzten Backup der Kette schreiben
+    
+    Liefert (Dateiname, Anzahl Zeilen); (None, 0) wenn sich nichts geändert hat.
+    Ohne laufende Kette (noch kein Snapshot, nach einer Wiederherstellung) wird
+    stattdessen ein vollständiger Snapshot angelegt: (Snapshot-Name, None).
+    """
+    chain = _read_chain()
+    if not chain or not snapshot_path(chain['base']):
+        return create_snapshot(), None
+    
+    base = chain['base']
+    since = (datetime.strptime(chain['watermark'], TIMESTAMP_FORMAT) - DELTA_OVERLAP).strftime(TIMESTAMP_FORMAT)
+    watermark = datetime.utcnow()
+    name = f"{base.split('.sqlite3')[0]}.delta-{len(delta_names(base)) + 1:04d}.ndjson.gz"
+    
+    fd, tmp_path = tempfile.mkstemp(dir=_folder(), prefix='.tmp-')
+    os.close(fd)
+    conn = sqlite3.connect(_database_path(), isolation_level=None)
+    try:
+        # Eine Lesetransaktion: alle Tabellen aus demselben Stand
+        conn.execute('BEGIN')
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as out:
+            out.write(json.dumps({
+                'format': DELTA_FORMAT,
+                'base': base,
+                'since': since,
+                'until': watermark.strftime(TIMESTAMP_FORMAT)
+            }) + '\n')
+            count = _write_delta(conn, out, since)
+        conn.execute('COMMIT')
+        
+        if not count:
+            os.remove(tmp_path)
+            return None, 0
+        os.replace(tmp_path, os.path.join(_folder(), name))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        conn.close()
+    
+    write_atomic(_state_path(), json.dumps({'base': base, 'watermark': watermark.strftime(TIMESTAMP_FORMAT)}))
+    return name, count
+
+
+def _apply_delta(conn, path):
+    """Ein Segment auf eine Datenbank anwenden (Verbindung ohne Fremdschlüssel-Prüfung)"""
+    upserts = {}
+    deletes = {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(next(f))
+        if header.get('format') != DELTA_FORMAT:
+            raise SnapshotError(f'Delta {os.path.basename(path)} hat ein unbekanntes Format.')
+        for line in f:
+            change = json.loads(line)
+            if change['op'] == 'upsert':
+                upserts.setdefault(change['table'], []).append(change['row'])
+            else:
+                deletes.setdefault(change['table'], []).append(change['id'])
+    
+    with conn:
+        for table in set(upserts) | set(deletes):
+            rows = upserts.get(table, [])
+            # Erst alle betroffenen Zeilen entfernen, dann den neuen Stand einfügen: so
+            # kollidieren eindeutige Indizes nicht mit veralteten Zeilen des Snapshots
+            ids = [row['id'] for row in rows] + deletes.get(table, [])
+            for start in range(0, len(ids), DELTA_BATCH_SIZE):
+                chunk = ids[start:start + DELTA_BATCH_SIZE]
+                conn.execute(f"DELETE FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            if rows:
+                columns = list(rows[0])
+                conn.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    [[row[column] for column in columns] for row in rows]
+                )
+
+
+def restore_snapshot(name, with_deltas=False):
+    """Datenbank aus einem Snapshot wiederherstellen
+    
+    Vorher wird ein Sicherheits-Snapshot des aktuellen Stands angelegt (Name wird
+    zurückgegeben). Die Wiederherstellung läuft ebenfalls über die Backup-API in
+    die laufende Datenbank, damit WAL und offene Verbindungen konsistent bleiben.
+    with_deltas: zusätzlich alle Delta-Segmente des Snapshots anwenden.
+    """
+    path = snapshot_path(name)
+    if not path:
+        raise SnapshotError(f'Snapshot {name} nicht gefunden.')
+    target_path = _database_path()
+    
+    fd, tmp_path = tempfile.mkstemp(dir=_folder(), prefix='.tmp-')
+    os.close(fd)
+    try:
+        if path.endswith('.gz'):
+            with gzip.open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        else:
+            shutil.copyfile(path, tmp_path)
+        
+        if with_deltas:
+            conn = sqlite3.connect(tmp_path)
+            try:
+                for delta in delta_names(name):
+                    try:
+                        _apply_delta(conn, os.path.join(_folder(), delta))
+                    except sqlite3.Error as e:
+                        raise SnapshotError(f'Delta {delta} lässt sich nicht anwenden: {e}')
+            finally:
+                conn.close()
+        
+        check = sqlite3.connect(tmp_path)
+        try:
+            result = check.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            check.close()
+        if result != 'ok':
+            raise SnapshotError(f'Snapshot {name} ist beschädigt: {result}')
+        
+        # Ohne Rotation: sonst könnte gerade der wiederherzustellende (älteste) Snapshot
+        # samt Deltas gelöscht werden; eine neue Delta-Kette wäre gleich wieder verworfen
+        safety = create_snapshot(record=False)
+        db.session.remove()
+        _copy_database(tmp_path, target_path)
+        db.engine.dispose()
+    finally:
+        os.remove(tmp_path)
+    
+    # Die Datenbank passt nicht mehr zur laufenden Kette - das nächste Delta beginnt mit einem Snapshot
+    _reset_chain()
+    
+    # Alle Caches (Dashboard, Exporte, Inventar-Lookup) verwerfen
+    bump_version(*db.metadata.tables.keys())
+    return safety
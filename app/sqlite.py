@@ -0,0 +1,94 @@
+"""SQLite-Profil für den Mehrbenutzerbetrieb (mehrere gunicorn-Worker)
+
+WAL erlaubt Lesen während geschrieben wird; busy_timeout lässt Schreiber auf
+die Sperre warten statt sofort mit "database is locked" abzubrechen. Für den
+verbleibenden Fall (Sperren-Upgrade innerhalb einer Transaktion) gibt es
+retry_on_busy mit exponentiellem Backoff.
+"""
+import random
+import time
+from functools import wraps
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,       # ms
+    'cache_size': -20000,       # negativ = KiB, also ca. 20 MB
+    'mmap_size': 134217728,     # 128 MB
+    'temp_store': 'MEMORY',
+}
+
+
+def init_app(app, db):
+    """Pragmas bei jeder neuen Verbindung setzen (nur für SQLite-Datenbanken)"""
+    app.config.setdefault('SQLITE_PRAGMAS', dict(DEFAULT_PRAGMAS))
+    app.config.setdefault('SQLITE_RETRY_ATTEMPTS', 5)
+    app.config.setdefault('SQLITE_RETRY_DELAY', 0.05)
+    
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+    
+    pragmas = app.config['SQLITE_PRAGMAS']
+    
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def is_busy_error(error):
+    message = str(getattr(error, 'orig', error)).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def run_with_retry(func, attempts=5, delay=0.05, on_retry=None):
+    """func() erneut ausführen, solange SQLite "database is locked" meldet
+    
+    Wartezeit verdoppelt sich pro Versuch, mit Zufallsanteil, damit
+    gleichzeitig blockierte Worker nicht wieder gleichzeitig starten.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except OperationalError as e:
+            if not is_busy_error(e) or attempt == attempts:
+                raise
+            if on_retry:
+                on_retry(e)
+            time.sleep(delay * (2 ** (attempt - 1)) * (0.5 + random.random()))
+
+
+def retry_on_busy(f):
+    """Decorator für Schreib-Routen: Transaktion bei gesperrter Datenbank wiederholen
+    
+    Die Route muss ihre Änderungen mit genau einem Commit am Ende abschließen,
+    damit eine Wiederholung nach dem Rollback keine halben Änderungen hinterlässt.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        from app.models import db
+        
+        def rollback(error):
+            db.session.rollback()
+            current_app.logger.info('Datenbank gesperrt, Wiederholung: %s', f.__name__)
+        
+        return run_with_retry(
+            lambda: f(*args, **kwargs),
+            attempts=current_app.config['SQLITE_RETRY_ATTEMPTS'],
+            delay=current_app.config['SQLITE_RETRY_DELAY'],
+            on_retry=rollback
+        )
+    return decorated
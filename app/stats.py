@@ -0,0 +1,103 @@
+"""Statistik-Abfragen für Übersichtsseiten"""
+from collections import namedtuple
+from sqlalchemy import func, case, and_, true
+from app.cache import get_snapshot
+from app.models import db, SchoolClass, Student, Keyboard, Loan
+
+
+class ClassStats(namedtuple('ClassStats', 'student_count loan_count paid_count returned_count')):
+    """Zähler einer Klasse (Schüler, aktive/bezahlte/zurückgegebene Ausleihen)"""
+    __slots__ = ()
+
+
+EMPTY_CLASS_STATS = ClassStats(0, 0, 0, 0)
+
+
+def class_stats(school_year_id=None, class_ids=None):
+    """Alle Klassen-Zähler in einer GROUP BY-Abfrage: {class_id: ClassStats}"""
+    active = and_(Loan.id != None, Loan.returned_at == None)
+    query = db.session.query(
+        SchoolClass.id,
+        func.count(func.distinct(Student.id)),
+        func.coalesce(func.sum(case((active, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((and_(active, Loan.fee_paid == True), 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Loan.returned_at != None, 1), else_=0)), 0)
+    ).outerjoin(
+        Student, Student.class_id == SchoolClass.id
+    ).outerjoin(
+        Loan, Loan.student_id == Student.id
+    ).group_by(SchoolClass.id)
+    
+    if school_year_id is not None:
+        query = query.filter(SchoolClass.school_year_id == school_year_id)
+    if class_ids is not None:
+        query = query.filter(SchoolClass.id.in_(class_ids))
+    
+    return {row[0]: ClassStats(*row[1:]) for row in query.all()}
+
+
+def attach_class_stats(classes):
+    """Zähler für mehrere Klassen laden und an die Objekte hängen (eine Abfrage)"""
+    if not classes:
+        return classes
+    stats = class_stats(class_ids=[cls.id for cls in classes])
+    for cls in classes:
+        cls._stats = stats.get(cls.id, EMPTY_CLASS_STATS)
+    return classes
+
+
+# Tabellen, deren Änderung den Dashboard-Snapshot ungültig macht
+DASHBOARD_TABLES = ('keyboards', 'loans', 'students', 'school_classes', 'school_years')
+
+
+def _amount(value):
+    """Betrag ohne überflüssige Nachkommastellen (10.0 -> 10)"""
+    value = round(float(value or 0), 2)
+    return int(value) if value.is_integer() else value
+
+
+def keyboard_loan_stats():
+    """Keyboard- und Ausleihe-Statistik in einer Abfrage mit bedingten Aggregaten"""
+    kb = db.session.query(
+        func.count(Keyboard.id).label('total_keyboards'),
+        func.coalesce(func.sum(case((and_(Keyboard.status == 'im_lager', Keyboard.condition == 'in_ordnung'), 1), else_=0)), 0).label('available'),
+        func.coalesce(func.sum(case((Keyboard.status == 'ausgeliehen', 1), else_=0)), 0).label('loaned'),
+        func.coalesce(func.sum(case((Keyboard.condition.in_(['defekt', 'in_reparatur']), 1), else_=0)), 0).label('defect'),
+        func.coalesce(func.sum(case((Keyboard.status == 'verschollen', 1), else_=0)), 0).label('missing')
+    ).subquery()
+    
+    ln = db.session.query(
+        func.count(Loan.id).label('active_loans'),
+        func.coalesce(func.sum(case((Loan.fee_paid == True, 1), else_=0)), 0).label('paid_loans'),
+        func.coalesce(func.sum(Loan.fee_amount), 0).label('total_fees'),
+        func.coalesce(func.sum(case((Loan.fee_paid == True, Loan.fee_amount), else_=0)), 0).label('collected_fees')
+    ).filter(Loan.returned_at == None).subquery()
+    
+    row = db.session.query(kb, ln).select_from(kb).join(ln, true()).one()
+    stats = dict(row._mapping)
+    stats['unpaid_loans'] = stats['active_loans'] - stats['paid_loans']
+    stats['total_fees'] = _amount(stats['total_fees'])
+    stats['collected_fees'] = _amount(stats['collected_fees'])
+    return stats
+
+
+def dashboard_snapshot(school_year_id=None):
+    """Dashboard-Zahlen aus dem gemeinsamen Cache (neu berechnet nach Schreibzugriffen)"""
+    def build():
+        data = keyboard_loan_stats()
+        data['classes'] = {
+            str(class_id): list(stats)
+            for class_id, stats in (class_stats(school_year_id=school_year_id).items() if school_year_id else [])
+        }
+        return data
+    
+    name = f"dashboard_{school_year_id or 0}"
+    return get_snapshot(name, DASHBOARD_TABLES, build)
+
+
+def apply_class_stats(classes, snapshot_classes):
+    """Zähler aus einem Snapshot an Klassen hängen (ohne weitere Abfrage)"""
+    for cls in classes:
+        stats = snapshot_classes.get(str(cls.id))
+        cls._stats = ClassStats(*stats) if stats else EMPTY_CLASS_STATS
+    return classes
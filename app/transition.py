@@ -0,0 +1,129 @@
+"""Schuljahreswechsel in Mengen
+
+Vorschau und Wechsel zählen Schüler und aktive Ausleihen mit derselben
+GROUP BY-Abfrage (app.stats.class_stats). Der Wechsel legt die neuen Klassen
+mit je einem INSERT an und verschiebt die Schüler mit einem UPDATE pro Klasse,
+alles in einer Transaktion. Vorher wird ein Snapshot als Rücksprungpunkt
+erstellt (Admin → Datenbank-Snapshots).
+"""
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app import snapshots
+from app.models import db, SchoolYear, SchoolClass, Student, AuditLog
+from app.stats import attach_class_stats
+
+# Buchstaben der neuen, leeren 5er-Klassen
+NEW_CLASS_LETTERS = ('A', 'B', 'C', 'D')
+
+
+class TransitionError(Exception):
+    """Wechsel nicht möglich (Meldung ist für die Oberfläche gedacht)"""
+
+
+class TransitionPlan:
+    """5er- und 6er-Klassen eines Schuljahres mit Zählern (eine Aggregat-Abfrage)"""
+    
+    def __init__(self, school_year):
+        classes = SchoolClass.query.filter(
+            SchoolClass.school_year_id == school_year.id,
+            SchoolClass.grade.in_((5, 6))
+        ).order_by(SchoolClass.name).all()
+        attach_class_stats(classes)
+        self.classes_5 = [cls for cls in classes if cls.grade == 5]
+        self.classes_6 = [cls for cls in classes if cls.grade == 6]
+        self.students_5 = sum(cls.student_count for cls in self.classes_5)
+        self.active_loans_5 = sum(cls.loan_count for cls in self.classes_5)
+        self.active_loans_6 = sum(cls.loan_count for cls in self.classes_6)
+    
+    def new_name(self, cls5):
+        """Name der 6er-Klasse im neuen Jahr (5A -> 6A)"""
+        return f"6{cls5.name[-1]}"
+
+
+def run_transition(year_id, name, start_date, end_date, user_id=None, ip_address=None, progress=None):
+    """Schuljahreswechsel durchführen; liefert die Zusammenfassung (Commit beim Aufrufer)
+    
+    progress(Prozent, Meldung) wird zwischen den Schritten aufgerufen (z.B. Job.progress).
+    """
+    progress = progress or (lambda percent, message=None: None)
+    current_year = SchoolYear.query.get(year_id)
+    if not current_year or not current_year.is_active:
+        raise TransitionError('Das Schuljahr ist nicht mehr aktiv - der Wechsel wurde schon durchgeführt.')
+    if SchoolYear.query.filter_by(name=name).first():
+        raise TransitionError(f'Schuljahr {name} gibt es bereits.')
+    
+    progress(5, 'Snapshot als Rücksprungpunkt')
+    try:
+        snapshot = snapshots.create_snapshot()
+    except snapshots.SnapshotError as e:
+        raise TransitionError(f'Kein Rücksprungpunkt möglich: {e}')
+    
+    progress(30, 'Klassen werden angelegt')
+    new_year = SchoolYear(name=name, start_date=start_date, end_date=end_date, is_active=False)
+    db.session.add(new_year)
+    # Erster Schreibzugriff: ab hier hält die Transaktion die Schreibsperre,
+    # die Zähler unten passen also genau zu dem, was verschoben wird
+    try:
+        db.session.flush()
+    except IntegrityError:
+        raise TransitionError(f'Schuljahr {name} gibt es bereits.')
+    
+    # Die Prüfungen oben liefen ohne Sperre: ein gleichzeitiger Wechsel kann inzwischen
+    # festgeschrieben sein, daher unter der Sperre noch einmal gegen die Datenbank prüfen
+    active_ids = db.session.execute(
+        select(SchoolYear.id).where(SchoolYear.is_active == True)
+    ).scalars().all()
+    if active_ids != [year_id]:
+        raise TransitionError('Das Schuljahr ist nicht mehr aktiv - der Wechsel wurde schon durchgeführt.')
+    if db.session.execute(
+        select(SchoolYear.id).where(SchoolYear.name == name, SchoolYear.id != new_year.id)
+    ).first():
+        raise TransitionError(f'Schuljahr {name} gibt es bereits.')
+    
+    plan = TransitionPlan(current_year)
+    
+    # Für jede 5er-Klasse eine 6er-Klasse im neuen Jahr (ein INSERT, IDs in Reihenfolge)
+    moves = []
+    if plan.classes_5:
+        new_ids = db.session.execute(
+            insert(SchoolClass).returning(SchoolClass.id, sort_by_parameter_order=True),
+            [{
+                'name': plan.new_name(cls5),
+                'grade': 6,
+                'school_year_id': new_year.id,
+                'class_teacher': cls5.class_teacher,
+                'music_teacher': cls5.music_teacher
+            } for cls5 in plan.classes_5]
+        ).scalars().all()
+        moves = list(zip(plan.classes_5, new_ids))
+    
+    # Schüler verschieben: ein UPDATE pro Klasse
+    students_moved = 0
+    for i, (cls5, new_id) in enumerate(moves, start=1):
+        students_moved += db.session.execute(
+            update(Student).where(Student.class_id == cls5.id).values(class_id=new_id),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        progress(30 + 60 * i // len(moves), f'Klasse {cls5.name} → {plan.new_name(cls5)}')
+    
+    # Neue leere 5er-Klassen
+    db.session.execute(insert(SchoolClass), [
+        {'name': f"5{letter}", 'grade': 5, 'school_year_id': new_year.id} for letter in NEW_CLASS_LETTERS
+    ])
+    
+    # Altes Schuljahr deaktivieren, neues aktivieren
+    current_year.is_active = False
+    new_year.is_active = True
+    
+    summary = (f"{students_moved} Schüler in 6er-Klassen übernommen, "
+               f"{plan.active_loans_5} aktive Ausleihen übertragen.")
+    db.session.add(AuditLog(
+        user_id=user_id,
+        action='school_year_transition',
+        entity_type='school_year',
+        entity_id=new_year.id,
+        details=f"Schuljahreswechsel: {current_year.name} → {new_year.name}. {summary} "
+                f"Rücksprungpunkt: {snapshot}",
+        ip_address=ip_address
+    ))
+    return f"Schuljahreswechsel {current_year.name} → {new_year.name}: {summary} Rücksprungpunkt: Snapshot {snapshot}"
@@ -0,0 +1,163 @@
+"""Excel-Dateien im write-only-Modus von openpyxl schreiben (und read-only lesen)
+
+Zeilen werden direkt in die (temporäre) Arbeitsblatt-Datei geschrieben statt
+als Zellobjekte im Speicher zu liegen. Formate sind benannte Stile, die nur
+einmal in der Datei stehen. Spaltenbreiten stehen im XML vor der ersten Zeile:
+sie werden beim Anhängen über alle Zeilen mitgezählt, die Zeilen selbst liegen
+bis zum Abschluss des Blatts in einer temporären Datei (nicht im Speicher).
+
+XlsxReader liest im read-only-Modus: Zeilen kommen direkt aus dem XML der
+Blätter, ohne dass die ganze Arbeitsmappe als Zellobjekte geladen wird.
+"""
+import pickle
+import tempfile
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+
+MAX_COLUMN_WIDTH = 50
+
+# Ab dieser Größe landet die fertige Datei auf der Platte statt im Speicher
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+
+
+def _named_styles():
+    def fill(color):
+        return PatternFill(start_color=color, end_color=color, fill_type="solid")
+    
+    return [
+        NamedStyle('header', font=Font(bold=True, color="FFFFFF"), fill=fill("2563EB"),
+                   alignment=Alignment(horizontal="center", vertical="center")),
+        NamedStyle('title', font=Font(bold=True, size=14)),
+        NamedStyle('title_large', font=Font(bold=True, size=16)),
+        NamedStyle('bold', font=Font(bold=True)),
+        NamedStyle('paid', fill=fill("C8E6C9")),
+        NamedStyle('open', fill=fill("FFCDD2")),
+    ]
+
+
+class XlsxWriter:
+    """Arbeitsmappe, deren Blätter nacheinander geschrieben werden"""
+    
+    def __init__(self):
+        self.workbook = Workbook(write_only=True)
+        for style in _named_styles():
+            self.workbook.add_named_style(style)
+        self._current = None
+    
+    def sheet(self, title):
+        """Neues Blatt beginnen (das vorherige wird abgeschlossen)"""
+        if self._current:
+            self._current.close()
+        self._current = SheetWriter(self.workbook.create_sheet(title))
+        return self._current
+    
+    def save(self):
+        """Datei erzeugen; liefert einen an den Anfang gespulten Datei-Handle"""
+        if self._current:
+            self._current.close()
+            self._current = None
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        self.workbook.save(output)
+        output.seek(0)
+        return output
+
+
+class SheetWriter:
+    """Ein Blatt: Zeilen anhängen, Breiten werden dabei mitgezählt"""
+    
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.widths = []
+        # Zeilen bis close() zwischenlagern, erst dann stehen die Breiten fest
+        self._spool = tempfile.TemporaryFile()
+    
+    def _track(self, values):
+        for i, value in enumerate(values):
+            length = len(str(value)) if value is not None else 0
+            if i == len(self.widths):
+                self.widths.append(length)
+            elif length > self.widths[i]:
+                self.widths[i] = length
+    
+    def _write(self, values, style):
+        if style is None:
+            self.worksheet.append(values)
+            return
+        styles = style if isinstance(style, (list, tuple)) else [style] * len(values)
+        cells = []
+        for value, cell_style in zip(values, styles):
+            cell = WriteOnlyCell(self.worksheet, value=value)
+            if cell_style:
+                cell.style = cell_style
+            cells.append(cell)
+        self.worksheet.append(cells)
+    
+    def append(self, values, style=None):
+        """Zeile anhängen; style: Name eines Stils aus _named_styles() oder Liste je Spalte"""
+        values = list(values)
+        self._track(values)
+        pickle.dump((values, style), self._spool, pickle.HIGHEST_PROTOCOL)
+    
+    def title(self, text, style='title'):
+        self.append([text], style)
+    
+    def blank(self):
+        self.append([])
+    
+    def header(self, columns):
+        self.append(columns, 'header')
+    
+    def close(self):
+        """Breiten setzen und die zwischengelagerten Zeilen in das Blatt schreiben"""
+        if self._spool is None:
+            return
+        for i, width in enumerate(self.widths, start=1):
+            self.worksheet.column_dimensions[get_column_letter(i)].width = min(width + 2, MAX_COLUMN_WIDTH)
+        spool, self._spool = self._spool, None
+        with spool:
+            spool.seek(0)
+            while True:
+                try:
+                    values, style = pickle.load(spool)
+                except EOFError:
+                    break
+                self._write(values, style)
+
+
+def cell_text(value):
+    """Zellwert als Text ('' für leere Zellen, 12.0 wird zu 12)"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+class XlsxReader:
+    """Arbeitsmappe im read-only-Modus; Zeilen werden beim Iterieren aus der Datei gelesen"""
+    
+    def __init__(self, fileobj):
+        try:
+            self.workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        except Exception as e:
+            raise ValueError(f'Keine gültige Excel-Datei (.xlsx): {e}')
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        # Im read-only-Modus bleibt die Datei sonst offen
+        self.workbook.close()
+    
+    @property
+    def sheetnames(self):
+        return self.workbook.sheetnames
+    
+    def rows(self, name):
+        """(Zeilennummer, Zellen als Text) eines Blatts; leere Zeilen werden übersprungen"""
+        for number, values in enumerate(self.workbook[name].iter_rows(values_only=True), start=1):
+            texts = [cell_text(value) for value in values]
+            if any(texts):
+                yield number, texts
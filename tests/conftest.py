@@ -0,0 +1,22 @@
+"""Gemeinsame Fixtures: App mit In-Memory-Datenbank und angemeldetem Administrator"""
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite://')
+    for name in ('CACHE_FOLDER', 'EXPORT_FOLDER', 'SNAPSHOT_FOLDER'):
+        monkeypatch.setenv(name, str(tmp_path / name.lower()))
+    monkeypatch.setenv('ARCHIVE_DATABASE', str(tmp_path / 'archive.sqlite3'))
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    assert client.post('/login', data={'username': 'admin', 'password': 'admin123'}).status_code == 302
+    return client
@@ -0,0 +1,31 @@
+"""Backup: jeder Schüler genau einmal, auch bei doppelten aktiven Ausleihen aus Altdaten"""
+from datetime import date
+
+from app.export import load_backup_data
+from app.models import db, SchoolYear, SchoolClass, Student, Keyboard, Loan
+
+
+def test_duplicate_active_loans_list_student_once(app):
+    with app.app_context():
+        # Altdaten stammen aus der Zeit vor dem Unique-Index
+        db.session.execute(db.text('DROP INDEX uq_loans_active_student'))
+        year = SchoolYear(name='2025/26', start_date=date(2025, 8, 1), end_date=date(2026, 7, 31), is_active=True)
+        db.session.add(year)
+        db.session.flush()
+        cls = SchoolClass(name='6A', grade=6, school_year_id=year.id)
+        db.session.add(cls)
+        db.session.flush()
+        twice = Student(last_name='Doppelt', first_name='Test', class_id=cls.id, participates_in_loan=True)
+        none = Student(last_name='Ohne', first_name='Test', class_id=cls.id, participates_in_loan=True)
+        first = Keyboard(inventory_number='KB001', internal_number=1, status='ausgeliehen')
+        second = Keyboard(inventory_number='KB002', internal_number=2, status='ausgeliehen')
+        db.session.add_all([twice, none, first, second])
+        db.session.flush()
+        db.session.add(Loan(student_id=twice.id, keyboard_id=first.id))
+        db.session.flush()
+        db.session.add(Loan(student_id=twice.id, keyboard_id=second.id))
+        db.session.commit()
+        
+        data = load_backup_data(year)
+        students = data.students_by_class[cls.id]
+        assert [(s.last_name, s.inventory_number) for s in students] == [('Doppelt', 'KB001'), ('Ohne', None)]
@@ -0,0 +1,53 @@
+"""Rückgabetag: ungültige Einträge blockieren die gültigen Rückgaben nicht (return_loans)"""
+from datetime import date
+
+from app.models import db, SchoolYear, SchoolClass, Student, Keyboard, Loan
+
+
+def _seed_loans(count):
+    year = SchoolYear(name='2025/26', start_date=date(2025, 8, 1), end_date=date(2026, 7, 31), is_active=True)
+    db.session.add(year)
+    db.session.flush()
+    cls = SchoolClass(name='6A', grade=6, school_year_id=year.id)
+    db.session.add(cls)
+    db.session.flush()
+    loans = []
+    for i in range(count):
+        student = Student(last_name=f'Schüler{i:02d}', first_name='Test', class_id=cls.id, participates_in_loan=True)
+        keyboard = Keyboard(inventory_number=f'KB{i:03d}', internal_number=i, status='ausgeliehen')
+        db.session.add_all([student, keyboard])
+        db.session.flush()
+        loans.append(Loan(student_id=student.id, keyboard_id=keyboard.id))
+    db.session.add_all(loans)
+    db.session.commit()
+    return [loan.id for loan in loans]
+
+
+def test_bulk_return_reports_malformed_items(app, client):
+    with app.app_context():
+        loan_ids = _seed_loans(2)
+    
+    response = client.post('/loans/api/bulk-return', json={'items': [
+        {'loan_id': loan_ids[0]},
+        {'loan_id': 'abc'},
+        'KB001',
+        {'inventory_number': 'KB001', 'condition': 'kaputt?'},
+        {'inventory_number': 'KB001', 'condition': 'defekt'},
+        {'inventory_number': 'KB999'},
+    ]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert sorted(r['loan_id'] for r in data['returned']) == loan_ids
+    assert data['not_found'] == ['KB999']
+    assert [entry['item'] for entry in data['invalid']] == [
+        {'loan_id': 'abc'}, 'KB001', {'inventory_number': 'KB001', 'condition': 'kaputt?'}]
+    assert all(entry['error'] for entry in data['invalid'])
+    
+    with app.app_context():
+        assert Loan.query.filter(Loan.returned_at == None).count() == 0
+        assert db.session.get(Loan, loan_ids[1]).keyboard.condition == 'defekt'
+
+
+def test_bulk_return_rejects_non_list_body(client):
+    for body in ({'items': {'loan_id': 1}}, [{'loan_id': 1}], {'items': []}):
+        assert client.post('/loans/api/bulk-return', json=body).status_code == 400
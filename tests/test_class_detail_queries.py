@@ -0,0 +1,62 @@
+"""Klassendetails: Anzahl Abfragen unabhängig von der Klassengröße (load_class_roster)"""
+from datetime import date, datetime
+
+from sqlalchemy import event
+
+from app.models import db, SchoolYear, SchoolClass, Student, Keyboard, Loan
+
+
+def _seed_class(name, size, keyboards):
+    """Klasse mit size Schülern; jeder zweite hat eine aktive, jeder dritte eine zurückgegebene Ausleihe"""
+    year = SchoolYear.query.filter_by(is_active=True).first()
+    if not year:
+        year = SchoolYear(name='2025/26', start_date=date(2025, 8, 1), end_date=date(2026, 7, 31), is_active=True)
+        db.session.add(year)
+        db.session.flush()
+    
+    cls = SchoolClass(name=name, grade=5, school_year_id=year.id)
+    db.session.add(cls)
+    db.session.flush()
+    for i in range(size):
+        student = Student(last_name=f'Schüler{i:03d}', first_name='Test', class_id=cls.id, participates_in_loan=True)
+        db.session.add(student)
+        db.session.flush()
+        if i % 3 == 0:
+            db.session.add(Loan(student_id=student.id, keyboard_id=next(keyboards).id,
+                                returned_at=datetime(2025, 9, 1), return_condition='in_ordnung'))
+        if i % 2 == 0:
+            keyboard = next(keyboards)
+            keyboard.status = 'ausgeliehen'
+            db.session.add(Loan(student_id=student.id, keyboard_id=keyboard.id))
+    return cls.id
+
+
+def _count_queries(app, client, url):
+    count = 0
+    
+    def before_cursor_execute(*args):
+        nonlocal count
+        count += 1
+    
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return count
+
+
+def test_class_detail_query_count_is_constant(app, client):
+    with app.app_context():
+        keyboards = [Keyboard(inventory_number=f'KB{i:03d}', internal_number=i) for i in range(1, 121)]
+        db.session.add_all(keyboards)
+        db.session.flush()
+        keyboards = iter(keyboards)
+        small = _seed_class('5A', 5, keyboards)
+        large = _seed_class('5B', 50, keyboards)
+        db.session.commit()
+    
+    assert _count_queries(app, client, f'/classes/{small}') == _count_queries(app, client, f'/classes/{large}')
@@ -0,0 +1,152 @@
+"""Häufige Abfragen dürfen keine Tabelle ohne Index vollständig lesen (EXPLAIN QUERY PLAN)"""
+import re
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event
+
+from app.models import db, SchoolYear, SchoolClass, Student, Keyboard, Loan
+
+# Kleine Stammdaten-Tabellen, bei denen ein vollständiger Scan unkritisch ist
+SMALL_TABLES = {'users', 'school_years'}
+
+SCAN_PATTERN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+# Keine Abfragen: kein Plan
+SKIPPED_PREFIXES = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+@pytest.fixture
+def seeded(app):
+    """Aktives Schuljahr mit je einer 5er- und 6er-Klasse, Keyboards und Ausleihen"""
+    with app.app_context():
+        year = SchoolYear(name='2025/26', start_date=date(2025, 8, 1), end_date=date(2026, 7, 31), is_active=True)
+        db.session.add(year)
+        db.session.flush()
+        keyboards = [Keyboard(inventory_number=f'KB{i:03d}', internal_number=i) for i in range(1, 81)]
+        db.session.add_all(keyboards)
+        db.session.flush()
+        keyboards = iter(keyboards)
+        
+        ids = {}
+        for grade in (5, 6):
+            cls = SchoolClass(name=f'{grade}A', grade=grade, school_year_id=year.id)
+            db.session.add(cls)
+            db.session.flush()
+            ids[grade] = cls.id
+            for i in range(20):
+                student = Student(last_name=f'Schüler{i:02d}', first_name='Test', class_id=cls.id,
+                                  participates_in_loan=True)
+                db.session.add(student)
+                db.session.flush()
+                if grade == 6 and i % 4 == 0:
+                    db.session.add(Loan(student_id=student.id, keyboard_id=next(keyboards).id,
+                                        returned_at=datetime(2025, 9, 1), return_condition='in_ordnung'))
+                if grade == 6 or i < 5:
+                    keyboard = next(keyboards)
+                    keyboard.status = 'ausgeliehen'
+                    db.session.add(Loan(student_id=student.id, keyboard_id=keyboard.id))
+        db.session.commit()
+        return ids
+
+
+def _table_scans(conn, statement, parameters):
+    """Tabellen, die laut EXPLAIN QUERY PLAN ohne Index vollständig gelesen werden"""
+    plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    scans = []
+    for row in plan:
+        match = SCAN_PATTERN.match(row[-1])
+        # Nur echte Tabellen; Unterabfragen (anon_1, ...) sind bereits aggregiert
+        if match and match.group(1) in db.metadata.tables and match.group(1) not in SMALL_TABLES:
+            scans.append(row[-1])
+    return scans
+
+
+def _check(app, request):
+    """request() ausführen; liefert alle Tabellen-Scans der dabei gelaufenen Statements"""
+    statements = []
+    
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(SKIPPED_PREFIXES):
+            return
+        # executemany: der Plan hängt nicht von den Werten ab, die erste Zeile genügt
+        statements.append((statement, parameters[0] if executemany else parameters))
+    
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        response = request()
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+    assert response.status_code < 400, response.status_code
+    
+    scans = []
+    with app.app_context(), db.engine.connect() as conn:
+        for statement, parameters in statements:
+            scans += [f"{scan}: {' '.join(statement.split())}" for scan in _table_scans(conn, statement, parameters)]
+    return scans
+
+
+def _loan_id(app, **filters):
+    with app.app_context():
+        query = Loan.query.join(Student).join(SchoolClass).filter_by(**filters)
+        return query.filter(Loan.returned_at == None).order_by(Loan.id).first().id
+
+
+def test_read_pages_use_indexes(app, client, seeded):
+    loan_id = _loan_id(app, grade=6)
+    urls = [
+        '/', '/classes/', '/keyboards/', '/keyboards/?status=im_lager&condition=in_ordnung',
+        '/keyboards/?sort=inventory_number&order=desc', '/loans/', '/loans/?status=returned',
+        '/loans/?status=all', '/students/', '/loans/new', '/admin/', '/admin/audit-log',
+        '/admin/school-year-transition', '/keyboards/api/available', f'/loans/{loan_id}/return'
+    ]
+    for class_id in seeded.values():
+        urls += [f'/classes/{class_id}', f'/loans/?class_id={class_id}', f'/students/?class_id={class_id}',
+                 f'/students/api/without-loan?class_id={class_id}']
+    
+    failures = []
+    for url in urls:
+        failures += [f"{url}: {scan}" for scan in _check(app, lambda: client.get(url))]
+    assert failures == []
+
+
+def test_write_paths_use_indexes(app, client, seeded):
+    with app.app_context():
+        students = [s.id for s in Student.query.filter_by(class_id=seeded[5]).order_by(Student.id)[5:7]]
+        keyboards = [k.id for k in Keyboard.query.filter_by(status='im_lager').order_by(Keyboard.id)[:2]]
+    failures = []
+    
+    def check(name, request):
+        failures.extend(f"{name}: {scan}" for scan in _check(app, request))
+    
+    # Ausleihen: Formular und Schnell-Ausleihe aus der Klassenansicht
+    check('loan create', lambda: client.post('/loans/new', data={
+        'student_id': students[0], 'keyboard_id': keyboards[0]}))
+    check('quick loan', lambda: client.post('/loans/quick-loan', json={
+        'student_id': students[1], 'keyboard_id': keyboards[1]}))
+    
+    # Rückgaben: einzeln, schnell und als Stapel
+    returned = _loan_id(app, grade=6)
+    check('return', lambda: client.post(f'/loans/{returned}/return', data={'return_condition': 'in_ordnung'}))
+    quick = _loan_id(app, grade=6)
+    check('quick return', lambda: client.post('/loans/quick-return', json={'loan_id': quick}))
+    with app.app_context():
+        batch = Loan.query.join(Student).filter(Student.class_id == seeded[6], Loan.returned_at == None)
+        batch = batch.order_by(Loan.id).limit(3).all()
+        items = [{'loan_id': batch[0].id}, {'inventory_number': batch[1].keyboard.inventory_number}]
+    check('bulk return', lambda: client.post('/loans/api/bulk-return', json={'items': items}))
+    
+    # Rückgabe stornieren
+    check('undo return', lambda: client.post(f'/loans/{returned}/undo-return'))
+    check('api undo return', lambda: client.post('/loans/api/undo-return', json={'loan_id': quick}))
+    
+    # Automatisch zuweisen: Vorschau und Bestätigung
+    response = client.post('/loans/auto-assign', json={'class_id': seeded[5]})
+    assignments = response.get_json()['assignments']
+    assert assignments
+    check('auto assign', lambda: client.post('/loans/auto-assign', json={
+        'class_id': seeded[5], 'confirm': True, 'assignments': assignments}))
+    
+    assert failures == []
@@ -0,0 +1,24 @@
+"""SheetWriter: Spaltenbreiten aus allen Zeilen, nicht nur aus den ersten"""
+from openpyxl import load_workbook
+
+from app.xlsx import XlsxWriter, MAX_COLUMN_WIDTH
+
+
+def test_widths_cover_late_rows():
+    writer = XlsxWriter()
+    sheet = writer.sheet('Liste')
+    sheet.header(['Nr', 'Name'])
+    for i in range(1000):
+        sheet.append([i, 'kurz'])
+    sheet.append([1000, 'ein deutlich längerer Name ganz am Ende'])
+    sheet.append([1001, 'x' * 200])
+    output = writer.save()
+    
+    worksheet = load_workbook(output)['Liste']
+    assert worksheet.column_dimensions['A'].width == len('1000') + 2
+    assert worksheet.column_dimensions['B'].width == MAX_COLUMN_WIDTH
+    rows = list(worksheet.iter_rows(values_only=True))
+    assert len(rows) == 1003
+    assert rows[0] == ('Nr', 'Name')
+    assert rows[-2] == (1000, 'ein deutlich längerer Name ganz am Ende')
+    assert worksheet['A1'].style == 'header'